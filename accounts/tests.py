@@ -1,12 +1,14 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import mail
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 User = get_user_model()
 
 
+# Выборка Server-Timing случайна — в тестах выключена, чтобы прогоны совпадали
+@override_settings(SERVER_TIMING_SAMPLE_RATE=0)
 class AuthAndSignupFlowTests(TestCase):
 
     def setUp(self):
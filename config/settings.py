@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: total в Server-Timing включает сессии/авторизацию остальных middleware
+    "finance.timing.server_timing_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -65,7 +67,8 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates + замер времени рендера для Server-Timing
+        "BACKEND": "finance.timing.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -94,6 +97,34 @@ DATABASES = {
 DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
 
 
+# Cache
+# В проде — Redis (общий для gunicorn и Celery), локально — память процесса
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Сколько живут закэшированные фрагменты дашборда (сек). Инвалидация — по версии данных.
+DASHBOARD_CACHE_TIMEOUT = env.int("DASHBOARD_CACHE_TIMEOUT", default=300)
+# Сколько async-дашборд ждет балансы FastAPI (сек), прежде чем отдать страницу с заглушкой
+DASHBOARD_BALANCE_DEADLINE = env.float("DASHBOARD_BALANCE_DEADLINE", default=0.8)
+
+# Общий кэш балансов FastAPI (сек): свежие отдаем как есть, после TTL — отдаем
+# и обновляем в фоне, после STALE_TTL запись пропадает совсем
+TRANSFER_BALANCE_TTL = env.float("TRANSFER_BALANCE_TTL", default=5)
+TRANSFER_BALANCE_STALE_TTL = env.int("TRANSFER_BALANCE_STALE_TTL", default=60)
+TRANSFER_BALANCE_LOCK_TIMEOUT = env.int("TRANSFER_BALANCE_LOCK_TIMEOUT", default=3)
+
+# Сколько последних обменников агента подсказывать в форме продажи
+TRANSFER_DEFAULTS_PARTNERS = env.int("TRANSFER_DEFAULTS_PARTNERS", default=10)
+
+# SSE-канал аккордеона (сек): как часто сверять версию баланса, раз в сколько слать
+# ping и через сколько закрывать поток (браузер переподключится через RETRY_MS)
+TRANSFER_STREAM_INTERVAL = env.float("TRANSFER_STREAM_INTERVAL", default=1.0)
+TRANSFER_STREAM_PING = env.int("TRANSFER_STREAM_PING", default=15)
+TRANSFER_STREAM_MAX_AGE = env.int("TRANSFER_STREAM_MAX_AGE", default=300)
+TRANSFER_STREAM_RETRY_MS = env.int("TRANSFER_STREAM_RETRY_MS", default=3000)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -220,11 +251,17 @@ IGNORABLE_404_URLS = [
 
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
 
+# Outbox-диспетчер (run_outbox_dispatcher) просыпается по NOTIFY на вставку события;
+# без уведомлений перепроверяет очередь раз в столько сек (и beat — тоже)
+OUTBOX_SWEEP_INTERVAL = env.float("OUTBOX_SWEEP_INTERVAL", default=60.0)
+
 # Расписание периодических задач
 CELERY_BEAT_SCHEDULE = {
-    "check-outbox-every-5-seconds": {
+    # Страховка: события доставляет run_outbox_dispatcher (LISTEN/NOTIFY),
+    # а этот редкий проход подбирает то, что он пропустил
+    "sweep-outbox": {
         "task": "finance.tasks.process_outbox_events",
-        "schedule": 5.0,  # Выполнять каждые 5 секунд
+        "schedule": OUTBOX_SWEEP_INTERVAL,
     },
     # Новый таск очистки (каждую ночь в 3:00)
     "cleanup-old-outbox-events-daily": {
@@ -232,6 +269,48 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(hour=3, minute=0),
         "kwargs": {"days_to_keep": 30},
     },
+    # Зарплаты и бонусы за прошлый месяц (1-го числа в 4:00)
+    "build-monthly-payroll": {
+        "task": "finance.tasks.build_monthly_payroll",
+        "schedule": crontab(day_of_month=1, hour=4, minute=0),
+    },
 }
 
-FASTAPI_BASE_URL = env('FASTAPI_BASE_URL')
\ No newline at end of file
+FASTAPI_BASE_URL = env('FASTAPI_BASE_URL')
+
+# Клиент FastAPI (finance/transfer_client.py): размер пула keep-alive соединений
+# на процесс и таймауты (сек)
+TRANSFER_POOL_SIZE = env.int("TRANSFER_POOL_SIZE", default=10)
+TRANSFER_CONNECT_TIMEOUT = env.float("TRANSFER_CONNECT_TIMEOUT", default=1.0)
+TRANSFER_READ_TIMEOUT = env.float("TRANSFER_READ_TIMEOUT", default=5.0)
+TRANSFER_BALANCE_TIMEOUT = env.float("TRANSFER_BALANCE_TIMEOUT", default=2.0)
+TRANSFER_WEBHOOK_TIMEOUT = env.float("TRANSFER_WEBHOOK_TIMEOUT", default=3.0)
+
+# Outbox: пачка событий на один POST в /api/transfer/webhook/bulk/.
+# Включаем, когда bulk-ручка выкачена в FastAPI; до тех пор — по запросу на событие
+OUTBOX_BULK_WEBHOOK = env.bool("OUTBOX_BULK_WEBHOOK", default=False)
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=500)
+# Сколько сек событие числится за воркером; не отчитался — его заберет другой
+OUTBOX_LEASE_SECONDS = env.int("OUTBOX_LEASE_SECONDS", default=60)
+# Повторы: пауза BASE_DELAY * 2^(n-1) сек (не больше MAX_DELAY), после MAX_ATTEMPTS — FAILED
+OUTBOX_RETRY_BASE_DELAY = env.float("OUTBOX_RETRY_BASE_DELAY", default=5)
+OUTBOX_RETRY_MAX_DELAY = env.float("OUTBOX_RETRY_MAX_DELAY", default=3600)
+OUTBOX_MAX_ATTEMPTS = env.int("OUTBOX_MAX_ATTEMPTS", default=12)
+# Ночная чистка SENT: окна по id не больше CHUNK_SIZE строк, не дольше TIME_BUDGET сек за запуск
+OUTBOX_CLEANUP_CHUNK_SIZE = env.int("OUTBOX_CLEANUP_CHUNK_SIZE", default=5000)
+OUTBOX_CLEANUP_TIME_BUDGET = env.float("OUTBOX_CLEANUP_TIME_BUDGET", default=120)
+
+# /metrics (Prometheus) и /transfer-status/: Bearer-токен мониторинга; пусто — эндпоинты выключены.
+# Гауги очереди берутся из БД не чаще раза в METRICS_GAUGE_TTL сек
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+METRICS_GAUGE_TTL = env.int("METRICS_GAUGE_TTL", default=15)
+
+# Доля запросов с разбивкой времени (SQL / FastAPI / шаблоны) в заголовке
+# Server-Timing и строке лога finance.timing. 0 — выключено, 1 — каждый запрос
+SERVER_TIMING_SAMPLE_RATE = env.float("SERVER_TIMING_SAMPLE_RATE", default=0.05)
+
+# Предохранитель FastAPI: после N ошибок за WINDOW сек отказываем сразу,
+# через RESET_TIMEOUT сек пускаем одну пробу
+TRANSFER_CIRCUIT_FAILURE_THRESHOLD = env.int("TRANSFER_CIRCUIT_FAILURE_THRESHOLD", default=5)
+TRANSFER_CIRCUIT_WINDOW = env.int("TRANSFER_CIRCUIT_WINDOW", default=30)
+TRANSFER_CIRCUIT_RESET_TIMEOUT = env.int("TRANSFER_CIRCUIT_RESET_TIMEOUT", default=15)
\ No newline at end of file
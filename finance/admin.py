@@ -1,5 +1,16 @@
 from django.contrib import admin
-from .models import Sale, Comment, Presentation
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from .models import (
+    Sale,
+    Comment,
+    Presentation,
+    BonusTierTable,
+    BonusTier,
+    PayrollRun,
+    OutboxEvent,
+)
 
 # 1. Создаем встроенное отображение для комментариев
 class CommentInline(admin.TabularInline): # или admin.StackedInline, если хочешь блоки покрупнее
@@ -30,4 +41,54 @@ class CommentAdmin(admin.ModelAdmin):
 class PresentationAdmin(admin.ModelAdmin):
     list_display = ["id", "presenter", "group_sales_total", "group_identifier", "created_at"]
     list_filter = ["group_identifier", "created_at"]
-    list_display_links = ["id", "group_sales_total", "group_identifier"]
\ No newline at end of file
+    list_display_links = ["id", "group_sales_total", "group_identifier"]
+
+# Шкалы бонусов: после сохранения кэш шкал сбрасывается сигналом (finance/signals.py)
+class BonusTierInline(admin.TabularInline):
+    model = BonusTier
+    extra = 1
+
+
+@admin.register(BonusTierTable)
+class BonusTierTableAdmin(admin.ModelAdmin):
+    list_display = ["id", "kind", "version", "effective_from", "created_at"]
+    list_filter = ["kind"]
+    inlines = [BonusTierInline]
+
+
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ["id", "month", "status", "user_count", "csv_download", "created_at", "finished_at"]
+    list_filter = ["status", "month"]
+    # Прямая ссылка на /media/ не работает (nginx его не раздает) — качаем через вьюху
+    exclude = ["csv_file"]
+    readonly_fields = ["csv_download"]
+
+    @admin.display(description="CSV")
+    def csv_download(self, obj):
+        if not obj.csv_file:
+            return "—"
+        return format_html('<a href="{}">Скачать</a>', reverse("payroll_csv", args=[obj.pk]))
+
+
+# Outbox: тут видно, что застряло и почему (last_error); FAILED можно вернуть в очередь
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ["id", "status", "attempts", "next_attempt_at", "last_error", "created_at"]
+    list_filter = ["status"]
+    readonly_fields = ["claimed_by", "lease_expires_at", "created_at", "updated_at"]
+    actions = ["requeue"]
+
+    @admin.action(description="Отправить заново (сбросить попытки)")
+    def requeue(self, request, queryset):
+        # IN_FLIGHT не трогаем: его прямо сейчас отправляет воркер
+        updated = queryset.filter(
+            status__in=[OutboxEvent.StatusChoices.PENDING, OutboxEvent.StatusChoices.FAILED]
+        ).update(
+            status=OutboxEvent.StatusChoices.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            claimed_by="",
+            lease_expires_at=None,
+        )
+        self.message_user(request, f"Вернули в очередь: {updated}")
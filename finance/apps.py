@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class FinanceConfig(AppConfig):
     name = 'finance'
+
+    def ready(self):
+        # Подключаем обработчики сигналов (агрегаты, инвалидация кэшей)
+        from . import signals  # noqa: F401
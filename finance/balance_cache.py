@@ -0,0 +1,101 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Балансы агента из FastAPI в общем кэше (Redis): дашборд, аккордеон и все вкладки
+# читают одну запись, а в FastAPI ходит только тот, кто взял лок.
+BALANCE_KEY = "transfer:balance:{agent_id}"
+LOCK_KEY = "transfer:balance:lock:{agent_id}"
+# Счетчик сбросов: ответ, запрошенный до evict, не должен лечь в кэш после него.
+# Он же — версия баланса для SSE-канала (finance/streams.py)
+EVICTIONS_KEY = "transfer:balance:evictions:{agent_id}"
+
+# Как часто ждущие запросы заглядывают в кэш, пока чужой запрос тянет баланс
+WAIT_STEP = 0.05
+
+
+def _acquire(agent_id) -> bool:
+    # cache.add атомарен и в Redis, и в locmem: лок получает ровно один запрос
+    return cache.add(
+        LOCK_KEY.format(agent_id=agent_id),
+        1,
+        timeout=settings.TRANSFER_BALANCE_LOCK_TIMEOUT,
+    )
+
+
+def _release(agent_id):
+    cache.delete(LOCK_KEY.format(agent_id=agent_id))
+
+
+def _refresh(agent_id, loader):
+    """Тянет баланс (лок уже взят) и кладет его в кэш. Ошибку не кэшируем."""
+    evictions_key = EVICTIONS_KEY.format(agent_id=agent_id)
+    evictions = cache.get(evictions_key, 0)
+    try:
+        data = loader(agent_id)
+        if data is not None and cache.get(evictions_key, 0) == evictions:
+            cache.set(
+                BALANCE_KEY.format(agent_id=agent_id),
+                {"data": data, "fetched_at": time.time()},
+                timeout=settings.TRANSFER_BALANCE_STALE_TTL,
+            )
+        return data
+    finally:
+        _release(agent_id)
+
+
+def _wait_for_entry(agent_id):
+    key = BALANCE_KEY.format(agent_id=agent_id)
+    deadline = time.monotonic() + settings.TRANSFER_BALANCE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["data"]
+        if cache.get(LOCK_KEY.format(agent_id=agent_id)) is None:
+            # Владелец лока закончил, но ничего не положил — FastAPI ответил ошибкой
+            break
+    return None
+
+
+def get_balance(agent_id, loader):
+    """Баланс агента со stale-while-revalidate и схлопыванием параллельных запросов.
+
+    - свежая запись (моложе TRANSFER_BALANCE_TTL) — отдаем как есть;
+    - устаревшая — отдаем сразу, а обновляем в фоне (если лок наш);
+    - записи нет — в FastAPI идет один запрос, остальные ждут его результат.
+    """
+    entry = cache.get(BALANCE_KEY.format(agent_id=agent_id))
+
+    if entry is not None:
+        if time.time() - entry["fetched_at"] >= settings.TRANSFER_BALANCE_TTL and _acquire(
+            agent_id
+        ):
+            threading.Thread(
+                target=_refresh, args=(agent_id, loader), daemon=True
+            ).start()
+        return entry["data"]
+
+    if _acquire(agent_id):
+        return _refresh(agent_id, loader)
+
+    return _wait_for_entry(agent_id)
+
+
+def get_balance_version(agent_id) -> int:
+    """Меняется при каждом evict_balance — т.е. когда баланс в FastAPI мог измениться."""
+    return cache.get(EVICTIONS_KEY.format(agent_id=agent_id), 0)
+
+
+def evict_balance(agent_id):
+    """Сбрасывает баланс агента: следующий запрос сходит в FastAPI за свежим."""
+    if agent_id is None:
+        return
+    evictions_key = EVICTIONS_KEY.format(agent_id=agent_id)
+    try:
+        cache.incr(evictions_key)
+    except ValueError:
+        cache.add(evictions_key, 1, timeout=None)
+    cache.delete(BALANCE_KEY.format(agent_id=agent_id))
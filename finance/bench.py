@@ -0,0 +1,226 @@
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connection
+
+from . import transfer_client
+from .circuit import CircuitBreaker
+
+# Инструменты для бенчмарков (bench_outbox, bench_views, load_test): заглушка
+# FastAPI-сервиса переводов в том же процессе, перцентили, замер и сравнение
+# с базовой линией. В проде не используются.
+
+
+def percentile(values, pct: float) -> float:
+    """Перцентиль по ближайшему рангу (p50, p99...). Пустой список — 0."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(func, repeat: int = 5, warmup: int = 1) -> dict:
+    """Время (медиана/минимум/максимум, мс) и число SQL-запросов одного прогона func."""
+    for _ in range(warmup):
+        func()
+
+    timings, queries = [], []
+    for _ in range(repeat):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(count)
+
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "max_ms": round(max(timings), 2),
+        # Число запросов от прогона к прогону не скачет: берем максимум
+        "queries": max(queries),
+    }
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Сравнивает замеры с базовой линией: [(кейс, описание), ...].
+
+    Регрессия — больше SQL-запросов, чем было, или медиана хуже на tolerance
+    (доля) и одновременно больше чем на min_delta_ms: шум в доли миллисекунды
+    на быстрых кейсах не считается.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["queries"] > previous["queries"]:
+            regressions.append(
+                (name, f"SQL-запросов {previous['queries']} -> {current['queries']}")
+            )
+        delta = current["median_ms"] - previous["median_ms"]
+        if delta > min_delta_ms and delta > previous["median_ms"] * tolerance:
+            regressions.append(
+                (name, f"медиана {previous['median_ms']} -> {current['median_ms']} мс")
+            )
+    return regressions
+
+
+class StubTransferService:
+    """HTTP-заглушка FastAPI, по умолчанию на 127.0.0.1 со случайным портом.
+
+    latency — задержка ответа (сек), error_rate — доля ответов 500. Запоминает,
+    какие event_id и когда до нее дошли: по этому считаются задержка доставки
+    и дубли.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed=None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.address = (host, port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.deliveries = {}  # event_id -> [time.time() каждого приема]
+        self.requests = {}  # путь без id -> число запросов
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer(self.address, self._handler_class())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def _record(self, event_ids):
+        now = time.time()
+        with self.lock:
+            for event_id in event_ids:
+                self.deliveries.setdefault(event_id, []).append(now)
+
+    def _count(self, path: str):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def handle(self, method: str, path: str, body) -> tuple:
+        """(статус, тело ответа) — логика заглушки без HTTP, чтобы ее было легко читать."""
+        if path.startswith("/api/transfer/balance/"):
+            self._count("/api/transfer/balance/")
+            return 200, {
+                "cash_debt": "1500.00",
+                "daily_profit": "120.50",
+                "monthly_profit": "3400.00",
+                "partners": [{"partner_name": "P1", "debt": "-20.50", "partner_profit": "3"}],
+            }
+
+        if path.startswith("/api/transfer/clear_cash/"):
+            self._count("/api/transfer/clear_cash/")
+        else:
+            self._count(path)
+
+        if self._fails():
+            return 500, {"detail": "stub error"}
+
+        if path == "/api/transfer/webhook/":
+            self._record([body["event_id"]])
+            return 200, {"ok": True}
+        if path == "/api/transfer/webhook/bulk/":
+            self._record([item["event_id"] for item in body])
+            return 200, {"results": [{"event_id": item["event_id"], "ok": True} for item in body]}
+        return 200, {"ok": True}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, как у настоящего uvicorn: клиент держит пул соединений
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело — одним пакетом, без 40 мс delayed ACK на каждый ответ
+            disable_nagle_algorithm = True
+            wbufsize = 64 * 1024
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = stub.handle(method, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@contextmanager
+def stub_client(base_url: str):
+    """Подменяет клиент FastAPI процесса на клиента к заглушке (со своим предохранителем)."""
+    previous = transfer_client._client
+    transfer_client._client = transfer_client.TransferClient(
+        base_url=base_url,
+        pool_size=settings.TRANSFER_POOL_SIZE,
+        connect_timeout=settings.TRANSFER_CONNECT_TIMEOUT,
+        read_timeout=settings.TRANSFER_READ_TIMEOUT,
+        # Отдельное имя: ошибки заглушки не должны открыть боевой предохранитель в Redis
+        breaker=CircuitBreaker(
+            "bench",
+            failure_threshold=settings.TRANSFER_CIRCUIT_FAILURE_THRESHOLD,
+            window=settings.TRANSFER_CIRCUIT_WINDOW,
+            reset_timeout=settings.TRANSFER_CIRCUIT_RESET_TIMEOUT,
+        ),
+    )
+    try:
+        yield transfer_client._client
+    finally:
+        transfer_client._client = previous
@@ -0,0 +1,154 @@
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BonusTierTable
+
+# Общий для всех процессов счетчик версий шкал (через кэш).
+# Локальная копия перечитывается, только когда счетчик сменился.
+GENERATION_CACHE_KEY = "bonus_tiers:generation"
+
+ZERO = Decimal("0.00")
+
+
+@dataclass(frozen=True)
+class TierSchedule:
+    kind: str
+    version: int
+    effective_from: date
+    thresholds: tuple  # возрастающие нижние границы ступеней
+    percents: tuple
+
+    def tier_for(self, total: Decimal) -> int:
+        """Номер ступени (с 1); 0 — сумма ниже первой границы."""
+        return bisect_right(self.thresholds, total)
+
+    def percent_for(self, total: Decimal) -> Decimal:
+        tier = self.tier_for(total)
+        return self.percents[tier - 1] if tier else ZERO
+
+
+@dataclass(frozen=True)
+class BonusResult:
+    total: Decimal
+    tier: int
+    percent: Decimal
+    amount: Decimal
+
+
+@dataclass(frozen=True)
+class TierBook:
+    """Неизменяемый снимок всех шкал: kind -> версии, отсортированные по effective_from."""
+
+    schedules: dict
+    effective_dates: dict
+
+    def schedule_for(self, kind: str, on: date):
+        dates = self.effective_dates.get(kind, ())
+        index = bisect_right(dates, on) - 1
+        if index < 0:
+            return None
+        return self.schedules[kind][index]
+
+
+_lock = threading.Lock()
+_book = None
+_book_generation = None
+
+
+def _load_book() -> TierBook:
+    schedules = {}
+    for table in BonusTierTable.objects.prefetch_related("tiers").order_by(
+        "kind", "effective_from", "version"
+    ):
+        tiers = list(table.tiers.all())
+        schedules.setdefault(table.kind, []).append(
+            TierSchedule(
+                kind=table.kind,
+                version=table.version,
+                effective_from=table.effective_from,
+                thresholds=tuple(tier.min_total for tier in tiers),
+                percents=tuple(tier.percent for tier in tiers),
+            )
+        )
+
+    return TierBook(
+        schedules={kind: tuple(items) for kind, items in schedules.items()},
+        effective_dates={
+            kind: tuple(item.effective_from for item in items)
+            for kind, items in schedules.items()
+        },
+    )
+
+
+def get_tier_book() -> TierBook:
+    global _book, _book_generation
+
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    book = _book
+    if book is not None and _book_generation == generation:
+        return book
+
+    with _lock:
+        if _book is None or _book_generation != generation:
+            _book = _load_book()
+            _book_generation = generation
+        return _book
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(GENERATION_CACHE_KEY, 1, timeout=None)
+
+
+def invalidate_tier_book():
+    """Сбрасывает локальный снимок и (после коммита) сообщает остальным процессам о смене шкал."""
+    global _book
+    _book = None
+    # Бампаем после коммита, иначе соседний процесс успеет перечитать старые данные
+    transaction.on_commit(_bump_generation)
+
+
+def _resolve_date(on):
+    return on or timezone.localdate().replace(day=1)
+
+
+def get_bonus_percent(kind: str, total: Decimal, on: date = None) -> Decimal:
+    schedule = get_tier_book().schedule_for(kind, _resolve_date(on))
+    if schedule is None:
+        return ZERO
+    return schedule.percent_for(total)
+
+
+def calculate_bonus(total: Decimal, percent: Decimal) -> Decimal:
+    return (total * percent / Decimal("100")).quantize(Decimal("0.01"))
+
+
+def evaluate_bonuses(kind: str, totals: Iterable, on: date = None) -> dict:
+    """Пакетный расчет: [(user_id, total), ...] -> {user_id: BonusResult}.
+
+    Шкала выбирается один раз на весь пакет, дальше — только бинарный поиск.
+    """
+    schedule = get_tier_book().schedule_for(kind, _resolve_date(on))
+
+    results = {}
+    for user_id, total in totals:
+        total = total or ZERO
+        tier = schedule.tier_for(total) if schedule else 0
+        percent = schedule.percents[tier - 1] if tier else ZERO
+        results[user_id] = BonusResult(
+            total=total,
+            tier=tier,
+            percent=percent,
+            amount=calculate_bonus(total, percent),
+        )
+    return results
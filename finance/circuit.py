@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+
+# Состояние автомата живет в общем кэше (Redis): если один gunicorn-воркер увидел,
+# что FastAPI лежит, остальные и Celery перестают туда ходить сразу же.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Предохранитель вокруг внешнего сервиса.
+
+    closed    — вызовы идут, ошибки считаются в окне `window` секунд;
+    open      — после `failure_threshold` ошибок в окне: отказ без вызова;
+    half_open — через `reset_timeout` пропускаем одну пробу: успех закрывает
+                автомат, ошибка открывает снова еще на `reset_timeout`.
+
+    Успехи в closed счетчик не сбрасывают — он сам истекает через `window`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, window: int, reset_timeout: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_key = f"circuit:{name}:opened_until"
+        self.probe_key = f"circuit:{name}:probe"
+
+    def allow(self) -> bool:
+        opened_until = cache.get(self.open_key)
+        if opened_until is None:
+            return True
+        if time.time() < opened_until:
+            return False
+        # half-open: пробу получает только тот, кто первым поставил флажок
+        return cache.add(self.probe_key, 1, timeout=self.reset_timeout)
+
+    def record_success(self):
+        # Обычный успех — один GET и больше ничего: без лишнего похода в Redis на каждый
+        # вебхук, и чужие ошибки в окне не обнуляются (иначе при перемежающихся сбоях
+        # автомат не сработает никогда). Сбрасывает состояние только удачная проба
+        opened_until = cache.get(self.open_key)
+        if opened_until is not None and time.time() >= opened_until:
+            cache.delete_many([self.failures_key, self.open_key, self.probe_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, timeout=self.window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # Ключ истек между add и incr — это первая ошибка нового окна
+            cache.set(self.failures_key, 1, timeout=self.window)
+            failures = 1
+
+        if failures >= self.failure_threshold or cache.get(self.open_key) is not None:
+            self.trip()
+
+    def trip(self):
+        cache.set(self.open_key, time.time() + self.reset_timeout, timeout=None)
+        cache.delete(self.probe_key)
+
+    def status(self) -> dict:
+        opened_until = cache.get(self.open_key)
+        if opened_until is None:
+            state = CLOSED
+        elif time.time() < opened_until:
+            state = OPEN
+        else:
+            state = HALF_OPEN
+
+        return {
+            "name": self.name,
+            "state": state,
+            "failures": cache.get(self.failures_key, 0),
+            "failure_threshold": self.failure_threshold,
+            "retry_at": opened_until,
+        }
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+# Валидаторы для HTMX-фрагментов: ETag считается из версии данных (без рендера),
+# совпал If-None-Match — отдаем 304 с пустым телом.
+
+
+def make_etag(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return '"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def accordion_etag(request, transfer_data) -> str:
+    # В аккордеоне форма «Сдать кассу» с csrf_token — новый CSRF-секрет (логин) тоже
+    # новая версия. get_token заводит секрет заранее, чтобы первый ответ и повторы совпали
+    get_token(request)
+    return make_etag(
+        "accordion",
+        request.user.id,
+        request.META.get("CSRF_COOKIE"),
+        transfer_data,
+    )
+
+
+def not_modified(request, etag):
+    """304 (или 412 для небезопасных методов), если клиент прислал тот же ETag, иначе None."""
+    return get_conditional_response(request, etag=etag)
+
+
+def set_validator(response, etag):
+    response.headers["ETag"] = etag
+    # Браузер хранит фрагмент у себя, но перед каждым использованием спрашивает сервер
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
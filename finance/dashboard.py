@@ -0,0 +1,93 @@
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+from django.template.loader import render_to_string
+
+from . import balance_cache, dashboard_cache
+from .bonus import calculate_bonus, get_bonus_percent
+from .models import Comment, Presentation, PresentationComment, Sale
+from .pagination import InvalidCursor, paginate_keyset
+from .rollups import get_month_total
+from .transfer_client import TransferServiceError, get_client
+
+TABS = ("sales", "presentations")
+PAGE_SIZE = 50
+
+
+def resolve_tab(value) -> str:
+    # Любая неизвестная вкладка работает как sales
+    return value if value in TABS else "sales"
+
+
+def dashboard_queryset(user, tab: str):
+    if tab == "presentations":
+        # Презентации пользователя + текст последнего коммента одним подзапросом
+        # (без загрузки всей ветки комментариев в память)
+        last_comment = PresentationComment.objects.filter(
+            presentation=OuterRef("pk")
+        ).order_by("-created_at", "-id")
+        return Presentation.objects.filter(presenter=user).annotate(
+            last_comment_text=Subquery(last_comment.values("comment")[:1])
+        )
+
+    # Продажи + только текст последнего коммента, чтобы не плодить N+1 запросы
+    last_comment = Comment.objects.filter(sale=OuterRef("pk")).order_by(
+        "-created_at", "-id"
+    )
+    return Sale.objects.filter(salesman=user).annotate(
+        last_comment_text=Subquery(last_comment.values("comment")[:1])
+    )
+
+
+def get_dashboard_totals(user, tab: str) -> dict:
+    # Готовый агрегат за месяц (MonthlyRollup) + процент по шкале из BonusTierTable
+    total = get_month_total(user, tab)
+    percent = get_bonus_percent(tab, total)
+    return {
+        "total_amount": total,
+        "bonus_percent": percent,
+        "bonus_amount": calculate_bonus(total, percent),
+    }
+
+
+def render_dashboard_list(request, context) -> str:
+    return render_to_string(
+        "finance/includes/dashboard_list.html", context, request=request
+    )
+
+
+def build_dashboard_fragments(request, user, tab: str, cursor: str = "") -> dict:
+    """Шапка с суммами + отрендеренный список курсорной страницы (через кэш фрагментов).
+
+    Синхронная: async-дашборд гоняет ее в sync_to_async, пока ждет балансы.
+    """
+    key = dashboard_cache.fragment_key(user.id, tab, cursor)
+    fragments = dashboard_cache.get_fragments(key)
+    if fragments is not None:
+        return fragments
+
+    try:
+        page = paginate_keyset(dashboard_queryset(user, tab), cursor, PAGE_SIZE)
+    except InvalidCursor:
+        raise Http404("Некорректный курсор пагинации")
+
+    fragments = get_dashboard_totals(user, tab)
+    fragments["dashboard_list_html"] = render_dashboard_list(
+        request,
+        # is_paginated — у ListView это ?page= с OFFSET; здесь всегда курсор
+        {"items": page.object_list, "cursor_page": page, "active_tab": tab, "is_paginated": False},
+    )
+    dashboard_cache.set_fragments(key, fragments)
+    return fragments
+
+
+def fetch_transfer_data(agent_id):
+    # Суммы приходят уже Decimal — см. transfer_client.parse_balance
+    try:
+        return get_client().get_balance(agent_id)
+    except TransferServiceError:
+        return None
+
+
+def get_transfer_data(agent_id):
+    # Через общий кэш: один поход в FastAPI на агента, сколько бы вкладок ни было открыто
+    return balance_cache.get_balance(agent_id, fetch_transfer_data)
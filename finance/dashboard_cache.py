@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .bonus import GENERATION_CACHE_KEY
+
+# Версия данных пользователя: любая запись Sale/Presentation/комментария ее поднимает,
+# старые фрагменты просто перестают читаться и доживают свой TTL.
+VERSION_KEY = "dashboard:version:{user_id}"
+FRAGMENT_KEY = "dashboard:fragment:{user_id}:{tab}:{page}:{month}:{tiers}:{version}"
+
+
+def _initial_version() -> int:
+    # Если ключ версии вытеснили из кэша, новая версия не должна совпасть со старой
+    return int(time.time() * 1000)
+
+
+def get_data_version(user_id) -> int:
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_data_version(user_id):
+    """Инвалидирует все фрагменты дашборда пользователя.
+
+    Поднимаем версию сразу (текущий процесс) и еще раз после коммита: иначе
+    параллельный запрос между bump и COMMIT закэширует старые данные под новой версией.
+    """
+    if user_id is None:
+        return
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def fragment_key(user_id, tab: str, page: str) -> str:
+    return FRAGMENT_KEY.format(
+        user_id=user_id,
+        tab=tab,
+        page=page or "-",
+        month=timezone.localdate().strftime("%Y-%m"),
+        tiers=cache.get(GENERATION_CACHE_KEY, 0),
+        version=get_data_version(user_id),
+    )
+
+
+def get_fragments(key: str):
+    return cache.get(key)
+
+
+def set_fragments(key: str, fragments: dict):
+    cache.set(key, fragments, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
@@ -0,0 +1,456 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import aclosing
+from decimal import Decimal
+from urllib.parse import urljoin
+
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from .bench import percentile
+from .models import Sale
+
+# Нагрузочный тест (load_test): виртуальные агенты с открытым дашбордом.
+# Каждый агент — поток со своей сессией: открывает дашборд, держит SSE-канал
+# аккордеона (transfer_stream) и время от времени проводит перевод (форма + POST),
+# то есть пишет событие Outbox. Ходить можно в тот же процесс (django Client)
+# или по HTTP в поднятый gunicorn/uvicorn. Ежесекундный опрос transfer_accordion
+# остался только как legacy-режим (--legacy-poll) — для сравнения со старой схемой.
+
+ENDPOINTS = (
+    "dashboard",
+    "transfer_stream",
+    "transfer_accordion",
+    "sale_create_form",
+    "sale_create",
+)
+
+
+async def sse_events(chunks):
+    """Имена событий из потока text/event-stream (ping-комментарии и data: пропускаем).
+
+    Куски приходят как отдала сеть — строка может разорваться между ними.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if line.startswith(b"event:"):
+                yield line[len(b"event:") :].strip().decode()
+
+
+class Stats:
+    """Задержки и ошибки по эндпоинтам; пишут все агенты сразу."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+        # Сколько событий сервер сам прислал в открытые SSE-потоки
+        self.events = {name: 0 for name in ENDPOINTS}
+        self.recording = False
+
+    def record(self, endpoint: str, elapsed_ms: float, status, ok: bool):
+        # Во время разгона не пишем: меряем установившийся режим
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            self.statuses[endpoint][str(status)] = self.statuses[endpoint].get(str(status), 0) + 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def record_event(self, endpoint: str):
+        if not self.recording:
+            return
+        with self.lock:
+            self.events[endpoint] += 1
+
+    def report(self, duration: float) -> dict:
+        endpoints = {}
+        for name in ENDPOINTS:
+            latencies = self.latencies[name]
+            if not latencies:
+                continue
+            endpoints[name] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / duration, 1),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(latencies), 4),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "max_ms": round(max(latencies), 1),
+                "statuses": self.statuses[name],
+            }
+            if self.events[name]:
+                endpoints[name]["events"] = self.events[name]
+        total = sum(item["requests"] for item in endpoints.values())
+        errors = sum(item["errors"] for item in endpoints.values())
+        return {
+            "requests": total,
+            "rps": round(total / duration, 1),
+            "error_rate": round(errors / total, 4) if total else 0,
+            "endpoints": endpoints,
+        }
+
+
+class InProcessTransport:
+    """Запросы в этот же процесс через django Client (WSGI-обработчик целиком).
+
+    SSE-поток идет через AsyncClient с той же сессией: вьюха асинхронная и под
+    WSGI-клиентом дочитывалась бы до закрытия потока (TRANSFER_STREAM_MAX_AGE).
+    """
+
+    def __init__(self, user, password=None):
+        # 500 — это результат замера, а не исключение в потоке агента
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(user)
+        self.async_client = AsyncClient(raise_request_exception=False)
+        self.async_client.cookies = self.client.cookies
+
+    def get(self, path: str, headers=None):
+        response = self.client.get(path, headers=headers)
+        return response.status_code, response.headers.get("ETag")
+
+    def post(self, path: str, data: dict):
+        response = self.client.post(path, data=data)
+        return response.status_code, None
+
+    async def stream(self, path: str):
+        response = await self.async_client.get(path)
+        if not response.streaming:
+            return response.status_code, sse_events(_no_lines())
+        return response.status_code, sse_events(response.streaming_content)
+
+    def close(self):
+        pass
+
+
+async def _no_lines():
+    return
+    yield
+
+
+class HttpTransport:
+    """Настоящий HTTP в поднятый сервер: вход через форму логина, CSRF как у браузера."""
+
+    def __init__(self, user, password, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+        login_url = self._url(reverse("login"))
+        self.session.get(login_url, timeout=timeout).raise_for_status()
+        response = self.session.post(
+            login_url,
+            data={
+                "username": user.username,
+                "password": password,
+                "csrfmiddlewaretoken": self.session.cookies.get("csrftoken", ""),
+            },
+            # Для HTTPS Django сверяет Referer с хостом
+            headers={"Referer": login_url},
+            allow_redirects=False,
+            timeout=timeout,
+        )
+        if response.status_code != 302:
+            raise RuntimeError(f"Не удалось войти как {user.username}: HTTP {response.status_code}")
+
+    def _url(self, path: str) -> str:
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    def get(self, path: str, headers=None):
+        response = self.session.get(
+            self._url(path), headers=headers, allow_redirects=False, timeout=self.timeout
+        )
+        return response.status_code, response.headers.get("ETag")
+
+    def post(self, path: str, data: dict):
+        url = self._url(path)
+        response = self.session.post(
+            url,
+            data=data,
+            headers={"X-CSRFToken": self.session.cookies.get("csrftoken", ""), "Referer": url},
+            allow_redirects=False,
+            timeout=self.timeout,
+        )
+        return response.status_code, None
+
+    async def stream(self, path: str):
+        response = await sync_to_async(self.session.get, thread_sensitive=False)(
+            self._url(path), stream=True, allow_redirects=False, timeout=self.timeout
+        )
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        closed = threading.Event()
+
+        def put(chunk):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except RuntimeError:
+                # Цикл агента уже закрыт — ступень кончилась, кусок никому не нужен
+                pass
+
+        def pump():
+            # Блокирующее чтение requests — в своем daemon-потоке: до следующего ping
+            # оно может висеть, и остановка агента не должна его ждать. Закрывает ответ
+            # тоже он: close() из другого потока ждал бы, пока чтение вернется.
+            # chunk_size=None — отдаем куски сразу, как пришли, без добора до размера
+            try:
+                for chunk in response.iter_content(chunk_size=None):
+                    if closed.is_set():
+                        break
+                    put(chunk)
+            except Exception:
+                pass
+            finally:
+                response.close()
+                put(None)
+
+        async def read():
+            try:
+                while (chunk := await queue.get()) is not None:
+                    yield chunk
+            finally:
+                closed.set()
+
+        threading.Thread(target=pump, daemon=True).start()
+        return response.status_code, sse_events(read())
+
+    def close(self):
+        self.session.close()
+
+
+class VirtualAgent(threading.Thread):
+    """Агент с открытым дашбордом: у каждого действия свой период (с разбросом ±20%).
+
+    Цикл агента асинхронный (async_to_sync): SSE-поток висит отдельной задачей,
+    а синхронные действия уходят в sync_to_async и выполняются в потоке агента —
+    на его соединении с БД.
+    """
+
+    def __init__(self, user, transport_factory, stats: Stats, stop: threading.Event, options):
+        super().__init__(daemon=True)
+        self.user = user
+        self.transport_factory = transport_factory
+        self.stats = stats
+        self.stop = stop
+        self.start_delay = options["start_delay"]
+        self.intervals = {
+            "dashboard": options["dashboard_interval"],
+            "sale": options["sale_interval"],
+        }
+        self.legacy_poll = options.get("legacy_poll", False)
+        if self.legacy_poll:
+            self.intervals["transfer_accordion"] = options["poll_interval"]
+        self.random = random.Random(options["seed"])
+        self.etag = None
+        self.error = None
+
+    def _jitter(self, interval: float) -> float:
+        return interval * self.random.uniform(0.8, 1.2)
+
+    def _timed(self, endpoint: str, call, ok_statuses):
+        started = time.perf_counter()
+        try:
+            status, etag = call()
+        except Exception as exc:
+            status, etag = type(exc).__name__, None
+        self.stats.record(endpoint, self._since(started), status, status in ok_statuses)
+        return status, etag
+
+    def run(self):
+        try:
+            self.loop()
+        finally:
+            # У каждого потока свое соединение с БД
+            connection.close()
+
+    def loop(self):
+        if self.stop.wait(self.start_delay):
+            return
+        try:
+            transport = self.transport_factory(self.user)
+        except Exception as exc:
+            self.error = exc
+            return
+
+        try:
+            async_to_sync(self.actions)(transport)
+        finally:
+            transport.close()
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Ждет seconds или остановки ступени; True — ступень закончилась."""
+        deadline = time.monotonic() + seconds
+        while not self.stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(remaining, 0.05))
+        return True
+
+    async def actions(self, transport):
+        now = time.monotonic()
+        # Дашборд — сразу (агент открыл страницу), остальное — вразнобой
+        due = {
+            action: now + (0 if action == "dashboard" else self.random.uniform(0, interval))
+            for action, interval in self.intervals.items()
+            if interval
+        }
+        # Открытый дашборд держит SSE-канал аккордеона все время, пока агент на странице
+        stream = None if self.legacy_poll else asyncio.create_task(self.transfer_stream(transport))
+        try:
+            while due:
+                action = min(due, key=due.get)
+                if await self._sleep(due[action] - time.monotonic()):
+                    break
+                await sync_to_async(getattr(self, action))(transport)
+                due[action] = time.monotonic() + self._jitter(self.intervals[action])
+            else:
+                await self._sleep(float("inf"))
+        finally:
+            if stream is not None:
+                stream.cancel()
+                await asyncio.gather(stream, return_exceptions=True)
+
+    def dashboard(self, transport):
+        self._timed(
+            "dashboard",
+            lambda: transport.get(reverse("dashboard") + "?tab=sales"),
+            {200},
+        )
+
+    async def transfer_stream(self, transport):
+        """SSE как у EventSource: держим поток, считаем присланные фрагменты, после
+        закрытия (TRANSFER_STREAM_MAX_AGE) или ошибки переподключаемся через retry.
+
+        Задержка в отчете — от запроса до первого фрагмента аккордеона.
+        """
+        retry = settings.TRANSFER_STREAM_RETRY_MS / 1000
+        while not self.stop.is_set():
+            started = time.perf_counter()
+            try:
+                status, events = await transport.stream(reverse("transfer_stream"))
+                async with aclosing(events):
+                    if status != 200:
+                        # Редирект на логин, 500 — тело не читаем, повторим через retry
+                        self.stats.record("transfer_stream", self._since(started), status, False)
+                    else:
+                        await self._count_events(events, started)
+            except Exception as exc:
+                self.stats.record(
+                    "transfer_stream", self._since(started), type(exc).__name__, False
+                )
+            if await self._sleep(retry):
+                return
+
+    async def _count_events(self, events, started: float):
+        first = True
+        async for event in events:
+            if event != "accordion":
+                continue
+            if first:
+                first = False
+                self.stats.record("transfer_stream", self._since(started), 200, True)
+            self.stats.record_event("transfer_stream")
+
+    @staticmethod
+    def _since(started: float) -> float:
+        return (time.perf_counter() - started) * 1000
+
+    def transfer_accordion(self, transport):
+        # Legacy-режим (--legacy-poll), как браузер до SSE: повторный опрос
+        # с If-None-Match, неизменный баланс — 304
+        headers = {"If-None-Match": self.etag} if self.etag else None
+        status, etag = self._timed(
+            "transfer_accordion",
+            lambda: transport.get(reverse("transfer_accordion"), headers=headers),
+            {200, 286, 304},
+        )
+        if etag:
+            self.etag = etag
+
+    def sale(self, transport):
+        status, _ = self._timed(
+            "sale_create_form", lambda: transport.get(reverse("sale_create")), {200}
+        )
+        if status != 200:
+            return
+        amount = Decimal(self.random.randrange(1000, 50000)).quantize(Decimal("0.01"))
+        self._timed(
+            "sale_create",
+            lambda: transport.post(
+                reverse("sale_create"),
+                {
+                    "sale_amount": str(amount),
+                    "payment_type": Sale.PaymentChoices.TRANSFER,
+                    "client_rate": "2.5000",
+                    "partner_rate": "2.4000",
+                    "transfer_amount_rub": str((amount * Decimal("2.5")).quantize(Decimal("1"))),
+                    "partner_name": "load-test",
+                },
+            ),
+            # Успешная форма — редирект на дашборд
+            {302},
+        )
+
+
+def run_stage(users, transport_factory, agents: int, duration: float, ramp_up: float, options):
+    """Разгоняет agents агентов за ramp_up сек и меряет duration сек. Отчет по эндпоинтам.
+
+    Один агент работает в текущем потоке (и на его соединении с БД) — так
+    прогон виден внутри транзакции теста.
+    """
+    stats = Stats()
+    stop = threading.Event()
+    seed = options.get("seed")
+    agents_list = [
+        VirtualAgent(
+            users[i % len(users)],
+            transport_factory,
+            stats,
+            stop,
+            {
+                **options,
+                "start_delay": ramp_up * i / agents,
+                "seed": None if seed is None else seed + i,
+            },
+        )
+        for i in range(agents)
+    ]
+    window = {}
+
+    def control():
+        stop.wait(ramp_up)
+        stats.recording = True
+        started = time.monotonic()
+        stop.wait(duration)
+        stats.recording = False
+        window["measured"] = time.monotonic() - started
+        stop.set()
+
+    controller = threading.Thread(target=control, daemon=True)
+    controller.start()
+    if agents == 1:
+        agents_list[0].loop()
+    else:
+        for agent in agents_list:
+            agent.start()
+        for agent in agents_list:
+            agent.join()
+    controller.join()
+
+    report = stats.report(window["measured"])
+    report["agents"] = agents
+    report["duration_s"] = round(window["measured"], 2)
+    report["login_failures"] = [str(agent.error) for agent in agents_list if agent.error]
+    return report
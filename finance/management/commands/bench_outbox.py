@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from finance.bench import StubTransferService, percentile, stub_client
+from finance.models import OutboxEvent, Sale
+from finance.outbox import process_due
+from finance.tasks import send_single_outbox_event
+
+UNSENT = [OutboxEvent.StatusChoices.PENDING, OutboxEvent.StatusChoices.IN_FLIGHT]
+BENCH_USERNAME = "outbox_bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк Outbox против HTTP-заглушки FastAPI в том же процессе: события/сек, "
+        "p50/p99 задержки доставки, SQL-запросов на событие, дубли. Результат — JSON. "
+        "Не запускать на боевой базе: создает и удаляет свои события и продажи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode",
+            choices=["drain", "commit"],
+            default="drain",
+            help="drain — разгрести N готовых PENDING; commit — N продаж через SaleCreateView "
+            "(form_valid -> on_commit -> send_single_outbox_event; запросы на событие "
+            "тогда включают весь POST).",
+        )
+        parser.add_argument("--events", type=int, default=1000)
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Параллельных воркеров (потоков)."
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            default=None,
+            help="Доставка пачками (OUTBOX_BULK_WEBHOOK). По умолчанию — как в настройках.",
+        )
+        parser.add_argument("--no-bulk", action="store_false", dest="bulk")
+        parser.add_argument("--batch-size", type=int, help="OUTBOX_BATCH_SIZE на время прогона.")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Задержка ответа заглушки.")
+        parser.add_argument("--error-rate", type=float, default=0, help="Доля ответов 500 (0..1).")
+        parser.add_argument("--seed", type=int, help="Seed для ошибок заглушки.")
+        parser.add_argument("--timeout", type=float, default=120, help="Максимум сек на прогон.")
+        parser.add_argument("--output", help="Записать JSON в файл (по умолчанию — stdout).")
+
+    def handle(self, *args, **options):
+        if OutboxEvent.objects.filter(status__in=UNSENT).exists():
+            raise CommandError(
+                "В очереди есть неотправленные события — бенчмарк «доставил» бы их в заглушку"
+            )
+
+        overrides = {
+            # Повторы после ошибок заглушки — быстро, иначе прогон упрется в backoff
+            "OUTBOX_RETRY_BASE_DELAY": 0.05,
+            "OUTBOX_RETRY_MAX_DELAY": 0.5,
+            # При --error-rate предохранитель заглушки честно открывается — держим его
+            # открытым секунду, а не боевые 15 (в Redis таймаут — целые секунды)
+            "TRANSFER_CIRCUIT_RESET_TIMEOUT": 1,
+            "ALLOWED_HOSTS": ["*"],
+        }
+        if options["bulk"] is not None:
+            overrides["OUTBOX_BULK_WEBHOOK"] = options["bulk"]
+        if options["batch_size"]:
+            overrides["OUTBOX_BATCH_SIZE"] = options["batch_size"]
+
+        stub = StubTransferService(
+            latency=options["latency_ms"] / 1000,
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        )
+        self.queries = 0
+        self.lock = threading.Lock()
+
+        app = send_single_outbox_event.app
+        eager = app.conf.task_always_eager
+        # .delay() из on_commit выполняется сразу, без брокера — как будто воркер свободен
+        app.conf.task_always_eager = True
+
+        # Настройки — раньше клиента: его предохранитель читает их при создании
+        with stub, override_settings(**overrides), stub_client(stub.base_url):
+            # События бенча — все, что новее этого id
+            self.last_id = OutboxEvent.objects.aggregate(last=Max("id"))["last"] or 0
+            try:
+                result = self._run(stub, options)
+            finally:
+                app.conf.task_always_eager = eager
+                self._cleanup()
+
+        output = json.dumps(result, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                fh.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    # --- прогон ---
+
+    def _run(self, stub, options) -> dict:
+        events, workers = options["events"], options["workers"]
+        deadline = time.monotonic() + options["timeout"]
+
+        if options["mode"] == "drain":
+            OutboxEvent.objects.bulk_create(
+                OutboxEvent(payload={"bench": True, "n": i}) for i in range(events)
+            )
+            started = time.monotonic()
+            self._parallel(workers, lambda i: self._drain(deadline))
+        else:
+            user = get_user_model().objects.create_user(username=BENCH_USERNAME)
+            per_worker = [events // workers + (i < events % workers) for i in range(workers)]
+            started = time.monotonic()
+            self._parallel(workers, lambda i: self._post_sales(user, per_worker[i]))
+            # Не доставленное сразу (ошибка заглушки -> backoff) добирает обычный проход
+            self._counted(lambda i: self._drain(deadline), 0)
+
+        elapsed = time.monotonic() - started
+        bench_events = list(
+            OutboxEvent.objects.filter(id__gt=self.last_id).values_list(
+                "id", "status", "created_at"
+            )
+        )
+
+        latencies = [
+            (stub.deliveries[event_id][0] - created_at.timestamp()) * 1000
+            for event_id, _, created_at in bench_events
+            if event_id in stub.deliveries
+        ]
+        statuses = [status for _, status, _ in bench_events]
+        return {
+            "mode": options["mode"],
+            "events": len(bench_events),
+            "workers": workers,
+            "bulk": settings.OUTBOX_BULK_WEBHOOK,
+            "batch_size": settings.OUTBOX_BATCH_SIZE,
+            "stub_latency_ms": options["latency_ms"],
+            "stub_error_rate": options["error_rate"],
+            "duration_s": round(elapsed, 3),
+            "events_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0,
+            "latency_p50_ms": round(percentile(latencies, 50), 1),
+            "latency_p99_ms": round(percentile(latencies, 99), 1),
+            "queries_per_event": round(self.queries / len(bench_events), 2) if bench_events else 0,
+            "http_requests": stub.requests,
+            "sent": statuses.count(OutboxEvent.StatusChoices.SENT),
+            "failed": statuses.count(OutboxEvent.StatusChoices.FAILED),
+            "undelivered": sum(1 for status in statuses if status in UNSENT),
+            "duplicates": sum(len(times) - 1 for times in stub.deliveries.values()),
+        }
+
+    def _parallel(self, workers: int, target):
+        if workers == 1:
+            # В том же потоке — и тот же коннект к БД (нужно тестам внутри транзакции)
+            self._counted(target, 0)
+            return
+        threads = [
+            threading.Thread(target=self._in_thread, args=(target, i)) for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _in_thread(self, target, index):
+        try:
+            self._counted(target, index)
+        finally:
+            connection.close()
+
+    def _counted(self, target, index):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            target(index)
+        with self.lock:
+            self.queries += count
+
+    def _outstanding(self) -> bool:
+        return OutboxEvent.objects.filter(id__gt=self.last_id, status__in=UNSENT).exists()
+
+    def _drain(self, deadline):
+        while time.monotonic() < deadline:
+            try:
+                if not process_due() and not self._outstanding():
+                    return
+            except OperationalError:
+                # SQLite: «database is locked», когда воркеры пишут одновременно
+                pass
+            # Остались только события на паузе (backoff) или у соседнего воркера
+            time.sleep(0.01)
+
+    def _post_sales(self, user, count):
+        client = Client()
+        client.force_login(user)
+        for i in range(count):
+            client.post(
+                reverse("sale_create"),
+                data={
+                    "sale_amount": str(Decimal("100.00") + i),
+                    "payment_type": Sale.PaymentChoices.TRANSFER,
+                    "client_rate": "2.5000",
+                    "partner_rate": "2.4000",
+                    "transfer_amount_rub": "250",
+                    "partner_name": "bench",
+                },
+            )
+
+    def _cleanup(self):
+        OutboxEvent.objects.filter(id__gt=self.last_id).delete()
+        # Продажи и PartnerRate бенча уходят каскадом вместе с пользователем
+        get_user_model().objects.filter(username=BENCH_USERNAME).delete()
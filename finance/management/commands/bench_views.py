@@ -0,0 +1,201 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from finance.bench import StubTransferService, find_regressions, measure, stub_client
+from finance.bonus import evaluate_bonuses
+from finance.models import MonthlyRollup, Presentation, Sale
+from finance.payroll import totals_by_user
+from finance.rollups import month_start
+from finance.synthetic import USERNAME_PREFIX, synthetic_users
+
+CASES = (
+    "dashboard_sales",
+    "dashboard_presentations",
+    "sale_detail",
+    "presentation_detail",
+    "monthly_totals",
+    "bonus_calculation",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарки на синтетических данных (generate_data): дашборд по вкладкам, "
+        "карточки продажи/презентации, месячные суммы, расчет бонусов. Сравнивает с "
+        "базовой линией и падает при регрессии. Кэш на время прогона выключен — "
+        "меряется полный путь, а не попадание в кэш фрагментов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--case",
+            action="append",
+            dest="cases",
+            choices=CASES,
+            help="Только этот кейс (можно несколько раз). По умолчанию — все.",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Прогонов на кейс.")
+        parser.add_argument(
+            "--user",
+            help=f"Агент для вьюх. По умолчанию — {USERNAME_PREFIX}* с наибольшим числом продаж.",
+        )
+        parser.add_argument("--baseline", help="JSON базовой линии для сравнения.")
+        parser.add_argument("--save-baseline", help="Записать результаты как базовую линию.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Допустимое замедление медианы (доля), по умолчанию 0.2 = 20%%.",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=2.0,
+            help="Замедление меньше стольких мс регрессией не считается (шум).",
+        )
+
+    def handle(self, *args, **options):
+        agent = self._agent(options["user"])
+        self.stderr.write(f"Агент: {agent.username}")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as fh:
+                baseline = json.load(fh)
+
+        dataset = {
+            "users": synthetic_users().count(),
+            "sales": Sale.objects.count(),
+            "presentations": Presentation.objects.count(),
+        }
+        overrides = {
+            "CACHES": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            "ALLOWED_HOSTS": ["*"],
+            "SERVER_TIMING_SAMPLE_RATE": 0,
+        }
+        with StubTransferService() as stub, stub_client(stub.base_url), override_settings(
+            **overrides
+        ):
+            cases = self._cases(agent)
+            results = {}
+            for name in options["cases"] or CASES:
+                results[name] = measure(cases[name], repeat=options["repeat"])
+                self.stdout.write(self._row(name, results[name]))
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w", encoding="utf-8") as fh:
+                json.dump({"dataset": dataset, "results": results}, fh, indent=2)
+                fh.write("\n")
+            self.stdout.write(f"Базовая линия записана: {options['save_baseline']}")
+
+        if baseline is None:
+            return
+
+        if baseline.get("dataset") != dataset:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Данные отличаются от базовой линии: {baseline.get('dataset')} -> {dataset}"
+                )
+            )
+        regressions = find_regressions(
+            results, baseline["results"], options["tolerance"], options["min_delta_ms"]
+        )
+        for name, reason in regressions:
+            self.stderr.write(self.style.ERROR(f"РЕГРЕССИЯ {name}: {reason}"))
+        if regressions:
+            raise CommandError(f"Регрессий: {len(regressions)}")
+        self.stdout.write(self.style.SUCCESS("Регрессий относительно базовой линии нет."))
+
+    def _agent(self, username):
+        if username:
+            agent = synthetic_users().model.objects.filter(username=username).first()
+        else:
+            busiest = (
+                Sale.objects.filter(salesman__username__startswith=USERNAME_PREFIX)
+                .values("salesman")
+                .annotate(sales=Count("id"))
+                .order_by("-sales")
+                .first()
+            )
+            agent = busiest and synthetic_users().get(pk=busiest["salesman"])
+        if agent is None:
+            raise CommandError("Нет данных: сначала manage.py generate_data")
+        return agent
+
+    def _cases(self, agent) -> dict:
+        client = Client()
+        client.force_login(agent)
+
+        def get(url):
+            def run():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: HTTP {response.status_code}")
+
+            return run
+
+        # Самые «тяжелые» карточки агента — с наибольшей веткой комментариев
+        sale = (
+            Sale.objects.filter(salesman=agent)
+            .annotate(comment_count=Count("comments"))
+            .order_by("-comment_count", "-id")
+            .first()
+        )
+        presentation = (
+            Presentation.objects.filter(presenter=agent)
+            .annotate(comment_count=Count("presentation_comments"))
+            .order_by("-comment_count", "-id")
+            .first()
+        )
+
+        month = month_start(timezone.localdate())
+
+        def monthly_totals():
+            totals_by_user(Sale, "salesman", "sale_amount", month)
+            totals_by_user(Presentation, "presenter", "group_sales_total", month)
+
+        # Суммы — вне замера: бонусы меряем сами по себе, как в build_payroll
+        sales = totals_by_user(Sale, "salesman", "sale_amount", month)
+        presentations = totals_by_user(Presentation, "presenter", "group_sales_total", month)
+        user_ids = list(synthetic_users().values_list("id", flat=True))
+
+        def bonus_calculation():
+            evaluate_bonuses(
+                MonthlyRollup.KindChoices.SALES, ((pk, sales.get(pk)) for pk in user_ids), on=month
+            )
+            evaluate_bonuses(
+                MonthlyRollup.KindChoices.PRESENTATIONS,
+                ((pk, presentations.get(pk)) for pk in user_ids),
+                on=month,
+            )
+
+        def missing(kind):
+            def run():
+                raise CommandError(f"У агента {agent.username} нет {kind}")
+
+            return run
+
+        return {
+            "dashboard_sales": get(reverse("dashboard") + "?tab=sales"),
+            "dashboard_presentations": get(reverse("dashboard") + "?tab=presentations"),
+            "sale_detail": get(reverse("sale_detail", args=[sale.pk])) if sale else missing("продаж"),
+            "presentation_detail": (
+                get(reverse("presentation_detail", args=[presentation.pk]))
+                if presentation
+                else missing("презентаций")
+            ),
+            "monthly_totals": monthly_totals,
+            "bonus_calculation": bonus_calculation,
+        }
+
+    def _row(self, name, result) -> str:
+        return (
+            f"{name:<24} медиана {result['median_ms']:>9.2f} мс  "
+            f"min {result['min_ms']:>9.2f}  max {result['max_ms']:>9.2f}  "
+            f"SQL {result['queries']}"
+        )
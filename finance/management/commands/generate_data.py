@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.synthetic import PASSWORD, USERNAME_PREFIX, clear, generate, synthetic_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Синтетические данные для бенчмарков: агенты, продажи/презентации по всем типам "
+        "оплат, комментарии и история Outbox — через bulk_create, воспроизводимо по --seed. "
+        "Не запускать на боевой базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--sales", type=int, default=1_000_000)
+        parser.add_argument("--presentations", type=int, default=200_000)
+        parser.add_argument(
+            "--comment-ratio",
+            type=float,
+            default=0.3,
+            help="Доля продаж/презентаций с комментариями (1-3 шт.).",
+        )
+        parser.add_argument(
+            "--months", type=int, default=12, help="Глубина истории, месяцев."
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help=f"Сначала удалить прежних синтетических агентов ({USERNAME_PREFIX}*).",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            self.stdout.write(f"Удалено синтетических агентов: {clear()}")
+        elif synthetic_users().exists():
+            raise CommandError(
+                "Синтетические агенты уже есть — добавьте --clear, иначе seed "
+                "не даст тот же набор данных"
+            )
+
+        if options["users"] < 1:
+            raise CommandError("Нужен хотя бы один агент")
+
+        started = time.monotonic()
+        counts = generate(
+            users=options["users"],
+            sales=options["sales"],
+            presentations=options["presentations"],
+            comment_ratio=options["comment_ratio"],
+            months=options["months"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            log=lambda message: self.stderr.write(message),
+        )
+
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово за {time.monotonic() - started:.1f} сек. "
+                f"Вход: {USERNAME_PREFIX}000000 / {PASSWORD}"
+            )
+        )
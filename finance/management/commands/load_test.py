@@ -0,0 +1,163 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from finance.bench import StubTransferService, stub_client
+from finance.loadtest import HttpTransport, InProcessTransport, run_stage
+from finance.synthetic import PASSWORD, synthetic_users
+from finance.tasks import send_single_outbox_event
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест: виртуальные агенты с открытым дашбордом (SSE-канал transfer_stream, "
+        "переводы через форму продажи) против заглушки FastAPI. Ступени --agents 10,20,40 "
+        "показывают, где упирается пропускная способность: по ним подбирают число воркеров "
+        "gunicorn и concurrency Celery. Агенты — синтетические пользователи (generate_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--agents",
+            default="10",
+            help="Число агентов; через запятую — ступени (10,20,40), каждая со своим замером.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=30, help="Замер на ступени, сек (после разгона)."
+        )
+        parser.add_argument(
+            "--ramp-up", type=float, default=5, help="За сколько сек подключаются все агенты."
+        )
+        parser.add_argument(
+            "--legacy-poll",
+            action="store_true",
+            help="Вместо SSE опрашивать transfer_accordion, как дашборд до transfer_stream.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Опрос transfer_accordion, сек (только с --legacy-poll).",
+        )
+        parser.add_argument(
+            "--dashboard-interval", type=float, default=30, help="Перезагрузка дашборда, сек."
+        )
+        parser.add_argument(
+            "--sale-interval",
+            type=float,
+            default=20,
+            help="Перевод (форма + POST) раз в N сек на агента. 0 — без продаж.",
+        )
+        parser.add_argument(
+            "--target",
+            help="URL поднятого сервера (http://127.0.0.1:8000). По умолчанию — запросы "
+            "в этот же процесс: WSGI целиком, но без gunicorn и сети.",
+        )
+        parser.add_argument(
+            "--stub-host", default="127.0.0.1", help="Адрес заглушки FastAPI."
+        )
+        parser.add_argument(
+            "--stub-port",
+            type=int,
+            default=0,
+            help="Порт заглушки. С --target сервер и его Celery должны смотреть на нее "
+            "(FASTAPI_BASE_URL) — иначе нагрузка уйдет в настоящий FastAPI.",
+        )
+        parser.add_argument("--stub-latency-ms", type=float, default=0)
+        parser.add_argument("--stub-error-rate", type=float, default=0)
+        parser.add_argument("--seed", type=int, help="Seed расписания агентов и ошибок заглушки.")
+        parser.add_argument("--output", help="Записать JSON в файл (по умолчанию — stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            stages = [int(value) for value in options["agents"].split(",")]
+        except ValueError:
+            raise CommandError("--agents: числа через запятую")
+        if not stages or min(stages) < 1:
+            raise CommandError("--agents: хотя бы один агент на ступени")
+
+        users = list(synthetic_users().order_by("id")[: max(stages)])
+        if not users:
+            raise CommandError("Нет синтетических агентов: сначала manage.py generate_data")
+        if len(users) < max(stages):
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Агентов больше, чем пользователей ({len(users)}): сессии будут делить аккаунты"
+                )
+            )
+
+        stub = StubTransferService(
+            latency=options["stub_latency_ms"] / 1000,
+            error_rate=options["stub_error_rate"],
+            seed=options["seed"],
+            host=options["stub_host"],
+            port=options["stub_port"],
+        )
+        agent_options = {
+            "legacy_poll": options["legacy_poll"],
+            "poll_interval": options["poll_interval"],
+            "dashboard_interval": options["dashboard_interval"],
+            "sale_interval": options["sale_interval"],
+            "seed": options["seed"],
+        }
+
+        with stub:
+            self.stderr.write(f"Заглушка FastAPI: {stub.base_url}")
+            if options["target"]:
+                target = options["target"]
+                stage_reports = self._stages(
+                    stages,
+                    users,
+                    lambda user: HttpTransport(user, PASSWORD, target),
+                    agent_options,
+                    options,
+                )
+            else:
+                stage_reports = self._in_process(stages, users, stub, agent_options, options)
+            webhooks = {
+                path: count for path, count in stub.requests.items() if "webhook" in path
+            }
+
+        result = {
+            "target": options["target"] or "in-process",
+            "stub_latency_ms": options["stub_latency_ms"],
+            "stub_error_rate": options["stub_error_rate"],
+            "stages": stage_reports,
+            # Сколько событий Outbox дошло до заглушки за весь прогон
+            "outbox_webhooks": webhooks,
+        }
+        output = json.dumps(result, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                fh.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def _in_process(self, stages, users, stub, agent_options, options):
+        app = send_single_outbox_event.app
+        eager = app.conf.task_always_eager
+        # Без брокера: доставка события идет в on_commit того же запроса, как у
+        # свободного Celery-воркера (время вебхука в заглушку входит в sale_create)
+        app.conf.task_always_eager = True
+        try:
+            with stub_client(stub.base_url), override_settings(ALLOWED_HOSTS=["*"]):
+                return self._stages(stages, users, InProcessTransport, agent_options, options)
+        finally:
+            app.conf.task_always_eager = eager
+
+    def _stages(self, stages, users, factory, agent_options, options):
+        reports = []
+        for agents in stages:
+            self.stderr.write(
+                f"Ступень: {agents} агентов, разгон {options['ramp_up']} сек, "
+                f"замер {options['duration']} сек"
+            )
+            report = run_stage(
+                users, factory, agents, options["duration"], options["ramp_up"], agent_options
+            )
+            self.stderr.write(
+                f"  {report['rps']} запр/сек, ошибок {report['error_rate']:.2%}"
+            )
+            reports.append(report)
+        return reports
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from finance.partitions import (
+    convert_to_partitioned,
+    drop_partitions_before,
+    ensure_partitions,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Помесячное секционирование OutboxEvent (только Postgres): перевод таблицы, "
+        "создание секций наперед и DROP старых вместо DELETE. Внимание: --convert меняет "
+        "схему в обход миграций — первичный ключ становится (id, created_at), таблица "
+        "секционирована, а состояние миграций Django об этом не знает. Миграции, которые "
+        "трогают finance_outboxevent (первичный ключ, уникальные ограничения без "
+        "created_at, внешние ключи на OutboxEvent), после перевода писать вручную "
+        "через RunSQL/SeparateDatabaseAndState и проверять на секционированной таблице."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Один раз пересоздать таблицу секционированной (блокирует вставку — окно обслуживания).",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=2,
+            help="На сколько месяцев вперед держать готовые секции (по умолчанию 2).",
+        )
+        parser.add_argument(
+            "--drop-older-than",
+            type=int,
+            metavar="DAYS",
+            help="Удалить секции, целиком старше DAYS дней (если в них только SENT).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Секционирование доступно только на Postgres")
+
+        if options["convert"]:
+            if is_partitioned():
+                raise CommandError("Таблица уже секционирована")
+            convert_to_partitioned(options["ahead"])
+            self.stdout.write(self.style.SUCCESS("OutboxEvent переведена на помесячные секции."))
+        elif not is_partitioned():
+            raise CommandError("Таблица не секционирована: сначала запустите с --convert")
+
+        for name in ensure_partitions(options["ahead"]):
+            self.stdout.write(f"Секция: {name}")
+
+        if options["drop_older_than"] is not None:
+            cutoff = timezone.now() - timezone.timedelta(days=options["drop_older_than"])
+            for name in drop_partitions_before(cutoff):
+                self.stdout.write(f"Удалена секция: {name}")
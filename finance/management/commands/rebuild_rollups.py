@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.rollups import diff_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает MonthlyRollup по таблицам Sale/Presentation и сверяет результат."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сверить агрегаты с сырыми данными, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="ID пользователя (можно несколько раз). По умолчанию — все.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+
+        if not options["check"]:
+            rows = rebuild_rollups(user_ids)
+            self.stdout.write(f"Пересчитано агрегатов: {rows}")
+
+        mismatches = diff_rollups(user_ids)
+        for (user_id, month, kind), want, have in mismatches:
+            self.stderr.write(
+                f"user={user_id} {month:%Y-%m} {kind}: "
+                f"ожидалось {want[0]} ({want[1]} шт.), в агрегате {have[0]} ({have[1]} шт.)"
+            )
+
+        if mismatches:
+            raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+
+        self.stdout.write(self.style.SUCCESS("Агрегаты совпадают с сырыми данными."))
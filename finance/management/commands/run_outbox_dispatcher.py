@@ -0,0 +1,112 @@
+import select
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from finance.outbox import NOTIFY_CHANNEL, process_due, seconds_until_due
+
+
+class _Stopped(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Долгоживущий диспетчер Outbox: ждет NOTIFY от триггера на вставку (Postgres), "
+        "сразу доставляет созданные события и засыпает до следующего уведомления или повтора."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=0,
+            help="Выйти после N циклов (для отладки). По умолчанию — работать до SIGTERM.",
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        self.waiting = False
+        previous = {
+            sig: signal.signal(sig, self._stop) for sig in (signal.SIGTERM, signal.SIGINT)
+        }
+
+        listening = connection.vendor == "postgresql"
+        self.stderr.write(
+            f"Outbox-диспетчер: {'LISTEN ' + NOTIFY_CHANNEL if listening else 'опрос очереди'}, "
+            f"страховочный проход раз в {settings.OUTBOX_SWEEP_INTERVAL} сек"
+        )
+
+        iterations = 0
+        while self.running:
+            try:
+                if listening:
+                    self._listen()
+                delivered = process_due()
+                if delivered:
+                    self.stderr.write(f"Доставлено событий: {delivered}")
+                self._wait(listening)
+            except DatabaseError as e:
+                # Postgres перезапустился / соединение порвалось: переподключимся
+                # и заново подпишемся на канал на следующем круге
+                self.stderr.write(self.style.ERROR(f"Ошибка БД: {e}"))
+                connection.close()
+                time.sleep(1)
+
+            iterations += 1
+            if options["iterations"] and iterations >= options["iterations"]:
+                break
+
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        connection.close()
+
+    def _stop(self, signum, frame):
+        self.running = False
+        if self.waiting:
+            # Во сне прерываемся сразу; посреди доставки — дорабатываем круг и выходим
+            raise _Stopped
+
+    def _listen(self):
+        # После переподключения LISTEN нужно повторить; на живом соединении это no-op
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+    def _timeout(self) -> float:
+        # Спим до ближайшего повтора (backoff), но не дольше страховочного интервала
+        due_in = seconds_until_due()
+        if due_in is None:
+            return settings.OUTBOX_SWEEP_INTERVAL
+        return min(due_in, settings.OUTBOX_SWEEP_INTERVAL)
+
+    def _wait(self, listening: bool):
+        timeout = self._timeout()
+        self.waiting = True
+        try:
+            if listening:
+                self._wait_notify(timeout)
+            else:
+                time.sleep(timeout)
+        except _Stopped:
+            pass
+        finally:
+            self.waiting = False
+
+    def _wait_notify(self, timeout: float):
+        pg = connection.connection
+        # pg.poll() идет мимо курсора Django и при обрыве бросает psycopg2.OperationalError,
+        # а не DatabaseError: без обертки handle не переподключится, а упадет
+        with connection.wrap_database_errors:
+            # psycopg2 складывает NOTIFY в pg.notifies и при обычных запросах: то, что
+            # пришло, пока шла доставка, уже прочитано из сокета — select его не увидит
+            pg.poll()
+            if not pg.notifies:
+                # Сокет соединения становится читаемым, когда пришел NOTIFY
+                if select.select([pg], [], [], timeout)[0]:
+                    pg.poll()
+        # Неважно, сколько уведомлений пришло: process_due заберет всю очередь
+        pg.notifies.clear()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.payroll import build_payroll, parse_month, previous_month, write_payroll_csv
+
+
+class Command(BaseCommand):
+    help = "Считает зарплаты и бонусы всех сотрудников за месяц и сохраняет снимок + CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month",
+            help="Месяц в формате YYYY-MM. По умолчанию — прошлый месяц.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Дополнительно выгрузить CSV в файл ('-' — в stdout).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            month = parse_month(options["month"]) if options["month"] else previous_month()
+        except ValueError:
+            raise CommandError("Месяц нужно указать в формате YYYY-MM")
+
+        run = build_payroll(month, chunk_size=options["chunk_size"])
+
+        output = options["output"]
+        if output == "-":
+            write_payroll_csv(run, self.stdout)
+        elif output:
+            with open(output, "w", encoding="utf-8", newline="") as fh:
+                write_payroll_csv(run, fh)
+
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Payroll {run.month:%Y-%m}: {run.user_count} сотрудников, файл {run.csv_file.name}"
+            )
+        )
@@ -0,0 +1,185 @@
+import bisect
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+# Метрики Outbox для Prometheus (/metrics).
+#
+# Счетчики и гистограммы — целые числа в общем кэше (Redis): cache.incr атомарен,
+# так что gunicorn-воркеры, Celery и диспетчер пишут в одни и те же ряды.
+# Гауги (глубина очереди, возраст старейшего события) — один запрос к БД,
+# закэшированный на METRICS_GAUGE_TTL сек: частый scrape не дергает COUNT.
+
+logger = logging.getLogger(__name__)
+
+KEY = "metrics:{name}:{labels}"
+
+COUNTERS = {
+    "outbox_delivery_attempts_total": (
+        "Попытки доставки событий по исходу",
+        [{"outcome": o} for o in ("sent", "error", "rejected", "failed", "circuit_open")],
+    ),
+    "outbox_cleanup_deleted_total": ("Удалено старых SENT-событий ночной чисткой", [{}]),
+}
+
+HISTOGRAMS = {
+    "outbox_commit_to_sent_seconds": (
+        "От создания события до подтверждения FastAPI",
+        (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 1800, 3600),
+        [{}],
+    ),
+    "outbox_webhook_seconds": (
+        "Время ответа FastAPI на вебхук",
+        (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+        [{"mode": "single"}, {"mode": "bulk"}],
+    ),
+}
+
+GAUGES_KEY = "metrics:outbox_gauges"
+
+# Сумма гистограммы хранится целым числом в микросекундах: incr не умеет float
+SUM_SCALE = 1_000_000
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+def _incr_many(amounts: dict):
+    for key, amount in amounts.items():
+        if not amount:
+            continue
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Ряда еще нет (или кэш очищен): создаем. Гонку двух add решает сам add
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
+
+
+def _safe(func):
+    # Метрики не должны ронять доставку: Redis недоступен — теряем точку, не событие
+    def wrapper(*args, **kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.debug("Не удалось записать метрику", exc_info=True)
+
+    return wrapper
+
+
+@_safe
+def inc(name: str, amount: int = 1, **labels):
+    _incr_many({KEY.format(name=name, labels=_labels(labels)): amount})
+
+
+@_safe
+def observe(name: str, values, **labels):
+    """Добавляет в гистограмму одно значение или сразу пачку (одна запись на бакет)."""
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    if not values:
+        return
+
+    buckets = HISTOGRAMS[name][1]
+    series = _labels(labels)
+    amounts = {}
+    for value in values:
+        # Индекс len(buckets) — бакет +Inf
+        bucket = bisect.bisect_left(buckets, value)
+        key = KEY.format(name=f"{name}_bucket", labels=f"{series}|{bucket}")
+        amounts[key] = amounts.get(key, 0) + 1
+    amounts[KEY.format(name=f"{name}_count", labels=series)] = len(values)
+    amounts[KEY.format(name=f"{name}_sum", labels=series)] = int(sum(values) * SUM_SCALE)
+    _incr_many(amounts)
+
+
+def outbox_gauges() -> dict:
+    """Глубина очереди и отставание — из кэша, из БД не чаще раза в METRICS_GAUGE_TTL."""
+    gauges = cache.get(GAUGES_KEY)
+    if gauges is None:
+        status = OutboxEvent.StatusChoices
+        # Только неотправленные статусы — по индексу, без прохода по миллионам SENT
+        row = OutboxEvent.objects.filter(
+            status__in=[status.PENDING, status.IN_FLIGHT, status.FAILED]
+        ).aggregate(
+            pending=Count("id", filter=Q(status=status.PENDING)),
+            in_flight=Count("id", filter=Q(status=status.IN_FLIGHT)),
+            failed=Count("id", filter=Q(status=status.FAILED)),
+            oldest=Min("created_at", filter=Q(status=status.PENDING)),
+        )
+        oldest = row.pop("oldest")
+        row["oldest_pending_age"] = (
+            (timezone.now() - oldest).total_seconds() if oldest is not None else 0
+        )
+        gauges = row
+        cache.set(GAUGES_KEY, gauges, timeout=settings.METRICS_GAUGE_TTL)
+    return gauges
+
+
+def _sample(name: str, labels: str, value) -> str:
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+def render() -> str:
+    """Текстовый формат экспозиции Prometheus."""
+    lines = []
+
+    gauges = outbox_gauges()
+    lines += [
+        "# HELP outbox_events Неотправленные события Outbox по статусу",
+        "# TYPE outbox_events gauge",
+    ]
+    for state in ("pending", "in_flight", "failed"):
+        lines.append(_sample("outbox_events", f'status="{state}"', gauges[state]))
+    lines += [
+        "# HELP outbox_oldest_pending_age_seconds Возраст самого старого PENDING-события",
+        "# TYPE outbox_oldest_pending_age_seconds gauge",
+        _sample("outbox_oldest_pending_age_seconds", "", round(gauges["oldest_pending_age"], 3)),
+    ]
+
+    keys = []
+    for name, (_, series) in COUNTERS.items():
+        keys += [KEY.format(name=name, labels=_labels(labels)) for labels in series]
+    for name, (_, buckets, series) in HISTOGRAMS.items():
+        for labels in series:
+            labels = _labels(labels)
+            keys += [
+                KEY.format(name=f"{name}_bucket", labels=f"{labels}|{i}")
+                for i in range(len(buckets) + 1)
+            ]
+            keys += [
+                KEY.format(name=f"{name}_count", labels=labels),
+                KEY.format(name=f"{name}_sum", labels=labels),
+            ]
+    # Все ряды — одним MGET
+    values = cache.get_many(keys)
+
+    for name, (help_text, series) in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for labels in series:
+            labels = _labels(labels)
+            value = values.get(KEY.format(name=name, labels=labels), 0)
+            lines.append(_sample(name, labels, value))
+
+    for name, (help_text, buckets, series) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels in series:
+            labels = _labels(labels)
+            cumulative = 0
+            for i, bound in enumerate([*buckets, "+Inf"]):
+                key = KEY.format(name=f"{name}_bucket", labels=f"{labels}|{i}")
+                cumulative += values.get(key, 0)
+                le = ",".join(filter(None, [labels, f'le="{bound}"']))
+                lines.append(_sample(f"{name}_bucket", le, cumulative))
+            total = values.get(KEY.format(name=f"{name}_sum", labels=labels), 0) / SUM_SCALE
+            lines.append(_sample(f"{name}_sum", labels, total))
+            count = values.get(KEY.format(name=f"{name}_count", labels=labels), 0)
+            lines.append(_sample(f"{name}_count", labels, count))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.6 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    MonthlyRollup = apps.get_model('finance', 'MonthlyRollup')
+    sources = [
+        (apps.get_model('finance', 'Sale'), 'sales', 'salesman_id', 'sale_amount'),
+        (apps.get_model('finance', 'Presentation'), 'presentations', 'presenter_id', 'group_sales_total'),
+    ]
+
+    rollups = []
+    for model, kind, user_attr, amount_attr in sources:
+        rows = (
+            model.objects.annotate(month=TruncMonth('created_at'))
+            .values(user_attr, 'month')
+            .annotate(total=Sum(amount_attr), count=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            rollups.append(MonthlyRollup(
+                user_id=row[user_attr],
+                month=row['month'].date().replace(day=1),
+                kind=kind,
+                total=row['total'],
+                count=row['count'],
+            ))
+
+    MonthlyRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_alter_sale_transfer_amount_rub'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('kind', models.CharField(choices=[('sales', 'Sales'), ('presentations', 'Presentations')], max_length=13)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'month', 'kind'), name='unique_monthly_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 6.0.6 on 2026-10-18 11:20
+
+import datetime
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+# Шкалы, которые раньше были зашиты в HomePageView._get_bonus_percent.
+# min_total — нижняя граница ступени включительно. У продаж верхняя граница
+# 1 000 000 входила в ступень 2.75%, поэтому 3.00% начинается с 1 000 000.01.
+INITIAL_TIERS = {
+    'sales': [
+        ('0.00', '1.85'),
+        ('250000.00', '2.00'),
+        ('600000.00', '2.35'),
+        ('800000.00', '2.75'),
+        ('1000000.01', '3.00'),
+    ],
+    'presentations': [
+        ('0.00', '2.50'),
+        ('1000000.00', '2.75'),
+        ('1350000.00', '3.15'),
+        ('1500000.00', '3.35'),
+        ('2000000.00', '3.50'),
+    ],
+}
+
+
+def seed_initial_tiers(apps, schema_editor):
+    BonusTierTable = apps.get_model('finance', 'BonusTierTable')
+    BonusTier = apps.get_model('finance', 'BonusTier')
+
+    for kind, tiers in INITIAL_TIERS.items():
+        table = BonusTierTable.objects.create(
+            kind=kind, version=1, effective_from=datetime.date(2000, 1, 1)
+        )
+        BonusTier.objects.bulk_create([
+            BonusTier(table=table, min_total=Decimal(min_total), percent=Decimal(percent))
+            for min_total, percent in tiers
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BonusTierTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sales', 'Sales'), ('presentations', 'Presentations')], max_length=13)),
+                ('version', models.PositiveIntegerField()),
+                ('effective_from', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['kind', '-effective_from'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'version'), name='unique_bonus_tier_table_version')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BonusTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_total', models.DecimalField(decimal_places=2, max_digits=14, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='finance.bonustiertable')),
+            ],
+            options={
+                'ordering': ['min_total'],
+                'constraints': [models.UniqueConstraint(fields=('table', 'min_total'), name='unique_bonus_tier_threshold')],
+            },
+        ),
+        migrations.RunPython(seed_initial_tiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.6 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_bonustiertable_bonustier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('user_count', models.PositiveIntegerField(default=0)),
+                ('csv_file', models.FileField(blank=True, upload_to='payroll/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-month', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sales_total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('sales_tier', models.PositiveSmallIntegerField()),
+                ('sales_percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('sales_bonus', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('presentations_total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('presentations_tier', models.PositiveSmallIntegerField()),
+                ('presentations_percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('presentations_bonus', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('base_salary', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('total_pay', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_lines', to=settings.AUTH_USER_MODEL)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='finance.payrollrun')),
+            ],
+            options={
+                'ordering': ['user_id'],
+                'constraints': [models.UniqueConstraint(fields=('run', 'user'), name='unique_payroll_line')],
+            },
+        ),
+    ]
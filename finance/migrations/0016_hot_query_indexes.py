@@ -0,0 +1,47 @@
+# Generated by Django 6.0.6 on 2026-10-18 11:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+from finance.operations import ConcurrentAddIndex
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY (Postgres) не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('finance', '0015_payrollrun_payrollline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        ConcurrentAddIndex(
+            model_name='comment',
+            index=models.Index(fields=['sale', '-created_at', '-id'], name='comment_sale_created_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['status', 'created_at'], name='outbox_status_created_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='outbox_pending_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='presentation',
+            index=models.Index(fields=['presenter', '-created_at', '-id'], name='presentation_presenter_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='presentationcomment',
+            index=models.Index(fields=['presentation', '-created_at', '-id'], name='prescomment_pres_created_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='sale',
+            index=models.Index(fields=['salesman', '-created_at', '-id'], name='sale_salesman_created_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='sale',
+            index=models.Index(fields=['salesman', 'payment_type', '-created_at'], name='sale_salesman_payment_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0.6 on 2026-10-18 11:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_partner_rates(apps, schema_editor):
+    Sale = apps.get_model('finance', 'Sale')
+    PartnerRate = apps.get_model('finance', 'PartnerRate')
+
+    # Идем от старых переводов к новым: в словаре остается последний по каждому партнеру
+    latest = {}
+    transfers = (
+        Sale.objects.filter(payment_type='TR')
+        .order_by('created_at', 'id')
+        .values_list('salesman_id', 'partner_name', 'client_rate', 'partner_rate', 'created_at')
+    )
+    for user_id, partner_name, client_rate, partner_rate, created_at in transfers.iterator():
+        latest[(user_id, partner_name or '')] = (client_rate, partner_rate, created_at)
+
+    PartnerRate.objects.bulk_create(
+        [
+            PartnerRate(
+                user_id=user_id,
+                partner_name=partner_name,
+                client_rate=client_rate,
+                partner_rate=partner_rate,
+                used_at=used_at,
+            )
+            for (user_id, partner_name), (client_rate, partner_rate, used_at) in latest.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0016_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partner_name', models.CharField(blank=True, default='', max_length=100)),
+                ('client_rate', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('partner_rate', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('used_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partner_rates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-used_at'],
+                'indexes': [models.Index(fields=['user', '-used_at'], name='partner_rate_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'partner_name'), name='unique_partner_rate')],
+            },
+        ),
+        migrations.RunPython(backfill_partner_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.6 on 2026-10-18 11:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from finance.operations import ConcurrentAddIndex, ConcurrentRemoveIndex
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY (Postgres) не работают внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('finance', '0018_outbox_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        ConcurrentAddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at'], name='outbox_due_idx'),
+        ),
+        # Старый индекс опроса убираем, только когда новый уже построен, и тоже
+        # без ACCESS EXCLUSIVE на таблицу: в нее все это время пишут продажи
+        ConcurrentRemoveIndex(
+            model_name='outboxevent',
+            name='outbox_pending_idx',
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Канал — finance.outbox.NOTIFY_CHANNEL (строкой: миграция не должна зависеть от кода)
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION finance_outbox_notify() RETURNS trigger AS $$
+BEGIN
+    -- Одно уведомление на INSERT-запрос (bulk_create тоже): Postgres склеивает
+    -- одинаковые NOTIFY в транзакции и доставляет их только после COMMIT
+    PERFORM pg_notify('finance_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER finance_outbox_notify
+AFTER INSERT ON finance_outboxevent
+FOR EACH STATEMENT EXECUTE FUNCTION finance_outbox_notify();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS finance_outbox_notify ON finance_outboxevent;
+DROP FUNCTION IF EXISTS finance_outbox_notify();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    # LISTEN/NOTIFY есть только в Postgres; на SQLite диспетчер просто опрашивает очередь
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0019_outbox_retry_backoff'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,26 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+
+
+class OwnerScopedMixin(LoginRequiredMixin):
+    """Объект ищется сразу среди записей текущего пользователя.
+
+    Один SELECT — и поиск, и проверка прав (вместо get_object() в test_func и еще
+    раз во вьюхе). Только если не нашли, выясняем почему: чужая запись — 403,
+    как раньше с UserPassesTestMixin, а несуществующая — 404.
+    """
+
+    owner_field = None
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**{self.owner_field: self.request.user})
+
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            pk = self.kwargs.get(self.pk_url_kwarg)
+            if pk is not None and self.model._default_manager.filter(pk=pk).exists():
+                raise PermissionDenied
+            raise
@@ -1,8 +1,9 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal, ROUND_HALF_EVEN
 from django.urls import reverse
+from django.utils import timezone
 
 
 class Sale(models.Model):
@@ -57,11 +58,24 @@ class Sale(models.Model):
             # 4. Вычитаем комиссию
             self.sale_amount -= fee
 
-        # 5. Передаем работу стандартному методу Django для сохранения в БД
-        super().save(*args, **kwargs)
+        # 5. Передаем работу стандартному методу Django для сохранения в БД.
+        # atomic — чтобы запись и пересчет MonthlyRollup (сигналы) прошли вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Дашборд и keyset-пагинация: WHERE salesman ORDER BY created_at DESC, id DESC
+            models.Index(
+                fields=["salesman", "-created_at", "-id"], name="sale_salesman_created_idx"
+            ),
+            # Последний перевод агента (липкие поля формы продажи)
+            models.Index(
+                fields=["salesman", "payment_type", "-created_at"],
+                name="sale_salesman_payment_idx",
+            ),
+        ]
 
     def get_absolute_url(self):
         return reverse("sale_detail", kwargs={"pk": self.pk})
@@ -73,6 +87,7 @@ class Sale(models.Model):
 class OutboxEvent(models.Model):
     class StatusChoices(models.TextChoices):
         PENDING = "pending", "Pending"
+        IN_FLIGHT = "in_flight", "In flight"
         SENT = "sent", "Sent"
         FAILED = "failed", "Failed"
 
@@ -80,11 +95,30 @@ class OutboxEvent(models.Model):
     status = models.CharField(
         max_length=10, choices=StatusChoices.choices, default=StatusChoices.PENDING
     )
+    # Аренда события воркером (finance/outbox.py: claim): кто взял и до какого момента.
+    # Воркер умер посреди отправки — после lease_expires_at событие заберет другой
+    claimed_by = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    # Повторы с экспоненциальной паузой: после OUTBOX_MAX_ATTEMPTS неудач — FAILED
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Ночная чистка: status = SENT AND created_at < cutoff
+            models.Index(fields=["status", "created_at"], name="outbox_status_created_idx"),
+            # Диспетчер (NOTIFY + страховочный проход) и ближайший повтор: только PENDING,
+            # чье время повтора уже наступило
+            models.Index(
+                fields=["next_attempt_at"],
+                name="outbox_due_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -97,6 +131,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Подзапрос «последний комментарий» в строках дашборда
+            models.Index(fields=["sale", "-created_at", "-id"], name="comment_sale_created_idx"),
+        ]
 
     def __str__(self):
         return self.comment
@@ -118,8 +156,19 @@ class Presentation(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        # Как и у Sale: сохранение + пересчет MonthlyRollup одной транзакцией
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["presenter", "-created_at", "-id"],
+                name="presentation_presenter_idx",
+            ),
+        ]
 
     def get_absolute_url(self):
         return reverse("presentation_detail", kwargs={"pk": self.pk})
@@ -142,9 +191,166 @@ class PresentationComment(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(
+                fields=["presentation", "-created_at", "-id"],
+                name="prescomment_pres_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.comment
 
     def get_absolute_url(self):
         return reverse("presentation_detail", kwargs={"pk": self.presentation.pk})
+
+
+class MonthlyRollup(models.Model):
+    """Агрегат сумм за месяц по пользователю — дашборд читает одну строку вместо SUM().
+
+    Поддерживается сигналами save/delete Sale и Presentation. QuerySet.update(),
+    bulk_create и сырой SQL их не шлют — после таких правок нужен rebuild_rollups.
+    """
+
+    class KindChoices(models.TextChoices):
+        SALES = "sales", "Sales"
+        PRESENTATIONS = "presentations", "Presentations"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="monthly_rollups"
+    )
+    # Всегда первое число месяца
+    month = models.DateField()
+    kind = models.CharField(max_length=13, choices=KindChoices.choices)
+
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "month", "kind"], name="unique_monthly_rollup"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.month:%Y-%m} {self.kind}: {self.total}"
+
+
+class BonusTierTable(models.Model):
+    """Версия шкалы бонусов (продажи или презентации), действующая с effective_from."""
+
+    kind = models.CharField(max_length=13, choices=MonthlyRollup.KindChoices.choices)
+    version = models.PositiveIntegerField()
+    effective_from = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["kind", "-effective_from"]
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "version"], name="unique_bonus_tier_table_version"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} v{self.version} (с {self.effective_from})"
+
+
+class BonusTier(models.Model):
+    table = models.ForeignKey(BonusTierTable, on_delete=models.CASCADE, related_name="tiers")
+    # Нижняя граница ступени (включительно): total >= min_total
+    min_total = models.DecimalField(
+        max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal("0.00"))]
+    )
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        ordering = ["min_total"]
+        constraints = [
+            models.UniqueConstraint(fields=["table", "min_total"], name="unique_bonus_tier_threshold"),
+        ]
+
+    def __str__(self) -> str:
+        return f"от {self.min_total}: {self.percent}%"
+
+
+class PayrollRun(models.Model):
+    """Снимок расчета зарплат и бонусов всех сотрудников за месяц."""
+
+    class StatusChoices(models.TextChoices):
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    # Всегда первое число месяца
+    month = models.DateField()
+    status = models.CharField(
+        max_length=10, choices=StatusChoices.choices, default=StatusChoices.RUNNING
+    )
+    user_count = models.PositiveIntegerField(default=0)
+    csv_file = models.FileField(upload_to="payroll/", blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-month", "-created_at"]
+
+    def __str__(self) -> str:
+        return f"Payroll {self.month:%Y-%m} ({self.status})"
+
+
+class PayrollLine(models.Model):
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name="lines")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payroll_lines"
+    )
+
+    sales_total = models.DecimalField(max_digits=16, decimal_places=2)
+    sales_tier = models.PositiveSmallIntegerField()
+    sales_percent = models.DecimalField(max_digits=5, decimal_places=2)
+    sales_bonus = models.DecimalField(max_digits=14, decimal_places=2)
+
+    presentations_total = models.DecimalField(max_digits=16, decimal_places=2)
+    presentations_tier = models.PositiveSmallIntegerField()
+    presentations_percent = models.DecimalField(max_digits=5, decimal_places=2)
+    presentations_bonus = models.DecimalField(max_digits=14, decimal_places=2)
+
+    base_salary = models.DecimalField(max_digits=8, decimal_places=2)
+    total_pay = models.DecimalField(max_digits=16, decimal_places=2)
+
+    class Meta:
+        ordering = ["user_id"]
+        constraints = [
+            models.UniqueConstraint(fields=["run", "user"], name="unique_payroll_line"),
+        ]
+
+
+class PartnerRate(models.Model):
+    """Последние курсы агента по каждому обменнику — «липкие» поля формы продажи.
+
+    Самая свежая строка (по used_at) — значения по умолчанию для новой продажи,
+    остальные — подсказки при выборе партнера. Пишется в SaleCreateView.form_valid.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="partner_rates"
+    )
+    partner_name = models.CharField(max_length=100, blank=True, default="")
+    client_rate = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
+    partner_rate = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
+    used_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-used_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "partner_name"], name="unique_partner_rate"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-used_at"], name="partner_rate_recent_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.partner_name}: {self.client_rate} / {self.partner_rate}"
@@ -0,0 +1,71 @@
+from django.db import NotSupportedError
+from django.db.migrations.operations import AddIndex, RemoveIndex
+
+
+class _ConcurrentlyMixin:
+    def _concurrently(self, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return False
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                f"{type(self).__name__} нельзя выполнять в транзакции: задайте atomic = False."
+            )
+        return True
+
+
+class ConcurrentAddIndex(_ConcurrentlyMixin, AddIndex):
+    """AddIndex, который на Postgres строит индекс CONCURRENTLY — без блокировки записи
+    в таблицу на время деплоя. На остальных БД (SQLite в тестах) — обычный CREATE INDEX.
+
+    Миграция с этой операцией должна быть atomic = False: CONCURRENTLY не работает
+    внутри транзакции. Если сборка упала, Postgres оставит INVALID-индекс —
+    его нужно удалить руками перед повторным migrate.
+    """
+
+    def describe(self):
+        return f"Concurrently create index {self.index.name} on {self.model_name}"
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._concurrently(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._concurrently(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class ConcurrentRemoveIndex(_ConcurrentlyMixin, RemoveIndex):
+    """RemoveIndex через DROP INDEX CONCURRENTLY на Postgres: обычный DROP INDEX берет
+    ACCESS EXCLUSIVE на таблицу и ждет все текущие запросы к ней. Тоже atomic = False.
+    """
+
+    def describe(self):
+        return f"Concurrently remove index {self.name} from {self.model_name}"
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._concurrently(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            from_model_state = from_state.models[app_label, self.model_name_lower]
+            index = from_model_state.get_index_by_name(self.name)
+            schema_editor.remove_index(model, index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._concurrently(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            to_model_state = to_state.models[app_label, self.model_name_lower]
+            index = to_model_state.get_index_by_name(self.name)
+            schema_editor.add_index(model, index, concurrently=True)
@@ -0,0 +1,391 @@
+import logging
+import os
+import random
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import metrics
+from .balance_cache import evict_balance
+from .models import OutboxEvent
+from .transfer_client import CircuitOpenError, TransferServiceError, get_client
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres NOTIFY: триггер на вставку в OutboxEvent (миграция 0020) будит
+# run_outbox_dispatcher. Меняется только вместе с триггером
+NOTIFY_CHANNEL = "finance_outbox"
+
+# Доставка Outbox в FastAPI пачками: один POST на OUTBOX_BATCH_SIZE событий
+# и один UPDATE на все подтвержденные, вместо SELECT + POST + UPDATE на каждое.
+#
+# Перед отправкой событие арендуется (claim): PENDING -> IN_FLIGHT с именем воркера
+# и сроком аренды. on_commit-таска, beat и сколько угодно Celery-воркеров
+# не отправят одно событие дважды.
+#
+# Неудача не крутит событие каждые 5 сек: attempts + 1 и следующая попытка через
+# OUTBOX_RETRY_BASE_DELAY * 2^(attempts-1) (с разбросом, не больше MAX_DELAY).
+# После OUTBOX_MAX_ATTEMPTS событие уходит в FAILED — вернуть можно из админки.
+
+
+def worker_id() -> str:
+    # Считаем при каждом вызове: после fork (prefork Celery) pid другой
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable(now):
+    # Свободные, чье время пришло + брошенные: аренда истекла, а воркер не отчитался
+    return Q(status=OutboxEvent.StatusChoices.PENDING, next_attempt_at__lte=now) | Q(
+        status=OutboxEvent.StatusChoices.IN_FLIGHT, lease_expires_at__lt=now
+    )
+
+
+def claim(limit: int, event_ids: list = None) -> list:
+    """Атомарно арендует до `limit` событий за текущим воркером и возвращает их.
+
+    Postgres: SELECT ... FOR UPDATE SKIP LOCKED — параллельные воркеры берут
+    разные строки, не дожидаясь друг друга. SQLite (без SKIP LOCKED): UPDATE
+    с тем же условием работает как compare-and-swap, а наши строки потом
+    находим по воркеру и сроку аренды.
+    """
+    now = timezone.now()
+    worker = worker_id()
+    lease = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+
+    candidates = OutboxEvent.objects.filter(_claimable(now)).order_by("next_attempt_at", "id")
+    if event_ids is not None:
+        candidates = candidates.filter(id__in=event_ids)
+
+    claimed = {
+        "status": OutboxEvent.StatusChoices.IN_FLIGHT,
+        "claimed_by": worker,
+        "lease_expires_at": lease,
+        "updated_at": now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            events = list(candidates.select_for_update(skip_locked=True)[:limit])
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(**claimed)
+        for event in events:
+            for field, value in claimed.items():
+                setattr(event, field, value)
+        return events
+
+    ids = list(candidates.values_list("id", flat=True)[:limit])
+    OutboxEvent.objects.filter(_claimable(now), id__in=ids).update(**claimed)
+    return list(
+        OutboxEvent.objects.filter(
+            id__in=ids,
+            status=OutboxEvent.StatusChoices.IN_FLIGHT,
+            claimed_by=worker,
+            lease_expires_at=lease,
+        ).order_by("next_attempt_at", "id")
+    )
+
+
+def _still_ours(events: list):
+    """Из событий — только те, что все еще за нами: тот же воркер и та же аренда.
+
+    Пока шла отправка, аренда могла истечь, а событие — уйти другому воркеру.
+    Итог доставки пишем только через этот фильтр, иначе опоздавший воркер
+    перетрет результат нового владельца (вернет SENT в PENDING, сожжет попытку).
+    """
+    return OutboxEvent.objects.filter(
+        id__in=[event.id for event in events],
+        status=OutboxEvent.StatusChoices.IN_FLIGHT,
+        claimed_by=worker_id(),
+        lease_expires_at__in={event.lease_expires_at for event in events},
+    )
+
+
+def _log_stale(events: list, updated: int, what: str):
+    if updated < len(events):
+        logger.warning(
+            "Outbox: аренда %s из %s событий истекла до отчета (%s) — итог за новым владельцем",
+            len(events) - updated, len(events), what,
+        )
+
+
+def release(events: list, retry_in: float = 0) -> int:
+    """Возвращает события в очередь, не тратя попытку (до отправки дело не дошло).
+
+    Возвращает, сколько событий реально вернули (чужие аренды не трогаем).
+    """
+    if not events:
+        return 0
+    now = timezone.now()
+    released = _still_ours(events).update(
+        status=OutboxEvent.StatusChoices.PENDING,
+        claimed_by="",
+        lease_expires_at=None,
+        next_attempt_at=now + timedelta(seconds=retry_in),
+        updated_at=now,
+    )
+    _log_stale(events, released, "release")
+    return released
+
+
+def backoff_delay(attempts: int) -> float:
+    """Пауза перед попыткой номер attempts + 1: экспонента с разбросом 50–100%.
+
+    Разброс нужен, чтобы события, упавшие вместе (FastAPI лежал), не вернулись
+    туда же одной волной.
+    """
+    delay = min(
+        settings.OUTBOX_RETRY_MAX_DELAY,
+        settings.OUTBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def retry_later(events: list, errors, outcome: str = "error"):
+    """Засчитывает неудачную попытку: пауза по backoff_delay или FAILED.
+
+    errors — общий текст ошибки или {event_id: текст}. outcome — исход для метрик:
+    error (ошибка запроса) или rejected (FastAPI отказал).
+
+    События группируются по (попытки, ошибка), на группу — один условный UPDATE
+    только по еще нашим арендам (_still_ours). Пауза тоже одна на группу:
+    события одной пачки и так уходят одним POST.
+    """
+    if not events:
+        return
+    now = timezone.now()
+    groups = {}
+    for event in events:
+        error = errors if isinstance(errors, str) else errors[event.id]
+        groups.setdefault((event.attempts + 1, error), []).append(event)
+
+    retried = dead = 0
+    for (attempts, error), group in groups.items():
+        fields = {
+            "attempts": attempts,
+            "last_error": error,
+            "claimed_by": "",
+            "lease_expires_at": None,
+            "updated_at": now,
+        }
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            fields["status"] = OutboxEvent.StatusChoices.FAILED
+        else:
+            fields["status"] = OutboxEvent.StatusChoices.PENDING
+            fields["next_attempt_at"] = now + timedelta(seconds=backoff_delay(attempts))
+
+        updated = _still_ours(group).update(**fields)
+        _log_stale(group, updated, "retry")
+        if fields["status"] == OutboxEvent.StatusChoices.FAILED:
+            dead += updated
+            if updated:
+                logger.error(
+                    "Outbox-события %s не доставлены за %s попыток, FAILED: %s",
+                    [event.id for event in group], attempts, error,
+                )
+        else:
+            retried += updated
+
+    # Попытка, после которой событие ушло в FAILED, считается как failed
+    metrics.inc("outbox_delivery_attempts_total", retried, outcome=outcome)
+    metrics.inc("outbox_delivery_attempts_total", dead, outcome="failed")
+
+
+def webhook_payload(event: OutboxEvent) -> dict:
+    data = event.payload.copy()
+    data["event_id"] = event.id
+    return data
+
+
+def mark_sent(events: list):
+    """Одним UPDATE помечает события отправленными и сбрасывает балансы их агентов.
+
+    Помечаем только еще наши аренды (_still_ours): перехваченное событие отчитает
+    его новый владелец.
+    """
+    if not events:
+        return
+    now = timezone.now()
+    updated = _still_ours(events).update(
+        status=OutboxEvent.StatusChoices.SENT,
+        lease_expires_at=None,
+        last_error="",
+        updated_at=now,
+    )
+    if updated < len(events):
+        _log_stale(events, updated, "sent")
+        # Какие именно наши — по отметке этого UPDATE (claimed_by он не сбрасывает)
+        ours = set(
+            OutboxEvent.objects.filter(
+                id__in=[event.id for event in events],
+                status=OutboxEvent.StatusChoices.SENT,
+                claimed_by=worker_id(),
+                updated_at=now,
+            ).values_list("id", flat=True)
+        )
+        events = [event for event in events if event.id in ours]
+        if not events:
+            return
+    metrics.inc("outbox_delivery_attempts_total", len(events), outcome="sent")
+    metrics.observe(
+        "outbox_commit_to_sent_seconds",
+        [(now - event.created_at).total_seconds() for event in events],
+    )
+    # Продажи долетели до FastAPI — закэшированные балансы агентов устарели
+    for salesman_id in {event.payload.get("salesman_id") for event in events}:
+        evict_balance(salesman_id)
+
+
+def release_circuit_open(events: list):
+    """Предохранитель открыт: возвращаем события до его пробы, попытку не тратим."""
+    released = release(events, retry_in=settings.TRANSFER_CIRCUIT_RESET_TIMEOUT)
+    metrics.inc("outbox_delivery_attempts_total", released, outcome="circuit_open")
+
+
+def deliver_one(event: OutboxEvent) -> bool:
+    """Отправляет уже арендованное событие отдельным запросом.
+
+    Открытый предохранитель — не ошибка события: оно возвращается в очередь,
+    а CircuitOpenError летит вызывающему, чтобы тот не брался за следующие.
+    """
+    started = time.monotonic()
+    try:
+        get_client().send_webhook(webhook_payload(event))
+    except CircuitOpenError:
+        release_circuit_open([event])
+        raise
+    except TransferServiceError as e:
+        metrics.observe("outbox_webhook_seconds", time.monotonic() - started, mode="single")
+        logger.warning("Outbox-событие %s: FastAPI не принял данные: %s", event.id, e)
+        retry_later([event], str(e))
+        return False
+
+    metrics.observe("outbox_webhook_seconds", time.monotonic() - started, mode="single")
+
+    mark_sent([event])
+    return True
+
+
+def deliver_batch(limit: int = None) -> tuple:
+    """Арендует до `limit` событий и отправляет их одним запросом. Возвращает (взято, доставлено)."""
+    limit = limit or settings.OUTBOX_BATCH_SIZE
+    events = claim(limit)
+    if not events:
+        return 0, 0
+
+    started = time.monotonic()
+    try:
+        acks = get_client().send_webhook_batch([webhook_payload(event) for event in events])
+    except CircuitOpenError:
+        # FastAPI недавно падал — попытку не тратим, ждем пробы предохранителя
+        release_circuit_open(events)
+        return len(events), 0
+    except TransferServiceError as e:
+        metrics.observe("outbox_webhook_seconds", time.monotonic() - started, mode="bulk")
+        logger.warning("Пачка Outbox из %s событий не доставлена: %s", len(events), e)
+        retry_later(events, str(e))
+        return len(events), 0
+
+    metrics.observe("outbox_webhook_seconds", time.monotonic() - started, mode="bulk")
+
+    sent = [event for event in events if event.id in acks and acks[event.id] is None]
+    sent_ids = {event.id for event in sent}
+    failed = [event for event in events if event.id not in sent_ids]
+    if failed:
+        logger.warning("FastAPI не подтвердил %s событий из %s", len(failed), len(events))
+
+    mark_sent(sent)
+    retry_later(
+        failed,
+        {event.id: acks.get(event.id) or "нет подтверждения" for event in failed},
+        outcome="rejected",
+    )
+    return len(events), len(sent)
+
+
+def process_due() -> int:
+    """Доставляет все события, чье время пришло: пачками или по одному (OUTBOX_BULK_WEBHOOK)."""
+    if settings.OUTBOX_BULK_WEBHOOK:
+        # Пачками по OUTBOX_BATCH_SIZE: после простоя очередь разгребается за секунды
+        return drain()
+
+    delivered = 0
+    while True:
+        # По одной аренде на отправку. Пачка под одной арендой на медленном FastAPI
+        # (connect + read timeout на каждое событие) пережила бы OUTBOX_LEASE_SECONDS,
+        # и хвост пачки забрал бы и отправил второй раз другой воркер
+        events = claim(1)
+        if not events:
+            return delivered
+        try:
+            delivered += deliver_one(events[0])
+        except CircuitOpenError:
+            # Событие вернулось в очередь; до пробы предохранителя остальные не трогаем
+            return delivered
+        # Неудачные ушли на паузу (backoff) и в следующий claim не попадут
+
+
+def seconds_until_due():
+    """Через сколько сек наступит ближайший повтор (None — очередь пуста). По outbox_due_idx."""
+    next_at = (
+        OutboxEvent.objects.filter(status=OutboxEvent.StatusChoices.PENDING)
+        .order_by("next_attempt_at")
+        .values_list("next_attempt_at", flat=True)
+        .first()
+    )
+    if next_at is None:
+        return None
+    return max(0.0, (next_at - timezone.now()).total_seconds())
+
+
+def drain(limit: int = None) -> int:
+    """Гоняет пачки, пока очередь не опустеет (или FastAPI не начнет отказывать)."""
+    limit = limit or settings.OUTBOX_BATCH_SIZE
+    total = 0
+    while True:
+        taken, sent = deliver_batch(limit)
+        total += sent
+        # Неполная пачка — очередь кончилась; недоставленные — ждем следующего прохода beat
+        if taken < limit or sent < taken:
+            return total
+
+
+def cleanup_sent(days_to_keep: int, chunk_size: int = None, time_budget: float = None) -> tuple:
+    """Удаляет SENT старше days_to_keep окнами по id, каждое — своей короткой транзакцией.
+
+    Один DELETE на всю историю — долгая транзакция, раздутый WAL и блокировки
+    рядом со вставками новых событий. Окнами по первичному ключу каждый DELETE
+    трогает не больше chunk_size строк. Не уложились в time_budget — выходим,
+    остальное доберет следующий запуск. Возвращает (удалено, дочистили ли).
+    """
+    chunk_size = chunk_size or settings.OUTBOX_CLEANUP_CHUNK_SIZE
+    time_budget = time_budget or settings.OUTBOX_CLEANUP_TIME_BUDGET
+    cutoff = timezone.now() - timedelta(days=days_to_keep)
+
+    old_sent = OutboxEvent.objects.filter(
+        status=OutboxEvent.StatusChoices.SENT, created_at__lt=cutoff
+    )
+    # Границы — один раз, по outbox_status_created_idx
+    bounds = old_sent.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return 0, True
+
+    deadline = time.monotonic() + time_budget
+    deleted = 0
+    low = bounds["low"]
+    while low <= bounds["high"]:
+        if time.monotonic() >= deadline:
+            return deleted, False
+        count, _ = old_sent.filter(id__gte=low, id__lt=low + chunk_size).delete()
+        deleted += count
+        metrics.inc("outbox_cleanup_deleted_total", count)
+        low += chunk_size
+        if not count:
+            # Пустое окно — дыра в id (в середине остались PENDING/FAILED): перепрыгиваем
+            low = old_sent.filter(id__gte=low).aggregate(low=Min("id"))["low"]
+            if low is None:
+                break
+    return deleted, True
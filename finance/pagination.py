@@ -0,0 +1,92 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    """Страница курсорной пагинации. Общего количества записей нет — и COUNT(*) тоже."""
+
+    object_list: list = field(default_factory=list)
+    has_next: bool = False
+    has_previous: bool = False
+    next_cursor: str = ""
+    previous_cursor: str = ""
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(obj, direction: str) -> str:
+    """Непрозрачный токен: направление + ключ (created_at, id) граничной записи."""
+    raw = json.dumps([direction, obj.created_at.isoformat(), obj.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        direction, created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+def paginate_keyset(queryset, token: str, per_page: int) -> KeysetPage:
+    """Keyset-пагинация по (created_at, id) в порядке Meta.ordering = ["-created_at"].
+
+    Фильтр строится по ключу граничной записи, поэтому цена любой страницы —
+    один индексный проход на per_page + 1 строк, без OFFSET и COUNT(*).
+    """
+    direction, created_at, pk = decode_cursor(token) if token else ("next", None, None)
+
+    if created_at is None:
+        rows = list(queryset.order_by("-created_at", "-id")[: per_page + 1])
+        has_previous = False
+    elif direction == "next":
+        rows = list(
+            queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by("-created_at", "-id")[: per_page + 1]
+        )
+        has_previous = True
+    else:
+        rows = list(
+            queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by("created_at", "id")[: per_page + 1]
+        )
+        # Лишняя строка назад означает, что есть страницы еще новее
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        page = KeysetPage(object_list=rows, has_next=True, has_previous=has_previous)
+        return _with_cursors(page)
+
+    page = KeysetPage(
+        object_list=rows[:per_page],
+        has_next=len(rows) > per_page,
+        has_previous=has_previous,
+    )
+    return _with_cursors(page)
+
+
+def _with_cursors(page: KeysetPage) -> KeysetPage:
+    if page.object_list:
+        if page.has_next:
+            page.next_cursor = encode_cursor(page.object_list[-1], "next")
+        if page.has_previous:
+            page.previous_cursor = encode_cursor(page.object_list[0], "prev")
+    return page
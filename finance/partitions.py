@@ -0,0 +1,140 @@
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+from .payroll import month_bounds
+from .rollups import month_start
+
+# Опционально (только Postgres): finance_outboxevent, секционированная по месяцам
+# created_at. Тогда чистка истории — DROP старой секции за константное время,
+# а не DELETE миллионов строк. Включается командой partition_outbox --convert.
+# Миграции об этом не знают: в их состоянии таблица обычная с PK (id), в базе —
+# секционированная с PK (id, created_at). Новые миграции на OutboxEvent — с оглядкой.
+
+TABLE = OutboxEvent._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Триггер NOTIFY из миграции 0020 удаляется вместе со старой таблицей — ставим заново
+NOTIFY_TRIGGER = (
+    f"CREATE TRIGGER finance_outbox_notify AFTER INSERT ON {TABLE} "
+    "FOR EACH STATEMENT EXECUTE FUNCTION finance_outbox_notify()"
+)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_{month:%Y_%m}"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def _create_partition(cursor, month: date):
+    start, end = month_bounds(month)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE} "
+        "FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+
+
+def ensure_partitions(months_ahead: int = 2, since: date = None) -> list:
+    """Секции с `since` (по умолчанию — с текущего месяца) и на months_ahead вперед."""
+    month = month_start(since or timezone.localdate())
+    last = add_months(month_start(timezone.localdate()), months_ahead)
+    created = []
+    with connection.cursor() as cursor:
+        while month <= last:
+            _create_partition(cursor, month)
+            created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+
+def existing_partitions() -> list:
+    """[(month, имя секции)] по именам вида finance_outboxevent_YYYY_MM, по возрастанию."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        suffix = name[len(TABLE) + 1 :]
+        try:
+            year, month = (int(part) for part in suffix.split("_"))
+        except ValueError:
+            continue  # default-секция
+        partitions.append((date(year, month, 1), name))
+    return sorted(partitions)
+
+
+def drop_partitions_before(cutoff) -> list:
+    """DROP секций, целиком старше cutoff и без неотправленных событий."""
+    dropped = []
+    for month, name in existing_partitions():
+        if month_bounds(month)[1] > cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status <> %s)", ["sent"])
+            if cursor.fetchone()[0]:
+                # Там еще висят PENDING/FAILED — такую секцию не трогаем
+                continue
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(months_ahead: int = 2):
+    """Одноразово пересоздает таблицу секционированной и переносит в нее данные.
+
+    Все под ACCESS EXCLUSIVE в одной транзакции: на время копирования вставка
+    событий ждет — запускать в окно обслуживания. Первичный ключ становится
+    (id, created_at): Postgres требует ключ секционирования в уникальных индексах.
+    """
+    legacy = f"{TABLE}_legacy"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT MIN(created_at) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        ensure_partitions(months_ahead, since=oldest)
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1)) FROM {TABLE}",
+            [TABLE],
+        )
+        cursor.execute(f"DROP TABLE {legacy}")
+
+        # Индексы из Meta (опрос, чистка) — на родителе, Postgres раздаст их секциям
+        with connection.schema_editor() as editor:
+            for index in OutboxEvent._meta.indexes:
+                editor.add_index(OutboxEvent, index)
+        cursor.execute(NOTIFY_TRIGGER)
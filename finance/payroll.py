@@ -0,0 +1,172 @@
+import csv
+import tempfile
+from datetime import date, datetime, time
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db.models import Sum
+from django.utils import timezone
+
+from .bonus import evaluate_bonuses
+from .models import MonthlyRollup, PayrollLine, PayrollRun, Presentation, Sale
+
+CSV_HEADER = [
+    "user_id",
+    "username",
+    "sales_total",
+    "sales_tier",
+    "sales_percent",
+    "sales_bonus",
+    "presentations_total",
+    "presentations_tier",
+    "presentations_percent",
+    "presentations_bonus",
+    "base_salary",
+    "total_pay",
+]
+
+
+def parse_month(value: str) -> date:
+    """'2026-09' -> date(2026, 9, 1)"""
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def previous_month(today: date = None) -> date:
+    today = today or timezone.localdate()
+    last_day = today.replace(day=1) - timezone.timedelta(days=1)
+    return last_day.replace(day=1)
+
+
+def month_bounds(month: date):
+    """[начало месяца, начало следующего) как aware datetime — индексируемый диапазон."""
+    next_month = (month.replace(day=1) + timezone.timedelta(days=32)).replace(day=1)
+    return (
+        timezone.make_aware(datetime.combine(month.replace(day=1), time.min)),
+        timezone.make_aware(datetime.combine(next_month, time.min)),
+    )
+
+
+def totals_by_user(model, user_attr: str, amount_attr: str, month: date) -> dict:
+    """Один GROUP BY на всю модель: {user_id: сумма за месяц}."""
+    start, end = month_bounds(month)
+    rows = (
+        model.objects.filter(created_at__gte=start, created_at__lt=end)
+        .values_list(user_attr)
+        .annotate(total=Sum(amount_attr))
+        .order_by()
+    )
+    return dict(rows)
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_payroll(month: date, chunk_size: int = 1000) -> PayrollRun:
+    """Считает зарплаты всех CustomUser за месяц и сохраняет снимок + CSV.
+
+    Суммы — по одному GROUP BY на Sale и Presentation (словари id -> сумма,
+    а не строки продаж). Пользователи читаются итератором и пишутся пачками.
+    """
+    month = month.replace(day=1)
+    run = PayrollRun.objects.create(month=month)
+
+    try:
+        sales = totals_by_user(Sale, "salesman", "sale_amount", month)
+        presentations = totals_by_user(
+            Presentation, "presenter", "group_sales_total", month
+        )
+
+        users = (
+            get_user_model()
+            .objects.order_by("pk")
+            .values_list("pk", "base_salary")
+            .iterator(chunk_size=chunk_size)
+        )
+
+        user_count = 0
+        for chunk in _chunked(users, chunk_size):
+            sales_bonuses = evaluate_bonuses(
+                MonthlyRollup.KindChoices.SALES,
+                ((pk, sales.get(pk)) for pk, _ in chunk),
+                on=month,
+            )
+            presentation_bonuses = evaluate_bonuses(
+                MonthlyRollup.KindChoices.PRESENTATIONS,
+                ((pk, presentations.get(pk)) for pk, _ in chunk),
+                on=month,
+            )
+
+            lines = []
+            for pk, base_salary in chunk:
+                sale_bonus = sales_bonuses[pk]
+                presentation_bonus = presentation_bonuses[pk]
+                lines.append(
+                    PayrollLine(
+                        run=run,
+                        user_id=pk,
+                        sales_total=sale_bonus.total,
+                        sales_tier=sale_bonus.tier,
+                        sales_percent=sale_bonus.percent,
+                        sales_bonus=sale_bonus.amount,
+                        presentations_total=presentation_bonus.total,
+                        presentations_tier=presentation_bonus.tier,
+                        presentations_percent=presentation_bonus.percent,
+                        presentations_bonus=presentation_bonus.amount,
+                        base_salary=base_salary,
+                        total_pay=base_salary
+                        + sale_bonus.amount
+                        + presentation_bonus.amount,
+                    )
+                )
+
+            PayrollLine.objects.bulk_create(lines)
+            user_count += len(lines)
+
+        # CSV пишем во временный файл построчно и только потом отдаем в storage
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8", newline="") as tmp:
+            write_payroll_csv(run, tmp)
+            tmp.seek(0)
+            run.csv_file.save(f"payroll-{month:%Y-%m}-{run.pk}.csv", File(tmp), save=False)
+
+        run.status = PayrollRun.StatusChoices.DONE
+        run.user_count = user_count
+    except Exception:
+        run.status = PayrollRun.StatusChoices.FAILED
+        raise
+    finally:
+        run.finished_at = timezone.now()
+        run.save()
+
+    return run
+
+
+def write_payroll_csv(run: PayrollRun, fh, chunk_size: int = 2000):
+    writer = csv.writer(fh)
+    writer.writerow(CSV_HEADER)
+
+    lines = run.lines.select_related("user").order_by("user_id")
+    for line in lines.iterator(chunk_size=chunk_size):
+        writer.writerow(
+            [
+                line.user_id,
+                line.user.username,
+                line.sales_total,
+                line.sales_tier,
+                line.sales_percent,
+                line.sales_bonus,
+                line.presentations_total,
+                line.presentations_tier,
+                line.presentations_percent,
+                line.presentations_bonus,
+                line.base_salary,
+                line.total_pay,
+            ]
+        )
@@ -0,0 +1,176 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import MonthlyRollup, Presentation, Sale
+
+# Модель -> (вид агрегата, поле владельца, поле суммы)
+ROLLUP_SOURCES = {
+    Sale: (MonthlyRollup.KindChoices.SALES, "salesman_id", "sale_amount"),
+    Presentation: (
+        MonthlyRollup.KindChoices.PRESENTATIONS,
+        "presenter_id",
+        "group_sales_total",
+    ),
+}
+
+
+def month_start(value) -> date:
+    """Первое число месяца для даты или datetime (в текущей таймзоне)."""
+    if hasattr(value, "tzinfo"):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def rollup_key(instance):
+    """(user_id, month, kind, amount) для записи Sale/Presentation."""
+    kind, user_attr, amount_attr = ROLLUP_SOURCES[type(instance)]
+    return (
+        getattr(instance, user_attr),
+        month_start(instance.created_at),
+        kind,
+        getattr(instance, amount_attr),
+    )
+
+
+def snapshot(instance):
+    """Состояние строки в БД ДО сохранения — чтобы при апдейте вычесть старую сумму."""
+    if instance.pk is None:
+        return None
+
+    kind, user_attr, amount_attr = ROLLUP_SOURCES[type(instance)]
+    row = (
+        type(instance)
+        .objects.filter(pk=instance.pk)
+        .values_list(user_attr, "created_at", amount_attr)
+        .first()
+    )
+    if row is None:
+        return None
+
+    user_id, created_at, amount = row
+    return user_id, month_start(created_at), kind, amount
+
+
+def apply_delta(user_id, month, kind, amount: Decimal, count: int):
+    """Атомарно сдвигает агрегат на (amount, count) через F()-выражения."""
+    rollups = MonthlyRollup.objects.filter(user_id=user_id, month=month, kind=kind)
+    updated = rollups.update(total=F("total") + amount, count=F("count") + count)
+
+    # Уменьшать несуществующую строку нечего (например, юзер удаляется каскадом)
+    if updated or count < 0:
+        return
+
+    try:
+        with transaction.atomic():
+            MonthlyRollup.objects.create(
+                user_id=user_id, month=month, kind=kind, total=amount, count=count
+            )
+    except IntegrityError:
+        # Параллельный запрос успел создать строку — просто докручиваем её
+        rollups.update(total=F("total") + amount, count=F("count") + count)
+
+
+def apply_save(instance, previous):
+    user_id, month, kind, amount = rollup_key(instance)
+
+    if previous is None:
+        apply_delta(user_id, month, kind, amount, 1)
+        return
+
+    old_user_id, old_month, _, old_amount = previous
+    if (old_user_id, old_month) == (user_id, month):
+        if amount != old_amount:
+            apply_delta(user_id, month, kind, amount - old_amount, 0)
+        return
+
+    # Запись переехала в другой месяц или к другому владельцу
+    apply_delta(old_user_id, old_month, kind, -old_amount, -1)
+    apply_delta(user_id, month, kind, amount, 1)
+
+
+def apply_delete(instance):
+    user_id, month, kind, amount = rollup_key(instance)
+    apply_delta(user_id, month, kind, -amount, -1)
+
+
+def get_month_total(user, kind, month=None) -> Decimal:
+    month = month or month_start(timezone.localdate())
+    total = (
+        MonthlyRollup.objects.filter(user=user, month=month, kind=kind)
+        .values_list("total", flat=True)
+        .first()
+    )
+    return total if total is not None else Decimal("0.00")
+
+
+def compute_rollups(user_ids=None):
+    """Пересчитывает агрегаты по сырым таблицам: {(user_id, month, kind): (total, count)}."""
+    result = {}
+
+    for model, (kind, user_attr, amount_attr) in ROLLUP_SOURCES.items():
+        queryset = model.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(**{f"{user_attr}__in": user_ids})
+
+        rows = (
+            queryset.annotate(month=TruncMonth("created_at"))
+            .values(user_attr, "month")
+            .annotate(total=Sum(amount_attr), count=Count("id"))
+            .order_by()
+        )
+        for row in rows:
+            key = (row[user_attr], month_start(row["month"]), kind)
+            result[key] = (row["total"], row["count"])
+
+    return result
+
+
+def stored_rollups(user_ids=None):
+    queryset = MonthlyRollup.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+
+    return {
+        (row.user_id, row.month, row.kind): (row.total, row.count)
+        for row in queryset.only("user_id", "month", "kind", "total", "count")
+    }
+
+
+def diff_rollups(user_ids=None):
+    """Список расхождений (key, ожидаемое, сохранённое) между агрегатами и сырыми данными."""
+    expected = compute_rollups(user_ids)
+    stored = stored_rollups(user_ids)
+    empty = (Decimal("0.00"), 0)
+
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys(), key=str):
+        want = expected.get(key, empty)
+        have = stored.get(key, empty)
+        if want[0] != have[0] or want[1] != have[1]:
+            mismatches.append((key, want, have))
+
+    return mismatches
+
+
+@transaction.atomic
+def rebuild_rollups(user_ids=None) -> int:
+    expected = compute_rollups(user_ids)
+
+    stale = MonthlyRollup.objects.all()
+    if user_ids is not None:
+        stale = stale.filter(user_id__in=user_ids)
+    stale.delete()
+
+    MonthlyRollup.objects.bulk_create(
+        [
+            MonthlyRollup(user_id=user_id, month=month, kind=kind, total=total, count=count)
+            for (user_id, month, kind), (total, count) in expected.items()
+        ],
+        batch_size=1000,
+    )
+    return len(expected)
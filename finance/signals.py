@@ -0,0 +1,102 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import bonus, dashboard_cache, rollups, timing
+from .models import (
+    BonusTier,
+    BonusTierTable,
+    Comment,
+    Presentation,
+    PresentationComment,
+    Sale,
+)
+
+
+# ==========================================
+# МЕСЯЧНЫЕ АГРЕГАТЫ (MonthlyRollup)
+# ==========================================
+# Sale.save / Presentation.save оборачивают сохранение в transaction.atomic,
+# поэтому pre_save -> INSERT/UPDATE -> post_save идут одной транзакцией.
+# Массовые .update() сигналы не шлют — после них нужен `manage.py rebuild_rollups`.
+
+
+@receiver(pre_save, sender=Sale)
+@receiver(pre_save, sender=Presentation)
+def remember_rollup_state(sender, instance, **kwargs):
+    instance._rollup_previous = rollups.snapshot(instance)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Presentation)
+def update_rollup_on_save(sender, instance, **kwargs):
+    rollups.apply_save(instance, getattr(instance, "_rollup_previous", None))
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Presentation)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    # Collector.delete уже работает внутри transaction.atomic
+    rollups.apply_delete(instance)
+
+
+# ==========================================
+# ШКАЛЫ БОНУСОВ (BonusTierTable / BonusTier)
+# ==========================================
+@receiver(post_save, sender=BonusTierTable)
+@receiver(post_delete, sender=BonusTierTable)
+@receiver(post_save, sender=BonusTier)
+@receiver(post_delete, sender=BonusTier)
+def invalidate_bonus_tiers(sender, **kwargs):
+    bonus.invalidate_tier_book()
+
+
+# ==========================================
+# КЭШ ФРАГМЕНТОВ ДАШБОРДА (версия данных пользователя)
+# ==========================================
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def bump_dashboard_on_sale(sender, instance, **kwargs):
+    dashboard_cache.bump_data_version(instance.salesman_id)
+
+
+@receiver(post_save, sender=Presentation)
+@receiver(post_delete, sender=Presentation)
+def bump_dashboard_on_presentation(sender, instance, **kwargs):
+    dashboard_cache.bump_data_version(instance.presenter_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_dashboard_on_comment(sender, instance, **kwargs):
+    # Дашборд показывает последний коммент владельцу продажи, а не автору коммента
+    owner_id = (
+        Sale.objects.filter(pk=instance.sale_id)
+        .values_list("salesman_id", flat=True)
+        .first()
+    )
+    dashboard_cache.bump_data_version(owner_id)
+
+
+@receiver(post_save, sender=PresentationComment)
+@receiver(post_delete, sender=PresentationComment)
+def bump_dashboard_on_presentation_comment(sender, instance, **kwargs):
+    owner_id = (
+        Presentation.objects.filter(pk=instance.presentation_id)
+        .values_list("presenter_id", flat=True)
+        .first()
+    )
+    dashboard_cache.bump_data_version(owner_id)
+
+
+# ==========================================
+# SERVER-TIMING (finance.timing)
+# ==========================================
+# Обертка SQL ставится на каждое соединение один раз: в потоках sync_to_async
+# у Django свои соединения, execute_wrapper на время запроса их бы не увидел.
+
+
+@receiver(connection_created)
+def install_timing_wrapper(sender, connection, **kwargs):
+    timing.install_sql_wrapper(connection)
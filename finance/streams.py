@@ -0,0 +1,60 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .balance_cache import get_balance_version
+from .dashboard import get_transfer_data
+
+ACCORDION_TEMPLATE = "finance/includes/transfer_accordion.html"
+
+
+def format_sse(data: str, event: str = None) -> str:
+    """Одно событие text/event-stream: многострочный HTML режется на строки data:."""
+    lines = [f"event: {event}"] if event else []
+    lines += [f"data: {line}" for line in data.splitlines() or [""]]
+    return "\n".join(lines) + "\n\n"
+
+
+async def accordion_events(request, agent_id):
+    """Поток SSE для аккордеона переводов.
+
+    Раз в TRANSFER_STREAM_INTERVAL сверяем версию баланса в кэше (один GET в Redis),
+    а балансы перечитываем и рендерим, только если версия сменилась: evict после
+    отправки outbox-события, сверки или сдачи кассы. Клиенту уходит фрагмент,
+    только когда HTML реально поменялся; в остальное время — редкие ping.
+    """
+    loop = asyncio.get_running_loop()
+    closes_at = loop.time() + settings.TRANSFER_STREAM_MAX_AGE
+    ping_at = loop.time() + settings.TRANSFER_STREAM_PING
+    version = None
+    last_html = None
+
+    # EventSource сам переподключится после закрытия потока — через retry мс
+    yield f"retry: {settings.TRANSFER_STREAM_RETRY_MS}\n\n"
+
+    while loop.time() < closes_at:
+        # Не thread_sensitive: иначе GET в Redis от всех потоков воркера встает в одну
+        # очередь с синхронной частью обычных запросов (сессия, ORM) в общем потоке
+        current = await sync_to_async(get_balance_version, thread_sensitive=False)(agent_id)
+
+        if current != version:
+            data = await asyncio.to_thread(get_transfer_data, agent_id)
+            html = await sync_to_async(render_to_string)(
+                ACCORDION_TEMPLATE, {"transfer_data": data}, request=request
+            )
+            if html != last_html:
+                last_html = html
+                ping_at = loop.time() + settings.TRANSFER_STREAM_PING
+                yield format_sse(html, event="accordion")
+
+            # FastAPI не ответил — версию не запоминаем, попробуем на следующем тике
+            if data is not None:
+                version = current
+        elif loop.time() >= ping_at:
+            # Комментарий SSE: держит соединение живым через прокси, браузер его игнорирует
+            ping_at = loop.time() + settings.TRANSFER_STREAM_PING
+            yield ": ping\n\n"
+
+        await asyncio.sleep(settings.TRANSFER_STREAM_INTERVAL)
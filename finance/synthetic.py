@@ -0,0 +1,299 @@
+import random
+from contextlib import contextmanager
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Comment,
+    MonthlyRollup,
+    OutboxEvent,
+    PartnerRate,
+    PayrollLine,
+    Presentation,
+    PresentationComment,
+    Sale,
+)
+from .rollups import rebuild_rollups
+
+# Синтетические данные «как в проде» для бенчмарков (generate_data, bench_views,
+# load_test). Пишется только bulk_create: без save() и сигналов, поэтому
+# MonthlyRollup и PartnerRate считаются отдельно, а комиссия карты — здесь же.
+
+USERNAME_PREFIX = "synth_"
+# Пароль всех синтетических агентов — для входа нагрузочного теста
+PASSWORD = "synth-password"
+
+PAYMENT_WEIGHTS = {
+    Sale.PaymentChoices.CASH_THAI_BAHT: 45,
+    Sale.PaymentChoices.TRANSFER: 25,
+    Sale.PaymentChoices.CARD: 15,
+    Sale.PaymentChoices.CASH_US_DOLLAR: 10,
+    Sale.PaymentChoices.GUIDE_CREDIT: 5,
+}
+PARTNERS = ["Exchange-A", "Exchange-B", "Exchange-C", "Exchange-D", "Exchange-E"]
+COMMENTS = [
+    "Клиент доволен",
+    "Перезвонить завтра",
+    "Доплата наличными",
+    "Группа из Паттайи",
+    "Чек отправлен в чат",
+    "Курс согласован с партнером",
+]
+
+
+@contextmanager
+def _manual_created_at(*models):
+    # bulk_create проставляет auto_now_add сам — а нам нужна история за N месяцев
+    fields = [model._meta.get_field("created_at") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _money(value: float) -> Decimal:
+    return Decimal(str(round(value, 2)))
+
+
+def synthetic_users():
+    return get_user_model().objects.filter(username__startswith=USERNAME_PREFIX)
+
+
+class Generator:
+    """Детерминированный генератор: тот же seed — те же суммы, типы оплат и тексты."""
+
+    def __init__(self, seed: int = 42, months: int = 12, batch_size: int = 5000, log=None):
+        self.random = random.Random(seed)
+        self.months = months
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.now = timezone.now().replace(microsecond=0)
+        self.counts = {}
+
+    def _timestamp(self):
+        # Свежие месяцы плотнее: дашборд и зарплата смотрят именно на них
+        days = self.months * 30 * self.random.betavariate(1, 2)
+        return self.now - timezone.timedelta(days=days, seconds=self.random.randrange(86400))
+
+    def _batches(self, total: int):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def _count(self, name: str, amount: int):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    # --- пользователи ---
+
+    def create_users(self, count: int) -> list:
+        User = get_user_model()
+        offset = synthetic_users().count()
+        # Хэш считаем один раз: PBKDF2 на тысячу пользователей — это минуты
+        password = make_password(PASSWORD)
+        users = [
+            User(
+                username=f"{USERNAME_PREFIX}{offset + i:06d}",
+                password=password,
+                base_salary=_money(self.random.choice([15000, 20000, 25000, 30000])),
+            )
+            for i in range(count)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        ids = list(
+            synthetic_users().order_by("id").values_list("id", flat=True)[offset:]
+        )
+        # Пара «звезд» и длинный хвост: нагрузка на агентов распределена неравномерно
+        self.weights = [self.random.paretovariate(1.5) for _ in ids]
+        self._count("users", len(ids))
+        return ids
+
+    # --- продажи ---
+
+    def _sale(self, user_id):
+        payment = self.random.choices(
+            list(PAYMENT_WEIGHTS), weights=list(PAYMENT_WEIGHTS.values())
+        )[0]
+        amount = _money(self.random.lognormvariate(8.5, 1.0) + 100)
+        sale = Sale(
+            salesman_id=user_id,
+            sale_amount=amount,
+            payment_type=payment,
+            created_at=self._timestamp(),
+        )
+        if payment == Sale.PaymentChoices.CARD:
+            # То же, что Sale.save: минус 3% комиссии терминала
+            fee = (amount * Decimal("0.03")).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+            sale.sale_amount = amount - fee
+        elif payment == Sale.PaymentChoices.TRANSFER:
+            client_rate = Decimal(str(round(self.random.uniform(2.3, 2.8), 4)))
+            sale.partner_name = self.random.choice(PARTNERS)
+            sale.client_rate = client_rate
+            sale.partner_rate = client_rate - Decimal("0.1000")
+            sale.transfer_amount_rub = (amount * client_rate).quantize(Decimal("1"))
+        return sale
+
+    def create_sales(self, user_ids, total: int, comment_ratio: float):
+        for size in self._batches(total):
+            owners = self.random.choices(user_ids, weights=self.weights, k=size)
+            with transaction.atomic():
+                sales = Sale.objects.bulk_create([self._sale(user_id) for user_id in owners])
+                self._comments(Comment, "sale", sales, "salesman_id", comment_ratio)
+                self._outbox(sales)
+            self._count("sales", len(sales))
+            self.log(f"Продаж: {self.counts['sales']}/{total}")
+        self._partner_rates(user_ids)
+
+    def _outbox(self, sales):
+        # История доставок: по событию на каждый перевод, все уже SENT —
+        # PENDING ушли бы диспетчером в настоящий FastAPI
+        events = [
+            OutboxEvent(
+                payload={
+                    "sale_id": sale.id,
+                    "amount": str(sale.sale_amount),
+                    "transfer_amount_rub": str(sale.transfer_amount_rub),
+                    "salesman_id": sale.salesman_id,
+                    "partner_name": sale.partner_name,
+                    "client_rate": str(sale.client_rate),
+                    "partner_rate": str(sale.partner_rate),
+                    "created_at": sale.created_at.isoformat(),
+                },
+                status=OutboxEvent.StatusChoices.SENT,
+                attempts=1,
+                next_attempt_at=sale.created_at,
+                created_at=sale.created_at,
+            )
+            for sale in sales
+            if sale.payment_type == Sale.PaymentChoices.TRANSFER
+        ]
+        OutboxEvent.objects.bulk_create(events)
+        self._count("outbox_events", len(events))
+
+    def _partner_rates(self, user_ids):
+        # Последний курс по каждому обменнику — как оставил бы SaleCreateView
+        latest = {}
+        transfers = (
+            Sale.objects.filter(
+                salesman_id__in=user_ids, payment_type=Sale.PaymentChoices.TRANSFER
+            )
+            .order_by("created_at")
+            .values_list("salesman_id", "partner_name", "client_rate", "partner_rate", "created_at")
+            .iterator(chunk_size=self.batch_size)
+        )
+        for user_id, partner, client_rate, partner_rate, created_at in transfers:
+            latest[(user_id, partner)] = (client_rate, partner_rate, created_at)
+
+        PartnerRate.objects.filter(user_id__in=user_ids).delete()
+        PartnerRate.objects.bulk_create(
+            [
+                PartnerRate(
+                    user_id=user_id,
+                    partner_name=partner,
+                    client_rate=client_rate,
+                    partner_rate=partner_rate,
+                    used_at=used_at,
+                )
+                for (user_id, partner), (client_rate, partner_rate, used_at) in latest.items()
+            ],
+            batch_size=self.batch_size,
+        )
+
+    # --- презентации ---
+
+    def create_presentations(self, user_ids, total: int, comment_ratio: float):
+        for size in self._batches(total):
+            owners = self.random.choices(user_ids, weights=self.weights, k=size)
+            with transaction.atomic():
+                presentations = Presentation.objects.bulk_create(
+                    [
+                        Presentation(
+                            presenter_id=user_id,
+                            group_sales_total=_money(self.random.lognormvariate(10, 0.8)),
+                            group_identifier=f"G-{self.random.randrange(10**6):06d}",
+                            created_at=self._timestamp(),
+                        )
+                        for user_id in owners
+                    ]
+                )
+                self._comments(
+                    PresentationComment, "presentation", presentations, "presenter_id", comment_ratio
+                )
+            self._count("presentations", len(presentations))
+            self.log(f"Презентаций: {self.counts['presentations']}/{total}")
+
+    # --- комментарии ---
+
+    def _comments(self, model, parent_field: str, parents, owner_attr: str, ratio: float):
+        comments = []
+        for parent in parents:
+            if self.random.random() >= ratio:
+                continue
+            for n in range(self.random.randint(1, 3)):
+                comments.append(
+                    model(
+                        **{parent_field: parent},
+                        author_id=getattr(parent, owner_attr),
+                        comment=self.random.choice(COMMENTS),
+                        created_at=parent.created_at + timezone.timedelta(minutes=10 * (n + 1)),
+                    )
+                )
+        model.objects.bulk_create(comments)
+        self._count("comments", len(comments))
+
+
+def generate(
+    users: int,
+    sales: int,
+    presentations: int,
+    comment_ratio: float = 0.3,
+    months: int = 12,
+    seed: int = 42,
+    batch_size: int = 5000,
+    log=None,
+) -> dict:
+    """Создает агентов, их продажи/презентации с комментариями и SENT-события Outbox.
+
+    Возвращает счетчики созданного. MonthlyRollup синтетических агентов
+    пересчитывается в конце — дашборд читает суммы именно оттуда.
+    """
+    generator = Generator(seed=seed, months=months, batch_size=batch_size, log=log)
+    with _manual_created_at(Sale, Presentation, Comment, PresentationComment, OutboxEvent):
+        user_ids = generator.create_users(users)
+        generator.create_sales(user_ids, sales, comment_ratio)
+        generator.create_presentations(user_ids, presentations, comment_ratio)
+
+    generator.counts["rollups"] = rebuild_rollups(list(synthetic_users().values_list("id", flat=True)))
+    return generator.counts
+
+
+def clear() -> int:
+    """Удаляет синтетических агентов со всеми их данными. Возвращает число агентов.
+
+    Миллионы строк каскадом через Collector (и сигналы агрегатов на каждую
+    продажу) удалялись бы часами — поэтому зависимые таблицы чистим напрямую.
+    """
+    user_ids = list(synthetic_users().values_list("id", flat=True))
+    if not user_ids:
+        return 0
+
+    with transaction.atomic():
+        related = [
+            Comment.objects.filter(sale__salesman_id__in=user_ids),
+            PresentationComment.objects.filter(presentation__presenter_id__in=user_ids),
+            OutboxEvent.objects.filter(payload__salesman_id__in=user_ids),
+            Sale.objects.filter(salesman_id__in=user_ids),
+            Presentation.objects.filter(presenter_id__in=user_ids),
+            MonthlyRollup.objects.filter(user_id__in=user_ids),
+            PartnerRate.objects.filter(user_id__in=user_ids),
+            PayrollLine.objects.filter(user_id__in=user_ids),
+        ]
+        for queryset in related:
+            queryset._raw_delete(queryset.db)
+        synthetic_users().delete()
+    return len(user_ids)
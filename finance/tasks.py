@@ -1,53 +1,62 @@
-import requests
 from datetime import timedelta
 from django.utils import timezone
-from django.conf import settings
 from celery import shared_task
-from .models import OutboxEvent
-
-FASTAPI_WEBHOOK_URL = f"{settings.FASTAPI_BASE_URL}/api/transfer/webhook/"
+from .outbox import claim, cleanup_sent, deliver_one, process_due
+from .transfer_client import CircuitOpenError
+from .partitions import drop_partitions_before, ensure_partitions, is_partitioned
+from .payroll import build_payroll, parse_month, previous_month
 
 # ⚡ ТАСКА 1: Мгновенная отправка ОДНОГО события по ID
 @shared_task
 def send_single_outbox_event(event_id: int):
-    try:
-        event = OutboxEvent.objects.get(id=event_id, status=OutboxEvent.StatusChoices.PENDING)
-    except OutboxEvent.DoesNotExist:
-        return  # Событие уже отправлено или его нет
-
-    data_to_send = event.payload.copy()
-    data_to_send["event_id"] = event.id
+    # Аренда вместо простого SELECT: если beat или другой воркер уже взял
+    # событие (или оно отправлено), здесь ничего не делаем
+    events = claim(1, event_ids=[event_id])
+    if not events:
+        return
 
     try:
-        response = requests.post(FASTAPI_WEBHOOK_URL, json=data_to_send, timeout=3)
-        if response.status_code == 200:
-            event.status = OutboxEvent.StatusChoices.SENT
-            event.save(update_fields=["status", "updated_at"])
-        else:
-            print(f"❌ FastAPI не принял данные! Код: {response.status_code}, Ответ: {response.text}")
-    except requests.RequestException as e:
-        print(f"❌ Ошибка сети при отправке в FastAPI: {e}")
+        deliver_one(events[0])
+    except CircuitOpenError:
+        # Событие уже вернулось в очередь — отправит диспетчер после пробы предохранителя
+        pass
 
 
-# 🔄 ТАСКА 2: Периодический фоновый подбор застрявших событий (Fallback)
+# 🔄 ТАСКА 2: Страховочный проход по очереди (основную работу делает
+# run_outbox_dispatcher по NOTIFY; здесь — если уведомление потерялось)
 @shared_task
 def process_outbox_events():
-    events = OutboxEvent.objects.filter(status=OutboxEvent.StatusChoices.PENDING)[:50]
-
-    for event in events:
-        send_single_outbox_event(event.id)
+    return process_due()
 
 
 @shared_task
 def cleanup_processed_outbox_events(days_to_keep=30):
     """
     Удаляет события со статусом SENT, созданные более 30 дней назад.
+    Небольшими окнами по id и в пределах OUTBOX_CLEANUP_TIME_BUDGET; если таблица
+    секционирована (partition_outbox), старые месяцы просто отрезаются DROP'ом.
     """
-    cutoff = timezone.now() - timedelta(days=days_to_keep)
+    dropped = []
+    if is_partitioned():
+        # Заодно держим секции на пару месяцев вперед — вставка не упадет в default
+        ensure_partitions()
+        dropped = drop_partitions_before(timezone.now() - timedelta(days=days_to_keep))
+
+    deleted_count, finished = cleanup_sent(days_to_keep)
 
-    # Фильтруем по полю status и значению StatusChoices.SENT
-    deleted_count, _ = OutboxEvent.objects.filter(
-        status=OutboxEvent.StatusChoices.SENT, created_at__lt=cutoff
-    ).delete()
+    result = f"Удалено {deleted_count} старых Outbox-записей."
+    if dropped:
+        result += f" Удалено секций: {len(dropped)}."
+    if not finished:
+        result += " Не уложились в бюджет времени — продолжим в следующий запуск."
+    return result
 
-    return f"Удалено {deleted_count} старых Outbox-записей."
+
+@shared_task
+def build_monthly_payroll(month=None):
+    """
+    Считает зарплаты и бонусы всех сотрудников за месяц ("YYYY-MM").
+    По умолчанию — за прошлый месяц (beat запускает 1-го числа).
+    """
+    run = build_payroll(parse_month(month) if month else previous_month())
+    return f"Payroll {run.month:%Y-%m}: {run.user_count} сотрудников, файл {run.csv_file.name}"
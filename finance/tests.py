@@ -1,14 +1,74 @@
+import asyncio
+import json
+import re
+import threading
+import time
 from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+import requests
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+import tempfile
+from django.test import TestCase, Client, override_settings
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from .models import Sale, Comment, Presentation, PresentationComment
+from django.core.cache import cache
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from .models import (
+    Sale,
+    Comment,
+    Presentation,
+    PresentationComment,
+    MonthlyRollup,
+    BonusTierTable,
+    BonusTier,
+    PayrollRun,
+    OutboxEvent,
+    PartnerRate,
+)
 from .forms import CommentForm, PresentationCommentForm
+from .bonus import evaluate_bonuses, get_bonus_percent, get_tier_book, invalidate_tier_book
+from .payroll import build_payroll, previous_month
+from .dashboard import dashboard_queryset
+from .balance_cache import BALANCE_KEY, evict_balance, get_balance
+from .tasks import process_outbox_events, send_single_outbox_event
+from .outbox import (
+    backoff_delay,
+    claim,
+    cleanup_sent,
+    deliver_one,
+    mark_sent,
+    release,
+    retry_later,
+)
+from .partitions import add_months, existing_partitions, is_partitioned, partition_name
+from .rollups import month_start, rebuild_rollups
+from .tasks import cleanup_processed_outbox_events
+from .bench import StubTransferService, find_regressions, stub_client
+from . import synthetic
+from .loadtest import Stats
+from .streams import format_sse
+from .transfer_client import (
+    CircuitOpenError,
+    TransferAPIError,
+    TransferClient,
+    TransferConnectionError,
+    get_client,
+)
+from .circuit import CircuitBreaker
+from .management.commands import run_outbox_dispatcher
 
 User = get_user_model()
 
 
+# Server-Timing по выборке (random) — в тестах выключен, иначе заголовок и строка
+# лога то есть, то нет. Тесты finance.timing включают его сами (SAMPLE_RATE=1)
+@override_settings(SERVER_TIMING_SAMPLE_RATE=0)
 class FullApplicationTestSuite(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -20,6 +80,11 @@ class FullApplicationTestSuite(TestCase):
         )
 
     def setUp(self):
+        # Кэш (фрагменты дашборда и т.п.) живет между тестами — начинаем с чистого
+        cache.clear()
+        # Снимок шкал бонусов живет в памяти процесса — тоже с чистого листа,
+        # иначе число запросов в тесте зависит от того, какой тест шел перед ним
+        invalidate_tier_book()
         self.client = Client()
         self.client.login(username="test_salesman", password="password123")
 
@@ -240,6 +305,9 @@ class FullApplicationTestSuite(TestCase):
         Sale.objects.filter(pk=old_sale.pk).update(
             created_at=timezone.now() - timezone.timedelta(days=35)
         )
+        # .update() мимо сигналов: MonthlyRollup все еще считает продажу текущей —
+        # пересчитываем агрегаты, как сделал бы rebuild_rollups после ручной правки
+        rebuild_rollups([self.user.id])
 
         # 3. Своя запись за текущий месяц
         current_sale = Sale.objects.create(
@@ -516,8 +584,58 @@ class FullApplicationTestSuite(TestCase):
         self.assertTrue(res_page_1.context["is_paginated"])
         self.assertGreater(res_page_1.context["paginator"].num_pages, 1)
 
+    def test_dashboard_keyset_pagination_walks_forward_and_back(self):
+        for i in range(55):
+            Sale.objects.create(salesman=self.user, sale_amount=Decimal(i + 1))
+        # Одинаковый created_at у всех — порядок должен держаться на id
+        Sale.objects.update(created_at=timezone.now())
+        expected = list(Sale.objects.order_by("-created_at", "-id"))
+
+        first = self.client.get(reverse("dashboard") + "?tab=sales")
+        page = first.context["cursor_page"]
+        self.assertFalse(first.context["is_paginated"])
+        self.assertEqual(list(first.context["items"]), expected[:50])
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+        second = self.client.get(
+            reverse("dashboard") + f"?tab=sales&cursor={page.next_cursor}"
+        )
+        page2 = second.context["cursor_page"]
+        self.assertEqual(list(second.context["items"]), expected[50:])
+        self.assertFalse(page2.has_next)
+        self.assertTrue(page2.has_previous)
+
+        back = self.client.get(
+            reverse("dashboard") + f"?tab=sales&cursor={page2.previous_cursor}"
+        )
+        self.assertEqual(list(back.context["items"]), expected[:50])
+        self.assertFalse(back.context["cursor_page"].has_previous)
+
+    def test_dashboard_load_more_returns_fragment_without_count(self):
+        for _ in range(51):
+            Presentation.objects.create(
+                presenter=self.user, group_sales_total=Decimal("10.00")
+            )
+        page = self.client.get(reverse("dashboard") + "?tab=presentations").context[
+            "cursor_page"
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("dashboard") + f"?tab=presentations&cursor={page.next_cursor}",
+                HTTP_HX_REQUEST="true",
+            )
+        self.assertTemplateUsed(response, "finance/includes/dashboard_more.html")
+        self.assertTemplateNotUsed(response, "finance/home.html")
+        self.assertContains(response, 'hx-swap-oob="beforeend:#items-rows"')
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+        bad = self.client.get(reverse("dashboard") + "?tab=sales&cursor=not-a-cursor")
+        self.assertEqual(bad.status_code, 404)
+
     def test_queries_optimized_no_n_plus_one(self):
-        """Проверка фиксированного числа запросов при рендеринге (с учетом нюансов ORM .last() в шаблоне)"""
+        """Фиксированное число запросов при рендеринге: последний коммент приходит подзапросом"""
         for _ in range(5):
             p = Presentation.objects.create(
                 presenter=self.user, group_sales_total=Decimal("100.00")
@@ -529,7 +647,1550 @@ class FullApplicationTestSuite(TestCase):
                 presentation=p, author=self.user, comment="C2"
             )
 
-        # 1 сессия + 1 юзер + 1 count + 1 sum + 1 select + 1 prefetch + 5 вызовов .last() = 11 запросов.
-        # Тест жестко фиксирует это число: любое неконтролируемое разрастание N+1 обрушит этот ассерт.
-        with self.assertNumQueries(11):
-            self.client.get(reverse("dashboard") + "?tab=presentations")
+        # Шкалы бонусов грузятся один раз на процесс — прогреваем, чтобы не зависеть от порядка тестов
+        get_tier_book()
+
+        # 1 сессия + 1 юзер + 1 агрегат за месяц + 1 select (с подзапросом last_comment_text) = 4.
+        # Ни COUNT(*), ни prefetch комментариев, ни .last() на каждую строку.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("dashboard") + "?tab=presentations")
+        self.assertContains(response, "C2")
+        self.assertNotContains(response, "C1")
+
+        # Болтливая ветка не меняет бюджет: 50 комментов к одной презентации — те же 4 запроса
+        for i in range(50):
+            PresentationComment.objects.create(
+                presentation=p, author=self.user, comment=f"Thread {i}"
+            )
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("dashboard") + "?tab=presentations")
+        self.assertContains(response, "Thread 49")
+        self.assertNotContains(response, "Thread 48")
+
+    def test_sales_dashboard_shows_last_comment_in_fixed_queries(self):
+        sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal("100.00"))
+        Sale.objects.create(salesman=self.user, sale_amount=Decimal("200.00"))
+        Comment.objects.create(sale=sale, author=self.user, comment="Первый")
+        Comment.objects.create(sale=sale, author=self.user, comment="Последний")
+        get_tier_book()
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("dashboard") + "?tab=sales")
+        self.assertContains(response, "Последний")
+        self.assertNotContains(response, "Первый")
+
+    # =========================================================================
+    # 8. МЕСЯЧНЫЕ АГРЕГАТЫ (MonthlyRollup)
+    # =========================================================================
+    def _rollup(self, kind):
+        return MonthlyRollup.objects.get(user=self.user, kind=kind)
+
+    def test_rollup_follows_sale_create_update_delete(self):
+        kind = MonthlyRollup.KindChoices.SALES
+
+        sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal("1000.00"))
+        # Карта: в агрегат попадает сумма уже за вычетом комиссии 3%
+        card = Sale.objects.create(
+            salesman=self.user,
+            sale_amount=Decimal("1500.00"),
+            payment_type=Sale.PaymentChoices.CARD,
+        )
+        rollup = self._rollup(kind)
+        self.assertEqual(rollup.total, Decimal("2455.00"))
+        self.assertEqual(rollup.count, 2)
+
+        sale.sale_amount = Decimal("400.00")
+        sale.save()
+        self.assertEqual(self._rollup(kind).total, Decimal("1855.00"))
+
+        card.delete()
+        rollup = self._rollup(kind)
+        self.assertEqual(rollup.total, Decimal("400.00"))
+        self.assertEqual(rollup.count, 1)
+
+        # Массовое удаление тоже идет через post_delete
+        Sale.objects.all().delete()
+        rollup = self._rollup(kind)
+        self.assertEqual(rollup.total, Decimal("0.00"))
+        self.assertEqual(rollup.count, 0)
+
+    def test_rollup_follows_presentation_month_move(self):
+        kind = MonthlyRollup.KindChoices.PRESENTATIONS
+        prep = Presentation.objects.create(
+            presenter=self.user, group_sales_total=Decimal("700.00")
+        )
+        this_month = self._rollup(kind).month
+
+        prep.created_at = timezone.now() - timezone.timedelta(days=40)
+        prep.save()
+
+        rollups = MonthlyRollup.objects.filter(user=self.user, kind=kind)
+        self.assertEqual(rollups.get(month=this_month).total, Decimal("0.00"))
+        self.assertEqual(
+            rollups.exclude(month=this_month).get().total, Decimal("700.00")
+        )
+
+    def test_rebuild_rollups_command_fixes_drift(self):
+        sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal("300.00"))
+        Presentation.objects.create(
+            presenter=self.other_user, group_sales_total=Decimal("50.00")
+        )
+
+        call_command("rebuild_rollups", "--check", stdout=StringIO())
+
+        # .update() сигналы не шлет — агрегат разъезжается с сырыми данными
+        Sale.objects.filter(pk=sale.pk).update(sale_amount=Decimal("999.00"))
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--check", stdout=StringIO(), stderr=StringIO())
+
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(
+            self._rollup(MonthlyRollup.KindChoices.SALES).total, Decimal("999.00")
+        )
+
+        response = self.client.get(reverse("dashboard") + "?tab=sales")
+        self.assertEqual(response.context["total_amount"], Decimal("999.00"))
+
+    # =========================================================================
+    # 9. ШКАЛЫ БОНУСОВ (Bonus Tier Engine)
+    # =========================================================================
+    def test_bonus_batch_evaluation_matches_single_lookup(self):
+        totals = [
+            (1, Decimal("0.00")),
+            (2, Decimal("250000.00")),
+            (3, Decimal("1000000.00")),
+            (4, Decimal("1000000.01")),
+            (5, None),
+        ]
+        results = evaluate_bonuses("sales", totals)
+
+        self.assertEqual(results[2].percent, Decimal("2.00"))
+        self.assertEqual(results[2].tier, 2)
+        self.assertEqual(results[2].amount, Decimal("5000.00"))
+        self.assertEqual(results[5].total, Decimal("0.00"))
+        for user_id, total in totals:
+            self.assertEqual(
+                results[user_id].percent,
+                get_bonus_percent("sales", total or Decimal("0.00")),
+            )
+
+        # Весь пакет считается без единого запроса (шкалы уже в памяти)
+        with self.assertNumQueries(0):
+            evaluate_bonuses("presentations", [(i, Decimal(i * 1000)) for i in range(2000)])
+
+    def test_new_tier_version_applies_from_effective_date(self):
+        self.addCleanup(invalidate_tier_book)
+        today = timezone.localdate()
+        next_month = (today.replace(day=1) + timezone.timedelta(days=32)).replace(day=1)
+
+        table = BonusTierTable.objects.create(
+            kind="sales", version=2, effective_from=next_month
+        )
+        BonusTier.objects.create(table=table, min_total=Decimal("0.00"), percent=Decimal("5.00"))
+
+        # Сигнал сбросил снимок — новая версия видна сразу, но только с next_month
+        self.assertEqual(get_bonus_percent("sales", Decimal("100.00")), Decimal("1.85"))
+        self.assertEqual(
+            get_bonus_percent("sales", Decimal("100.00"), on=next_month), Decimal("5.00")
+        )
+
+    # =========================================================================
+    # 10. МЕСЯЧНАЯ ЗАРПЛАТА (Payroll batch)
+    # =========================================================================
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_payroll_groups_totals_for_every_user(self):
+        month = previous_month()
+        in_month = timezone.make_aware(
+            timezone.datetime.combine(month.replace(day=15), timezone.datetime.min.time())
+        )
+
+        self.user.base_salary = Decimal("30000.00")
+        self.user.save()
+        for amount in ("200000.00", "100000.00"):
+            sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal(amount))
+            sale.created_at = in_month
+            sale.save()
+        prep = Presentation.objects.create(
+            presenter=self.other_user, group_sales_total=Decimal("1000000.00")
+        )
+        prep.created_at = in_month
+        prep.save()
+        # Продажа текущего месяца в расчет прошлого не попадает
+        Sale.objects.create(salesman=self.user, sale_amount=Decimal("999999.00"))
+
+        for i in range(30):
+            User.objects.create(username=f"staff_{i}")
+
+        # Число запросов не зависит от числа сотрудников: GROUP BY + пачки bulk_create
+        with self.assertNumQueries(12):
+            run = build_payroll(month, chunk_size=10)
+
+        self.assertEqual(run.status, PayrollRun.StatusChoices.DONE)
+        self.assertEqual(run.user_count, User.objects.count())
+
+        line = run.lines.get(user=self.user)
+        self.assertEqual(line.sales_total, Decimal("300000.00"))
+        self.assertEqual(line.sales_percent, Decimal("2.00"))
+        self.assertEqual(line.sales_bonus, Decimal("6000.00"))
+        self.assertEqual(line.total_pay, Decimal("36000.00"))
+
+        other = run.lines.get(user=self.other_user)
+        self.assertEqual(other.presentations_tier, 2)
+        self.assertEqual(other.presentations_bonus, Decimal("27500.00"))
+
+        with run.csv_file.open("r") as fh:
+            rows = fh.read().splitlines()
+        self.assertEqual(len(rows), run.user_count + 1)
+        self.assertTrue(rows[0].startswith("user_id,username,sales_total"))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_payroll_csv_download_is_staff_only(self):
+        run = build_payroll(previous_month())
+        url = reverse("payroll_csv", args=[run.pk])
+
+        # Обычный агент (self.client залогинен) — на логин админки, а не к зарплатам всех
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse("admin:login"), response["Location"])
+
+        staff = User.objects.create(username="accountant", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(rows[0].startswith("user_id,username,sales_total"))
+
+        run.csv_file.delete(save=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_run_payroll_command_streams_csv(self):
+        out = StringIO()
+        call_command("run_payroll", "--month", "2026-01", "--output", "-", stdout=out, stderr=StringIO())
+
+        self.assertIn("test_salesman", out.getvalue())
+        self.assertEqual(PayrollRun.objects.get().month.isoformat(), "2026-01-01")
+
+        with self.assertRaises(CommandError):
+            call_command("run_payroll", "--month", "январь", stderr=StringIO())
+
+    # =========================================================================
+    # 11. КЭШ ФРАГМЕНТОВ ДАШБОРДА (Fragment cache)
+    # =========================================================================
+    def test_dashboard_fragment_cache_hit_skips_orm_and_list_render(self):
+        Sale.objects.create(salesman=self.user, sale_amount=Decimal("1000.00"))
+        url = reverse("dashboard") + "?tab=sales"
+        get_tier_book()
+
+        first = self.client.get(url)
+        self.assertTemplateUsed(first, "finance/includes/dashboard_list.html")
+
+        # Повтор без изменений: только сессия и юзер, список не рендерится
+        with self.assertNumQueries(2):
+            cached = self.client.get(url)
+        self.assertTemplateNotUsed(cached, "finance/includes/dashboard_list.html")
+        self.assertEqual(cached.context["total_amount"], Decimal("1000.00"))
+        self.assertContains(cached, "1000.00 ฿")
+
+    def test_dashboard_fragment_cache_invalidated_by_writes(self):
+        url = reverse("dashboard") + "?tab=sales"
+        self.client.get(url)
+
+        self.client.post(
+            reverse("sale_create"),
+            data={"sale_amount": "777.00", "payment_type": Sale.PaymentChoices.CASH_THAI_BAHT},
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.context["total_amount"], Decimal("777.00"))
+        self.assertContains(response, "777.00 ฿")
+
+        sale = Sale.objects.get()
+        self.client.post(
+            reverse("comment_create", kwargs={"sale_pk": sale.pk}),
+            data={"comment": "Свежий коммент"},
+        )
+        self.assertContains(self.client.get(url), "Свежий коммент")
+
+        # Чужие записи версию нашего дашборда не трогают
+        Sale.objects.create(salesman=self.other_user, sale_amount=Decimal("5.00"))
+        self.assertTemplateNotUsed(
+            self.client.get(url), "finance/includes/dashboard_list.html"
+        )
+
+    # =========================================================================
+    # 12. ASYNC-ДАШБОРД (ASGI, балансы параллельно с БД)
+    # =========================================================================
+    BALANCE = {"cash_debt": 0.0, "daily_profit": 0.0, "monthly_profit": 0.0, "partners": []}
+
+    @override_settings(DASHBOARD_BALANCE_DEADLINE=0.05)
+    async def test_async_dashboard_renders_placeholder_when_balance_is_late(self):
+        await Sale.objects.acreate(salesman=self.user, sale_amount=Decimal("300.00"))
+        await self.async_client.aforce_login(self.user)
+
+        def slow_balance(agent_id):
+            time.sleep(0.5)
+            return self.BALANCE
+
+        with mock.patch("finance.views.get_transfer_data", side_effect=slow_balance):
+            started = time.monotonic()
+            response = await self.async_client.get(reverse("dashboard"))
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, 0.5)
+        self.assertTrue(response.context["transfer_pending"])
+        self.assertIsNone(response.context["transfer_data"])
+        self.assertContains(response, "Загружаем балансы")
+        self.assertContains(response, "300.00 ฿")
+
+    async def test_async_dashboard_includes_balance_in_time(self):
+        await self.async_client.aforce_login(self.user)
+
+        with mock.patch(
+            "finance.views.get_transfer_data", return_value=self.BALANCE
+        ) as fetch:
+            response = await self.async_client.get(
+                reverse("dashboard") + "?tab=sales"
+            )
+
+        fetch.assert_called_once_with(self.user.id)
+        self.assertFalse(response.context["transfer_pending"])
+        self.assertEqual(response.context["transfer_data"], self.BALANCE)
+        self.assertNotContains(response, "Загружаем балансы")
+
+    async def test_async_dashboard_requires_login(self):
+        response = await self.async_client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 302)
+
+    # =========================================================================
+    # 13. КЭШ БАЛАНСОВ FASTAPI (stale-while-revalidate + схлопывание)
+    # =========================================================================
+    def test_transfer_accordion_polls_hit_shared_balance_cache(self):
+        with mock.patch(
+            "finance.dashboard.fetch_transfer_data", return_value=self.BALANCE
+        ) as fetch:
+            for _ in range(3):
+                response = self.client.get(reverse("transfer_accordion"))
+                self.assertEqual(response.status_code, 286)
+            self.client.get(reverse("dashboard"))
+
+        fetch.assert_called_once_with(self.user.id)
+
+    def test_balance_failure_is_not_cached(self):
+        with mock.patch("finance.dashboard.fetch_transfer_data", return_value=None) as fetch:
+            self.assertEqual(self.client.get(reverse("transfer_accordion")).status_code, 200)
+            self.client.get(reverse("transfer_accordion"))
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_stale_balance_served_while_refreshing_in_background(self):
+        cache.set(
+            BALANCE_KEY.format(agent_id=self.user.id),
+            {"data": {"cash_debt": 1.0}, "fetched_at": time.time() - 3600},
+        )
+        refreshed = threading.Event()
+
+        def loader(agent_id):
+            refreshed.set()
+            return {"cash_debt": 2.0}
+
+        # Старое значение отдается сразу, новое подтягивается фоном
+        self.assertEqual(get_balance(self.user.id, loader), {"cash_debt": 1.0})
+        self.assertTrue(refreshed.wait(2))
+        for _ in range(40):
+            if get_balance(self.user.id, loader) == {"cash_debt": 2.0}:
+                break
+            time.sleep(0.05)
+        self.assertEqual(get_balance(self.user.id, loader), {"cash_debt": 2.0})
+
+    def test_concurrent_balance_misses_share_one_upstream_call(self):
+        calls = []
+
+        def loader(agent_id):
+            calls.append(agent_id)
+            time.sleep(0.2)
+            return {"cash_debt": 5.0}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_balance(self.user.id, loader)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"cash_debt": 5.0}] * 5)
+
+    def test_balance_evicted_after_reconcile_clear_cash_and_outbox_delivery(self):
+        key = BALANCE_KEY.format(agent_id=self.user.id)
+        entry = {"data": self.BALANCE, "fetched_at": time.time()}
+
+        cache.set(key, entry)
+        with mock.patch.object(TransferClient, "reconcile") as reconcile:
+            self.client.post(
+                reverse("reconcile_partner"), {"partner_name": "P1", "amount": "10"}
+            )
+        reconcile.assert_called_once_with(self.user.id, "P1", Decimal("10"))
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, entry)
+        with mock.patch.object(TransferClient, "clear_cash"):
+            self.client.post(reverse("clear_cash"))
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, entry)
+        event = OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        with mock.patch.object(TransferClient, "send_webhook"):
+            send_single_outbox_event(event.id)
+        self.assertIsNone(cache.get(key))
+
+    def test_eviction_drops_response_fetched_before_it(self):
+        def loader(agent_id):
+            # Пока FastAPI отвечал, прошла сверка
+            evict_balance(agent_id)
+            return {"cash_debt": 9.0}
+
+        self.assertEqual(get_balance(self.user.id, loader), {"cash_debt": 9.0})
+        self.assertIsNone(cache.get(BALANCE_KEY.format(agent_id=self.user.id)))
+
+    # =========================================================================
+    # 14. SSE-КАНАЛ АККОРДЕОНА (вместо опроса каждую секунду)
+    # =========================================================================
+    def test_format_sse_splits_multiline_html(self):
+        self.assertEqual(
+            format_sse("<div>\n  1\n</div>", event="accordion"),
+            "event: accordion\ndata: <div>\ndata:   1\ndata: </div>\n\n",
+        )
+
+    def test_dashboard_subscribes_to_stream_instead_of_polling(self):
+        response = self.client.get(reverse("dashboard") + "?tab=sales")
+        self.assertContains(response, reverse("transfer_stream"))
+        self.assertNotContains(response, 'hx-trigger="every 1s"')
+
+    @override_settings(TRANSFER_STREAM_INTERVAL=0.01)
+    async def test_transfer_stream_pushes_accordion_only_on_balance_change(self):
+        await self.async_client.aforce_login(self.user)
+        balances = [dict(self.BALANCE, cash_debt=100.0)]
+
+        with mock.patch(
+            "finance.streams.get_transfer_data", side_effect=lambda agent_id: balances[-1]
+        ) as fetch:
+            response = await self.async_client.get(reverse("transfer_stream"))
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+
+            events = aiter(response.streaming_content)
+            self.assertEqual(await anext(events), b"retry: 3000\n\n")
+            first = (await anext(events)).decode()
+            self.assertTrue(first.startswith("event: accordion\n"))
+            self.assertIn("100.0 ฿", first)
+
+            # Версия баланса не менялась — поток FastAPI/кэш балансов не трогает
+            await asyncio.sleep(0.1)
+            self.assertEqual(fetch.call_count, 1)
+
+            # Outbox/сверка/касса сбрасывают баланс — и поток сразу шлет новый фрагмент
+            balances.append(dict(self.BALANCE, cash_debt=250.0))
+            evict_balance(self.user.id)
+            second = (await asyncio.wait_for(anext(events), 2)).decode()
+            self.assertIn("250.0 ฿", second)
+            self.assertEqual(fetch.call_count, 2)
+
+    async def test_transfer_stream_requires_login(self):
+        response = await self.async_client.get(reverse("transfer_stream"))
+        self.assertEqual(response.status_code, 302)
+
+    # =========================================================================
+    # 15. УСЛОВНЫЕ GET (ETag / 304) ДЛЯ HTMX-ФРАГМЕНТОВ
+    # =========================================================================
+    def test_transfer_accordion_answers_304_while_balance_unchanged(self):
+        url = reverse("transfer_accordion")
+        balance = dict(self.BALANCE, cash_debt=100.0)
+
+        with mock.patch("finance.views.get_transfer_data", side_effect=lambda agent_id: balance):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 286)
+            etag = first["ETag"]
+            self.assertIn("no-cache", first["Cache-Control"])
+
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(repeat.status_code, 304)
+            self.assertEqual(repeat.content, b"")
+            self.assertTemplateNotUsed(repeat, "finance/includes/transfer_accordion.html")
+
+            balance["cash_debt"] = 250.0
+            changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(changed.status_code, 286)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertContains(changed, "250.0 ฿", status_code=286)
+
+    def test_load_more_answers_304_until_dashboard_data_changes(self):
+        for _ in range(51):
+            Sale.objects.create(salesman=self.user, sale_amount=Decimal("10.00"))
+        page = self.client.get(reverse("dashboard")).context["cursor_page"]
+        url = reverse("dashboard") + f"?tab=sales&cursor={page.next_cursor}"
+
+        first = self.client.get(url, HTTP_HX_REQUEST="true")
+        etag = first["ETag"]
+
+        # Только сессия и пользователь: ни выборки строк, ни рендера
+        with self.assertNumQueries(2):
+            repeat = self.client.get(url, HTTP_HX_REQUEST="true", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeat.status_code, 304)
+
+        Sale.objects.create(salesman=self.user, sale_amount=Decimal("20.00"))
+        changed = self.client.get(url, HTTP_HX_REQUEST="true", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertTemplateUsed(changed, "finance/includes/dashboard_more.html")
+
+    # =========================================================================
+    # 16. КЛИЕНТ FASTAPI (пул соединений, Decimal)
+    # =========================================================================
+    def _transfer_client(self):
+        return TransferClient(
+            "http://transfer.test/", pool_size=4, connect_timeout=1, read_timeout=5
+        )
+
+    @staticmethod
+    def _http_response(status_code, body):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = body.encode()
+        return response
+
+    def test_transfer_client_parses_balance_as_decimal(self):
+        client = self._transfer_client()
+        body = (
+            '{"cash_debt": "1500.10", "daily_profit": 0.1, "monthly_profit": null,'
+            ' "partners": [{"partner_name": "P1", "debt": -20.5, "partner_profit": "3"}]}'
+        )
+        with mock.patch.object(
+            client.session, "request", return_value=self._http_response(200, body)
+        ) as request:
+            balance = client.get_balance(7)
+
+        request.assert_called_once_with(
+            "GET", "http://transfer.test/api/transfer/balance/7", timeout=(1, 2.0)
+        )
+        self.assertEqual(balance["cash_debt"], Decimal("1500.10"))
+        self.assertEqual(balance["daily_profit"], Decimal("0.1"))
+        self.assertEqual(balance["monthly_profit"], Decimal("0"))
+        self.assertEqual(balance["partners"][0]["debt"], Decimal("-20.5"))
+
+    def test_transfer_client_reuses_pooled_session_per_process(self):
+        client = self._transfer_client()
+        session = client.session
+        self.assertIs(client.session, session)
+        self.assertEqual(session.get_adapter("http://transfer.test/")._pool_maxsize, 4)
+
+        # После fork (prefork Celery) — свой пул в дочернем процессе
+        with mock.patch("finance.transfer_client.os.getpid", return_value=-1):
+            self.assertIsNot(client.session, session)
+
+    def test_transfer_client_maps_errors(self):
+        client = self._transfer_client()
+        with mock.patch.object(
+            client.session, "request", return_value=self._http_response(422, "bad")
+        ):
+            with self.assertRaises(TransferAPIError) as ctx:
+                client.clear_cash(1)
+        self.assertEqual((ctx.exception.status_code, ctx.exception.text), (422, "bad"))
+
+        with mock.patch.object(
+            client.session, "request", side_effect=requests.ConnectionError("refused")
+        ):
+            with self.assertRaises(TransferConnectionError):
+                client.send_webhook({"event_id": 1})
+
+    def test_reconcile_reports_api_error_text(self):
+        with mock.patch.object(
+            TransferClient, "reconcile", side_effect=TransferAPIError(400, "нет партнера")
+        ):
+            response = self.client.post(
+                reverse("reconcile_partner"),
+                {"partner_name": "P1", "amount": "10.50"},
+            )
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)],
+            ["Ошибка API: нет партнера"],
+        )
+
+    # =========================================================================
+    # 17. ПРЕДОХРАНИТЕЛЬ FASTAPI (Circuit breaker)
+    # =========================================================================
+    def _guarded_client(self):
+        client = self._transfer_client()
+        client.breaker = CircuitBreaker(
+            "test", failure_threshold=2, window=30, reset_timeout=60
+        )
+        return client
+
+    def test_circuit_opens_after_failures_and_fails_fast(self):
+        client = self._guarded_client()
+        with mock.patch.object(
+            client.session, "request", side_effect=requests.Timeout("timeout")
+        ) as request:
+            for _ in range(2):
+                with self.assertRaises(TransferConnectionError):
+                    client.clear_cash(1)
+            with self.assertRaises(CircuitOpenError):
+                client.clear_cash(1)
+
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(client.breaker.status()["state"], "open")
+        # Для вьюх это та же «ошибка связи» — дашборд просто остается без балансов
+        self.assertTrue(issubclass(CircuitOpenError, TransferConnectionError))
+
+    def test_circuit_half_open_lets_single_probe_through(self):
+        client = self._guarded_client()
+        client.breaker.trip()
+        later = time.time() + 61
+
+        with mock.patch("finance.circuit.time.time", return_value=later):
+            self.assertEqual(client.breaker.status()["state"], "half_open")
+            with mock.patch.object(
+                client.session, "request", side_effect=requests.ConnectionError("down")
+            ):
+                with self.assertRaises(TransferConnectionError):
+                    client.clear_cash(1)
+            # Проба провалилась — снова open на reset_timeout
+            self.assertEqual(client.breaker.status()["state"], "open")
+
+        with mock.patch("finance.circuit.time.time", return_value=later + 61):
+            self.assertTrue(client.breaker.allow())
+            self.assertFalse(client.breaker.allow())  # вторая проба ждет первую
+            client.breaker.record_success()
+            self.assertEqual(client.breaker.status()["state"], "closed")
+
+    def test_circuit_trips_on_intermittent_failures(self):
+        client = self._guarded_client()
+        ok = self._http_response(200, "{}")
+        down = requests.ConnectionError("down")
+
+        with mock.patch.object(client.session, "request", side_effect=[down, ok, down]):
+            with self.assertRaises(TransferConnectionError):
+                client.clear_cash(1)
+            # Успех в closed — один GET состояния, счетчик ошибок не трогаем
+            with mock.patch("finance.circuit.cache.delete_many") as delete_many:
+                client.clear_cash(1)
+            delete_many.assert_not_called()
+            with self.assertRaises(TransferConnectionError):
+                client.clear_cash(1)
+
+        # Две ошибки в окне, хоть между ними и был успех, — автомат открыт
+        self.assertEqual(client.breaker.status()["state"], "open")
+
+    def test_circuit_ignores_client_errors(self):
+        client = self._guarded_client()
+        with mock.patch.object(
+            client.session, "request", return_value=self._http_response(400, "bad")
+        ):
+            for _ in range(3):
+                with self.assertRaises(TransferAPIError):
+                    client.clear_cash(1)
+        self.assertEqual(client.breaker.status()["state"], "closed")
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_transfer_status_endpoint_reports_breaker_state(self):
+        url = reverse("transfer_status")
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["state"], "closed")
+
+        get_client().breaker.trip()
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["state"], "open")
+
+        # Состояние сервиса — не для всех: без токена 401, токен не задан — 404
+        self.assertEqual(self.client.get(url).status_code, 401)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer secret").status_code, 404)
+
+    # =========================================================================
+    # 18. ИНДЕКСЫ ГОРЯЧИХ ЗАПРОСОВ (EXPLAIN: индекс пригоден для запроса)
+    # =========================================================================
+    def _seed_for_explain(self):
+        now = timezone.now()
+        transfer, cash = Sale.PaymentChoices.TRANSFER, Sale.PaymentChoices.CASH_THAI_BAHT
+        pending, sent = OutboxEvent.StatusChoices.PENDING, OutboxEvent.StatusChoices.SENT
+        for owner in (self.user, self.other_user):
+            Sale.objects.bulk_create(
+                Sale(
+                    salesman=owner,
+                    sale_amount=Decimal("10.00"),
+                    payment_type=transfer if i % 5 == 0 else cash,
+                )
+                for i in range(150)
+            )
+            Presentation.objects.bulk_create(
+                Presentation(presenter=owner, group_sales_total=Decimal("10.00"))
+                for _ in range(150)
+            )
+        sale = Sale.objects.first()
+        Comment.objects.bulk_create(
+            Comment(sale=sale, author=self.user, comment=str(i)) for i in range(20)
+        )
+        OutboxEvent.objects.bulk_create(
+            OutboxEvent(payload={}, status=pending if i % 50 == 0 else sent)
+            for i in range(300)
+        )
+        OutboxEvent.objects.update(created_at=now - timezone.timedelta(days=40))
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            if connection.vendor == "postgresql":
+                # На маленькой выборке Postgres честно выберет seq scan. Поэтому тесты
+                # проверяют только, что индекс пригоден для запроса (условия и порядок
+                # совпадают), а не что планировщик выберет его на боевых объемах —
+                # это видно по EXPLAIN на данных generate_data / bench_views
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertIndexUsable(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+        # Seq Scan (Postgres) / «SCAN table» без индекса (SQLite)
+        self.assertNotRegex(plan, r"Seq Scan|SCAN \w+(?! USING)(\s|$)", plan)
+
+    def test_hot_queries_composite_indexes_are_usable(self):
+        self._seed_for_explain()
+        dashboard = dashboard_queryset(self.user, "sales").order_by("-created_at", "-id")
+        self.assertIndexUsable(dashboard[:51], "sale_salesman_created_idx")
+        # Подзапрос «последний комментарий» тоже по индексу
+        self.assertIndexUsable(dashboard[:51], "comment_sale_created_idx")
+
+        # Следующая страница keyset-пагинации — тот же индекс, без OFFSET
+        boundary = dashboard[50]
+        next_page = dashboard.filter(
+            Q(created_at__lt=boundary.created_at)
+            | Q(created_at=boundary.created_at, id__lt=boundary.id)
+        )
+        self.assertIndexUsable(next_page[:51], "sale_salesman_created_idx")
+
+        self.assertIndexUsable(
+            dashboard_queryset(self.user, "presentations").order_by("-created_at", "-id")[:51],
+            "presentation_presenter_idx",
+        )
+        self.assertIndexUsable(
+            Sale.objects.filter(
+                salesman=self.user, payment_type=Sale.PaymentChoices.TRANSFER
+            ).order_by("-created_at")[:1],
+            "sale_salesman_payment_idx",
+        )
+
+    def test_outbox_queries_status_indexes_are_usable(self):
+        self._seed_for_explain()
+        self.assertIndexUsable(
+            OutboxEvent.objects.filter(
+                status=OutboxEvent.StatusChoices.PENDING, next_attempt_at__lte=timezone.now()
+            ).order_by("next_attempt_at")[:50],
+            # Postgres берет частичный индекс, SQLite может взять и составной
+            "outbox_due_idx",
+            "outbox_status_created_idx",
+        )
+        self.assertIndexUsable(
+            OutboxEvent.objects.filter(
+                status=OutboxEvent.StatusChoices.SENT,
+                created_at__lt=timezone.now() - timezone.timedelta(days=30),
+            ),
+            "outbox_status_created_idx",
+        )
+
+    # =========================================================================
+    # 19. ЛИПКИЕ ПОЛЯ ФОРМЫ ПРОДАЖИ (PartnerRate + кэш)
+    # =========================================================================
+    def _post_transfer(self, partner_name, client_rate, partner_rate):
+        return self.client.post(
+            reverse("sale_create"),
+            data={
+                "sale_amount": "1000.00",
+                "payment_type": Sale.PaymentChoices.TRANSFER,
+                "client_rate": client_rate,
+                "partner_rate": partner_rate,
+                "transfer_amount_rub": "2500",
+                "partner_name": partner_name,
+            },
+        )
+
+    def test_sale_form_prefills_last_transfer_without_sales_query(self):
+        self._post_transfer("Обменник А", "2.5000", "2.4000")
+        self._post_transfer("Обменник Б", "2.6000", "2.5500")
+        self._post_transfer("Обменник А", "2.7000", "2.6500")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("sale_create"))
+        self.assertFalse(any("finance_sale" in q["sql"] for q in queries.captured_queries))
+
+        initial = response.context["form"].initial
+        self.assertEqual(initial["partner_name"], "Обменник А")
+        self.assertEqual(initial["client_rate"], Decimal("2.7000"))
+        self.assertEqual(initial["payment_type"], Sale.PaymentChoices.TRANSFER)
+        self.assertEqual(
+            [p["partner_name"] for p in response.context["recent_partners"]],
+            ["Обменник А", "Обменник Б"],
+        )
+        self.assertContains(response, '<option value="Обменник Б">')
+        self.assertEqual(PartnerRate.objects.filter(user=self.user).count(), 2)
+
+        # Повторное открытие — вообще без запросов к finance_*: только сессия и юзер
+        with self.assertNumQueries(2):
+            self.client.get(reverse("sale_create"))
+
+    def test_sale_form_defaults_are_per_user(self):
+        self._post_transfer("Обменник А", "2.5000", "2.4000")
+        other = Client()
+        other.login(username="other_salesman", password="password123")
+        initial = other.get(reverse("sale_create")).context["form"].initial
+        self.assertNotIn("partner_name", initial)
+
+    # =========================================================================
+    # 20. ЗАГРУЗКА ОБЪЕКТА ОДНИМ ЗАПРОСОМ (OwnerScopedMixin)
+    # =========================================================================
+    def test_detail_views_load_object_and_comments_in_fixed_queries(self):
+        sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal("100.00"))
+        presentation = Presentation.objects.create(
+            presenter=self.user, group_sales_total=Decimal("100.00")
+        )
+        for i in range(5):
+            Comment.objects.create(sale=sale, author=self.user, comment=f"C{i}")
+            PresentationComment.objects.create(
+                presentation=presentation, author=self.other_user, comment=f"P{i}"
+            )
+
+        # сессия + юзер + объект (с владельцем JOIN'ом) + комментарии (с авторами JOIN'ом)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("sale_detail", kwargs={"pk": sale.pk}))
+        self.assertContains(response, "C4")
+
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse("presentation_detail", kwargs={"pk": presentation.pk})
+            )
+        self.assertContains(response, self.other_user.username)
+
+    def test_update_and_delete_pages_fetch_object_once(self):
+        sale = Sale.objects.create(salesman=self.user, sale_amount=Decimal("100.00"))
+        presentation = Presentation.objects.create(
+            presenter=self.user, group_sales_total=Decimal("100.00")
+        )
+
+        # сессия + юзер + объект: больше нет второго get_object() из test_func
+        for name, pk in (
+            ("sale_update", sale.pk),
+            ("sale_delete", sale.pk),
+            ("presentation_update", presentation.pk),
+            ("presentation_delete", presentation.pk),
+        ):
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name, kwargs={"pk": pk}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(queries.captured_queries), 3)
+
+    def test_owner_scoped_views_return_403_for_foreign_and_404_for_missing(self):
+        other_sale = Sale.objects.create(
+            salesman=self.other_user, sale_amount=Decimal("1000.00")
+        )
+        response = self.client.get(reverse("sale_detail", kwargs={"pk": other_sale.pk}))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse("sale_delete", kwargs={"pk": other_sale.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Sale.objects.filter(pk=other_sale.pk).exists())
+
+        response = self.client.get(reverse("sale_detail", kwargs={"pk": 999999}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("presentation_update", kwargs={"pk": 999999}))
+        self.assertEqual(response.status_code, 404)
+
+    # =========================================================================
+    # 21. ДОСТАВКА OUTBOX ПАЧКАМИ (bulk webhook)
+    # =========================================================================
+    def test_transfer_client_parses_per_event_acks(self):
+        client = self._transfer_client()
+        body = (
+            '{"results": [{"event_id": 1, "ok": true},'
+            ' {"event_id": 2, "ok": false, "error": "дубль"}, {"event_id": 3, "ok": false}]}'
+        )
+        with mock.patch.object(
+            client.session, "request", return_value=self._http_response(200, body)
+        ) as request:
+            acks = client.send_webhook_batch([{"event_id": 1}, {"event_id": 2}])
+
+        self.assertEqual(acks, {1: None, 2: "дубль", 3: "rejected"})
+        self.assertEqual(request.call_args.args[1], "http://transfer.test/api/transfer/webhook/bulk/")
+        self.assertEqual(request.call_args.kwargs["json"], [{"event_id": 1}, {"event_id": 2}])
+
+    @override_settings(OUTBOX_BULK_WEBHOOK=True, OUTBOX_BATCH_SIZE=20)
+    def test_outbox_backlog_drains_in_batches_with_single_update(self):
+        OutboxEvent.objects.bulk_create(
+            OutboxEvent(payload={"salesman_id": self.user.id, "n": i}) for i in range(45)
+        )
+
+        def ack_all(payloads):
+            return {payload["event_id"]: None for payload in payloads}
+
+        with mock.patch.object(
+            TransferClient, "send_webhook_batch", side_effect=ack_all
+        ) as batch, CaptureQueriesContext(connection) as queries:
+            self.assertEqual(process_outbox_events(), 45)
+
+        self.assertEqual([len(c.args[0]) for c in batch.call_args_list], [20, 20, 5])
+        self.assertEqual(batch.call_args_list[0].args[0][0]["n"], 0)
+        # На пачку: аренда (SELECT + UPDATE + SELECT) и один UPDATE подтвержденных —
+        # без запросов на каждое событие
+        self.assertEqual(len(queries.captured_queries), 12)
+        self.assertFalse(
+            OutboxEvent.objects.exclude(status=OutboxEvent.StatusChoices.SENT).exists()
+        )
+
+    @override_settings(OUTBOX_BULK_WEBHOOK=True, OUTBOX_BATCH_SIZE=10)
+    def test_outbox_batch_marks_only_acked_events(self):
+        events = OutboxEvent.objects.bulk_create(
+            OutboxEvent(payload={"salesman_id": self.user.id}) for _ in range(3)
+        )
+        key = BALANCE_KEY.format(agent_id=self.user.id)
+        cache.set(key, {"data": self.BALANCE, "fetched_at": time.time()})
+
+        acks = {events[0].id: None, events[1].id: "нет агента"}
+        with mock.patch.object(TransferClient, "send_webhook_batch", return_value=acks):
+            self.assertEqual(process_outbox_events(), 1)
+
+        statuses = dict(OutboxEvent.objects.values_list("id", "status"))
+        self.assertEqual(statuses[events[0].id], OutboxEvent.StatusChoices.SENT)
+        self.assertEqual(statuses[events[1].id], OutboxEvent.StatusChoices.PENDING)
+        self.assertEqual(statuses[events[2].id], OutboxEvent.StatusChoices.PENDING)
+        self.assertIsNone(cache.get(key))
+
+        # FastAPI лежит — ничего не помечаем, пачка уйдет на следующем проходе
+        OutboxEvent.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(
+            TransferClient, "send_webhook_batch", side_effect=TransferConnectionError("down")
+        ):
+            self.assertEqual(process_outbox_events(), 0)
+        self.assertEqual(
+            list(
+                OutboxEvent.objects.filter(status=OutboxEvent.StatusChoices.PENDING)
+                .order_by("id")
+                .values_list("attempts", "last_error")
+            ),
+            [(2, "down"), (2, "down")],
+        )
+
+    # =========================================================================
+    # 22. АРЕНДА СОБЫТИЙ OUTBOX (SKIP LOCKED / compare-and-swap)
+    # =========================================================================
+    def _assert_claims_once(self):
+        events = OutboxEvent.objects.bulk_create(OutboxEvent(payload={}) for _ in range(3))
+
+        first = claim(2)
+        self.assertEqual([e.id for e in first], [events[0].id, events[1].id])
+        self.assertTrue(all(e.status == OutboxEvent.StatusChoices.IN_FLIGHT for e in first))
+        self.assertTrue(all(e.claimed_by and e.lease_expires_at for e in first))
+
+        # Занятые второй раз не выдаются — только оставшееся свободное
+        self.assertEqual([e.id for e in claim(10)], [events[2].id])
+        self.assertEqual(claim(10), [])
+
+        # Воркер умер: после истечения аренды событие снова можно взять
+        OutboxEvent.objects.filter(id=events[0].id).update(
+            lease_expires_at=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        self.assertEqual([e.id for e in claim(10)], [events[0].id])
+
+    def test_outbox_claim_cas_fallback(self):
+        self.assertFalse(connection.features.has_select_for_update_skip_locked)
+        self._assert_claims_once()
+
+    def test_outbox_claim_skip_locked(self):
+        with mock.patch.object(
+            connection.features, "has_select_for_update_skip_locked", True
+        ):
+            self._assert_claims_once()
+
+    def test_single_send_skips_event_claimed_by_beat(self):
+        event = OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        claimed = claim(50)
+
+        with mock.patch.object(TransferClient, "send_webhook") as send:
+            send_single_outbox_event(event.id)
+        send.assert_not_called()
+
+        # Неудача у арендатора возвращает событие в очередь
+        with mock.patch.object(
+            TransferClient, "send_webhook", side_effect=TransferConnectionError("down")
+        ):
+            self.assertFalse(deliver_one(claimed[0]))
+        event.refresh_from_db()
+        self.assertEqual(event.status, OutboxEvent.StatusChoices.PENDING)
+        self.assertIsNone(event.lease_expires_at)
+        self.assertEqual(event.attempts, 1)
+
+        OutboxEvent.objects.filter(id=event.id).update(next_attempt_at=timezone.now())
+        with mock.patch.object(TransferClient, "send_webhook") as send:
+            send_single_outbox_event(event.id)
+            send_single_outbox_event(event.id)
+        send.assert_called_once()
+        event.refresh_from_db()
+        self.assertEqual(event.status, OutboxEvent.StatusChoices.SENT)
+
+    def _steal(self, event):
+        """Аренда истекла, и событие забрал воркер на другом хосте."""
+        OutboxEvent.objects.filter(id=event.id).update(
+            lease_expires_at=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        with mock.patch("finance.outbox.worker_id", return_value="other-host:1"):
+            (stolen,) = claim(1, event_ids=[event.id])
+        return stolen
+
+    def test_outbox_lease_expiring_mid_pass_does_not_resend_the_rest(self):
+        events = [OutboxEvent.objects.create(payload={}) for _ in range(3)]
+        sent = []
+
+        def slow_send(payload):
+            sent.append(payload["event_id"])
+            # Пока идет медленная отправка, хвост не арендован — ему нечему истекать,
+            # и перехватить его у нас нельзя
+            rest = [event.id for event in events if event.id not in sent]
+            self.assertEqual(
+                OutboxEvent.objects.filter(
+                    id__in=rest, status=OutboxEvent.StatusChoices.PENDING
+                ).count(),
+                len(rest),
+            )
+            if len(sent) == 1:
+                # Отправка дольше OUTBOX_LEASE_SECONDS: событие перехватил другой воркер
+                self._steal(events[0])
+
+        with mock.patch.object(TransferClient, "send_webhook", side_effect=slow_send):
+            process_outbox_events()
+
+        # Каждое событие ушло ровно один раз
+        self.assertEqual(sent, [event.id for event in events])
+        first = OutboxEvent.objects.get(id=events[0].id)
+        # Опоздавший отчет не перетер аренду нового владельца
+        self.assertEqual(first.status, OutboxEvent.StatusChoices.IN_FLIGHT)
+        self.assertEqual(first.claimed_by, "other-host:1")
+        self.assertEqual(
+            OutboxEvent.objects.filter(status=OutboxEvent.StatusChoices.SENT).count(), 2
+        )
+
+    def test_outbox_stale_worker_cannot_overwrite_new_owner(self):
+        event = OutboxEvent.objects.create(payload={})
+        (ours,) = claim(1)
+        theirs = self._steal(ours)
+
+        # Пока новый владелец шлет, старый отчитывается — ничего не меняется
+        mark_sent([ours])
+        retry_later([ours], "read timeout")
+        self.assertEqual(release([ours]), 0)
+        event.refresh_from_db()
+        self.assertEqual(
+            (event.status, event.claimed_by, event.attempts),
+            (OutboxEvent.StatusChoices.IN_FLIGHT, "other-host:1", 0),
+        )
+
+        # Новый владелец доставил — опоздавшая ошибка не вернет SENT в PENDING
+        with mock.patch("finance.outbox.worker_id", return_value="other-host:1"):
+            mark_sent([theirs])
+        retry_later([ours], "read timeout")
+        release([ours])
+        event.refresh_from_db()
+        self.assertEqual(event.status, OutboxEvent.StatusChoices.SENT)
+        self.assertEqual((event.attempts, event.last_error), (0, ""))
+
+    # =========================================================================
+    # 23. ПОВТОРЫ OUTBOX С ПАУЗОЙ И FAILED (backoff + dead letter)
+    # =========================================================================
+    @override_settings(OUTBOX_RETRY_BASE_DELAY=5, OUTBOX_RETRY_MAX_DELAY=60)
+    def test_outbox_backoff_grows_with_jitter_and_cap(self):
+        for attempts, full in ((1, 5), (2, 10), (3, 20), (4, 40), (5, 60), (20, 60)):
+            delays = [backoff_delay(attempts) for _ in range(50)]
+            self.assertTrue(all(full / 2 <= d <= full for d in delays), (attempts, delays))
+        self.assertGreater(len(set(backoff_delay(3) for _ in range(10))), 1)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=3)
+    def test_outbox_event_moves_to_failed_after_max_attempts(self):
+        event = OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        down = TransferAPIError(500, "boom")
+
+        for attempt in range(1, 4):
+            with mock.patch.object(TransferClient, "send_webhook", side_effect=down) as send:
+                process_outbox_events()
+                # Пока пауза не вышла, повторный проход beat событие не берет
+                process_outbox_events()
+            send.assert_called_once()
+
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            self.assertEqual(event.last_error, "500: boom")
+            if attempt < 3:
+                self.assertEqual(event.status, OutboxEvent.StatusChoices.PENDING)
+                self.assertGreater(event.next_attempt_at, timezone.now())
+                OutboxEvent.objects.filter(id=event.id).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(event.status, OutboxEvent.StatusChoices.FAILED)
+        with mock.patch.object(TransferClient, "send_webhook") as send:
+            process_outbox_events()
+        send.assert_not_called()
+
+    def test_outbox_open_circuit_does_not_burn_attempts(self):
+        events = [OutboxEvent.objects.create(payload={}) for _ in range(3)]
+        with mock.patch.object(
+            TransferClient, "send_webhook", side_effect=CircuitOpenError("open")
+        ) as send:
+            process_outbox_events()
+            # Предохранитель открыт — после первого отказа проход остановился
+            send.assert_called_once()
+
+            # Одноразовая таска тоже не падает: событие просто вернулось в очередь
+            OutboxEvent.objects.filter(id=events[0].id).update(next_attempt_at=timezone.now())
+            send_single_outbox_event(events[0].id)
+            self.assertEqual(send.call_count, 2)
+
+        for event in events:
+            event.refresh_from_db()
+            self.assertEqual(event.status, OutboxEvent.StatusChoices.PENDING)
+            self.assertEqual(event.attempts, 0)
+            self.assertEqual(event.claimed_by, "")
+        # Взятое событие отложено до пробы предохранителя, остальные и не арендовались
+        self.assertGreater(events[0].next_attempt_at, timezone.now())
+
+    def test_outbox_admin_requeues_failed_events(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        failed = OutboxEvent.objects.create(
+            payload={}, status=OutboxEvent.StatusChoices.FAILED, attempts=12, last_error="x"
+        )
+        in_flight = OutboxEvent.objects.create(
+            payload={}, status=OutboxEvent.StatusChoices.IN_FLIGHT
+        )
+        self.client.post(
+            reverse("admin:finance_outboxevent_changelist"),
+            {"action": "requeue", "_selected_action": [failed.id, in_flight.id]},
+        )
+
+        failed.refresh_from_db()
+        in_flight.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (OutboxEvent.StatusChoices.PENDING, 0))
+        self.assertEqual(in_flight.status, OutboxEvent.StatusChoices.IN_FLIGHT)
+
+    # =========================================================================
+    # 24. OUTBOX-ДИСПЕТЧЕР (LISTEN/NOTIFY вместо опроса каждые 5 сек)
+    # =========================================================================
+    def test_outbox_dispatcher_drains_queue_and_sleeps_until_next_retry(self):
+        now = timezone.now()
+        due = OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        OutboxEvent.objects.create(
+            payload={}, attempts=1, next_attempt_at=now + timezone.timedelta(seconds=20)
+        )
+
+        with mock.patch.object(TransferClient, "send_webhook") as send, mock.patch(
+            "finance.management.commands.run_outbox_dispatcher.time.sleep"
+        ) as sleep:
+            call_command("run_outbox_dispatcher", iterations=1, stderr=StringIO())
+
+        send.assert_called_once()
+        self.assertEqual(send.call_args.args[0]["event_id"], due.id)
+        # Спит не весь страховочный интервал, а до ближайшего повтора
+        self.assertAlmostEqual(sleep.call_args.args[0], 20, delta=1)
+
+    @override_settings(OUTBOX_SWEEP_INTERVAL=30)
+    def test_outbox_dispatcher_sleeps_sweep_interval_on_empty_queue(self):
+        with mock.patch(
+            "finance.management.commands.run_outbox_dispatcher.time.sleep"
+        ) as sleep, CaptureQueriesContext(connection) as queries:
+            call_command("run_outbox_dispatcher", iterations=2, stderr=StringIO())
+
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [30, 30])
+        # Пустая очередь: на круг — поиск событий и ближайшего повтора, без записи
+        self.assertFalse(any(q["sql"].startswith("UPDATE") for q in queries.captured_queries))
+
+    def test_outbox_dispatcher_reconnects_when_notify_poll_fails(self):
+        # Обрыв посреди ожидания NOTIFY: драйвер бросает свое исключение, а не DatabaseError
+        dropped = mock.Mock(notifies=[])
+        dropped.poll.side_effect = connection.Database.OperationalError("connection closed")
+        command = run_outbox_dispatcher.Command()
+
+        with mock.patch.object(connection, "connection", dropped):
+            with self.assertRaises(DatabaseError):
+                command._wait_notify(timeout=1)
+
+    # =========================================================================
+    # 25. ЧИСТКА OUTBOX ОКНАМИ ПО ID (+ помесячные секции на Postgres)
+    # =========================================================================
+    def _old_outbox(self, statuses):
+        events = OutboxEvent.objects.bulk_create(
+            OutboxEvent(payload={}, status=status) for status in statuses
+        )
+        OutboxEvent.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        return events
+
+    def test_outbox_cleanup_deletes_in_bounded_chunks(self):
+        sent, pending = OutboxEvent.StatusChoices.SENT, OutboxEvent.StatusChoices.PENDING
+        events = self._old_outbox([sent] * 25 + [pending] * 30 + [sent] * 5)
+        fresh = OutboxEvent.objects.create(payload={}, status=sent)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cleanup_sent(30, chunk_size=10, time_budget=60), (30, True))
+
+        deletes = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("DELETE")]
+        # 25 подряд — 3 окна; на дыре из PENDING одно пустое окно, дальше прыжок
+        # сразу к хвосту из 5 — еще одно (а не три пустых окна подряд)
+        self.assertEqual(len(deletes), 5)
+        self.assertEqual(
+            set(OutboxEvent.objects.values_list("id", flat=True)),
+            {e.id for e in events[25:55]} | {fresh.id},
+        )
+
+    def test_outbox_cleanup_stops_at_time_budget(self):
+        self._old_outbox([OutboxEvent.StatusChoices.SENT] * 30)
+
+        with mock.patch("finance.outbox.time.monotonic", side_effect=[0, 0, 0, 100]):
+            self.assertEqual(cleanup_sent(30, chunk_size=10, time_budget=5), (20, False))
+
+        # Следующий ночной запуск дочищает остаток
+        self.assertEqual(
+            cleanup_processed_outbox_events(), "Удалено 10 старых Outbox-записей."
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_outbox_partitioning_is_postgres_only(self):
+        self.assertEqual(add_months(timezone.datetime(2026, 11, 1).date(), 3).isoformat(), "2027-02-01")
+        self.assertEqual(
+            partition_name(timezone.datetime(2027, 2, 1).date()), "finance_outboxevent_2027_02"
+        )
+        if connection.vendor != "postgresql":
+            with self.assertRaises(CommandError):
+                call_command("partition_outbox", stdout=StringIO())
+
+    @skipUnless(connection.vendor == "postgresql", "секционирование — только на Postgres")
+    def test_outbox_partition_convert_keeps_events_and_drops_old_months(self):
+        long_ago = timezone.now() - timezone.timedelta(days=120)
+        old = OutboxEvent.objects.create(payload={}, status=OutboxEvent.StatusChoices.SENT)
+        pending = OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        OutboxEvent.objects.filter(id=old.id).update(created_at=long_ago)
+
+        call_command("partition_outbox", convert=True, ahead=1, stdout=StringIO())
+
+        self.assertTrue(is_partitioned())
+        self.assertEqual(
+            set(OutboxEvent.objects.values_list("id", flat=True)), {old.id, pending.id}
+        )
+        # Секции — от самого старого события до месяца вперед
+        names = [name for _, name in existing_partitions()]
+        self.assertEqual(names[0], partition_name(month_start(timezone.localtime(long_ago).date())))
+        self.assertIn(partition_name(add_months(month_start(timezone.localdate()), 1)), names)
+        # Identity продолжает счет после перенесенных строк, вставка (и триггер NOTIFY) живы
+        fresh = OutboxEvent.objects.create(payload={})
+        self.assertGreater(fresh.id, pending.id)
+
+        call_command("partition_outbox", drop_older_than=60, stdout=StringIO())
+        self.assertFalse(OutboxEvent.objects.filter(id=old.id).exists())
+        self.assertEqual(OutboxEvent.objects.filter(id__in=[pending.id, fresh.id]).count(), 2)
+
+    # =========================================================================
+    # 26. БЕНЧМАРК OUTBOX (bench_outbox + HTTP-заглушка FastAPI)
+    # =========================================================================
+    def _bench(self, **options):
+        out = StringIO()
+        call_command("bench_outbox", stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_bench_outbox_drains_against_stub_with_errors(self):
+        result = self._bench(events=20, error_rate=0.2, seed=7, bulk=False)
+
+        self.assertEqual((result["events"], result["sent"], result["duplicates"]), (20, 20, 0))
+        self.assertGreater(result["http_requests"]["/api/transfer/webhook/"], 20)
+        self.assertGreater(result["events_per_sec"], 0)
+        self.assertLessEqual(result["latency_p50_ms"], result["latency_p99_ms"])
+        self.assertGreater(result["queries_per_event"], 0)
+        # За собой бенч убирает
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_bench_outbox_bulk_mode_uses_one_request_per_batch(self):
+        result = self._bench(events=20, bulk=True, batch_size=7)
+        self.assertEqual(result["sent"], 20)
+        self.assertEqual(result["http_requests"], {"/api/transfer/webhook/bulk/": 3})
+
+    def test_bench_outbox_commit_mode_goes_through_sale_form(self):
+        result = self._bench(mode="commit", events=3, bulk=False)
+        self.assertEqual((result["events"], result["sent"]), (3, 3))
+        self.assertFalse(User.objects.filter(username="outbox_bench").exists())
+        self.assertFalse(Sale.objects.exists())
+
+    def test_bench_outbox_refuses_to_touch_real_queue(self):
+        OutboxEvent.objects.create(payload={"salesman_id": self.user.id})
+        with self.assertRaises(CommandError):
+            self._bench(events=1)
+
+    # =========================================================================
+    # 27. МЕТРИКИ OUTBOX (/metrics для Prometheus)
+    # =========================================================================
+    def _scrape(self):
+        return self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        self.assertEqual(
+            self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer nope").status_code, 401
+        )
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self._scrape().status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_expose_queue_gauges_from_cached_query(self):
+        OutboxEvent.objects.create(payload={})
+        OutboxEvent.objects.create(payload={}, status=OutboxEvent.StatusChoices.FAILED)
+        OutboxEvent.objects.filter(status=OutboxEvent.StatusChoices.PENDING).update(
+            created_at=timezone.now() - timezone.timedelta(minutes=5)
+        )
+
+        response = self._scrape()
+        body = response.content.decode()
+        self.assertIn('outbox_events{status="pending"} 1', body)
+        self.assertIn('outbox_events{status="failed"} 1', body)
+        age = float(re.search(r"^outbox_oldest_pending_age_seconds (\S+)$", body, re.M)[1])
+        self.assertAlmostEqual(age, 300, delta=5)
+
+        # Повторный scrape — гауги из кэша: к outbox-таблице не ходим
+        with CaptureQueriesContext(connection) as queries:
+            self._scrape()
+        self.assertFalse(any("finance_outboxevent" in q["sql"] for q in queries.captured_queries))
+
+    @override_settings(METRICS_TOKEN="secret", OUTBOX_MAX_ATTEMPTS=1)
+    def test_metrics_count_delivery_outcomes_and_latency(self):
+        self._old_outbox([OutboxEvent.StatusChoices.SENT] * 3)
+        cleanup_sent(30)
+
+        OutboxEvent.objects.create(payload={})
+        OutboxEvent.objects.create(payload={})
+        with mock.patch.object(
+            TransferClient, "send_webhook", side_effect=[None, TransferAPIError(500, "boom")]
+        ):
+            process_outbox_events()
+
+        body = self._scrape().content.decode()
+        self.assertIn('outbox_delivery_attempts_total{outcome="sent"} 1', body)
+        self.assertIn('outbox_delivery_attempts_total{outcome="failed"} 1', body)
+        self.assertIn('outbox_delivery_attempts_total{outcome="error"} 0', body)
+        self.assertIn("outbox_cleanup_deleted_total 3", body)
+        self.assertIn('outbox_commit_to_sent_seconds_bucket{le="+Inf"} 1', body)
+        self.assertIn('outbox_webhook_seconds_count{mode="single"} 2', body)
+        self.assertIn('outbox_webhook_seconds_bucket{mode="single",le="+Inf"} 2', body)
+
+    # =========================================================================
+    # 28. SERVER-TIMING (SQL / FastAPI / шаблоны по запросу)
+    # =========================================================================
+    @staticmethod
+    def _server_timing(response) -> dict:
+        return {
+            part.split(";")[0].strip(): float(re.search(r"dur=([\d.]+)", part)[1])
+            for part in response["Server-Timing"].split(",")
+        }
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_server_timing_breaks_down_dashboard(self):
+        Sale.objects.create(salesman=self.user, sale_amount=Decimal("1000.00"))
+
+        with StubTransferService() as stub, stub_client(stub.base_url):
+            with self.assertLogs("finance.timing", "INFO") as logs:
+                response = self.client.get(reverse("dashboard"))
+
+        timing = self._server_timing(response)
+        self.assertEqual(set(timing), {"db", "http", "tpl", "total"})
+        self.assertGreater(timing["tpl"], 0)
+        self.assertGreaterEqual(timing["total"], timing["tpl"])
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line["url_name"], "dashboard")
+        self.assertEqual(line["status"], 200)
+        # Балансы FastAPI — один GET в заглушку, его время тоже в разбивке
+        self.assertEqual(line["http_calls"], stub.requests["/api/transfer/balance/"])
+        self.assertEqual(line["http_calls"], 1)
+        self.assertGreater(line["http_ms"], 0)
+
+        # Число SQL — то же, что видит сам Django
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs("finance.timing", "INFO") as logs:
+                self.client.get(reverse("sale_create"))
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line["url_name"], "sale_create")
+        self.assertEqual(line["db_queries"], len(queries.captured_queries))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_server_timing_skips_unsampled_requests(self):
+        with self.assertNoLogs("finance.timing", "INFO"):
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1, DASHBOARD_BALANCE_DEADLINE=5)
+    async def test_server_timing_follows_async_dashboard_into_threads(self):
+        await self.async_client.aforce_login(self.user)
+
+        # SQL идет в потоке sync_to_async, HTTP — в asyncio.to_thread: оба в разбивке
+        with StubTransferService() as stub, stub_client(stub.base_url):
+            with self.assertLogs("finance.timing", "INFO") as logs:
+                response = await self.async_client.get(reverse("dashboard"))
+
+        self.assertIn("Server-Timing", response)
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line["url_name"], "dashboard")
+        self.assertGreater(line["db_queries"], 0)
+        self.assertEqual(line["http_calls"], 1)
+        self.assertGreater(line["tpl_ms"], 0)
+
+    # =========================================================================
+    # 29. СИНТЕТИЧЕСКИЕ ДАННЫЕ И МИКРОБЕНЧМАРКИ (generate_data, bench_views)
+    # =========================================================================
+    def _synthetic(self, seed=7):
+        return synthetic.generate(
+            users=3, sales=60, presentations=15, comment_ratio=0.5, seed=seed, batch_size=25
+        )
+
+    def test_synthetic_data_is_consistent_and_reproducible(self):
+        counts = self._synthetic()
+        self.assertEqual(counts["users"], 3)
+        self.assertEqual(counts["sales"], 60)
+        self.assertEqual(counts["presentations"], 15)
+
+        sales = Sale.objects.filter(salesman__username__startswith=synthetic.USERNAME_PREFIX)
+        self.assertGreater(len({sale.payment_type for sale in sales}), 2)
+        # История, а не «все создано сейчас»
+        self.assertGreater(len({sale.created_at.date() for sale in sales}), 10)
+
+        # Outbox: по SENT-событию на каждый перевод, в очередь ничего не попало
+        transfers = sales.filter(payment_type=Sale.PaymentChoices.TRANSFER)
+        self.assertEqual(OutboxEvent.objects.count(), transfers.count())
+        self.assertFalse(OutboxEvent.objects.exclude(status=OutboxEvent.StatusChoices.SENT).exists())
+        self.assertEqual(
+            PartnerRate.objects.filter(user__username__startswith=synthetic.USERNAME_PREFIX).count(),
+            transfers.values("salesman", "partner_name").distinct().count(),
+        )
+
+        # bulk_create сигналы не шлет — агрегаты пересчитаны в конце
+        rollups = MonthlyRollup.objects.filter(kind=MonthlyRollup.KindChoices.SALES)
+        self.assertEqual(
+            sum(rollup.total for rollup in rollups), sum(sale.sale_amount for sale in sales)
+        )
+
+        snapshot = list(sales.order_by("id").values_list("payment_type", "sale_amount"))
+        self.assertEqual(synthetic.clear(), 3)
+        self.assertFalse(Sale.objects.filter(salesman__username__startswith="synth_").exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+        self._synthetic()
+        self.assertEqual(
+            list(sales.order_by("id").values_list("payment_type", "sale_amount")), snapshot
+        )
+
+    def test_bench_views_flags_regressions_against_baseline(self):
+        self._synthetic()
+        path = f"{tempfile.mkdtemp()}/baseline.json"
+        call_command("bench_views", repeat=1, save_baseline=path, stdout=StringIO(), stderr=StringIO())
+        with open(path, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        self.assertEqual(set(baseline["results"]), {
+            "dashboard_sales", "dashboard_presentations", "sale_detail",
+            "presentation_detail", "monthly_totals", "bonus_calculation",
+        })
+
+        # Базовая линия «помнит» на запрос меньше — значит, сейчас лишний запрос
+        baseline["results"]["sale_detail"]["queries"] -= 1
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(baseline, fh)
+        # Время с repeat=1 шумит — порог по мс задираем, ловим только число запросов
+        with self.assertRaisesMessage(CommandError, "Регрессий: 1"):
+            call_command(
+                "bench_views", repeat=1, baseline=path, case=["sale_detail"],
+                min_delta_ms=10_000, stdout=StringIO(), stderr=StringIO(),
+            )
+
+    def test_find_regressions_ignores_noise(self):
+        baseline = {"fast": {"median_ms": 1.0, "queries": 3}, "slow": {"median_ms": 100.0, "queries": 3}}
+        results = {
+            # +100%, но на 1 мс — шум
+            "fast": {"median_ms": 2.0, "queries": 3},
+            "slow": {"median_ms": 130.0, "queries": 3},
+        }
+        self.assertEqual(
+            [name for name, _ in find_regressions(results, baseline, 0.2, 2.0)], ["slow"]
+        )
+        results["slow"]["median_ms"] = 110.0
+        self.assertEqual(find_regressions(results, baseline, 0.2, 2.0), [])
+
+    # =========================================================================
+    # 30. НАГРУЗОЧНЫЙ ТЕСТ (load_test: виртуальные агенты)
+    # =========================================================================
+    def test_load_test_drives_dashboard_stream_and_sales(self):
+        synthetic.generate(users=1, sales=5, presentations=0)
+        out = StringIO()
+        call_command(
+            "load_test", agents="1", duration=1.0, ramp_up=0,
+            dashboard_interval=0.3, sale_interval=0.25, seed=3, stdout=out, stderr=StringIO(),
+        )
+        result = json.loads(out.getvalue())
+
+        stage = result["stages"][0]
+        self.assertEqual(stage["agents"], 1)
+        self.assertEqual(stage["error_rate"], 0)
+        endpoints = stage["endpoints"]
+        # Аккордеон приходит по SSE: поток один, фрагмент сервер прислал сам, опроса нет
+        self.assertEqual(endpoints["transfer_stream"]["requests"], 1)
+        self.assertEqual(endpoints["transfer_stream"]["statuses"], {"200": 1})
+        self.assertGreaterEqual(endpoints["transfer_stream"]["events"], 1)
+        self.assertNotIn("transfer_accordion", endpoints)
+        self.assertEqual(set(endpoints["sale_create"]["statuses"]), {"302"})
+        self.assertLessEqual(
+            endpoints["sale_create"]["p50_ms"], endpoints["sale_create"]["max_ms"]
+        )
+
+        # Каждый проведенный перевод — событие Outbox
+        created = Sale.objects.filter(partner_name="load-test")
+        self.assertGreaterEqual(created.count(), endpoints["sale_create"]["requests"])
+        self.assertEqual(
+            OutboxEvent.objects.filter(payload__partner_name="load-test").count(), created.count()
+        )
+
+    def test_load_test_legacy_poll_hits_accordion_with_etag(self):
+        synthetic.generate(users=1, sales=0, presentations=0)
+        out = StringIO()
+        call_command(
+            "load_test", agents="1", duration=0.5, ramp_up=0, legacy_poll=True,
+            poll_interval=0.05, dashboard_interval=0, sale_interval=0, seed=3,
+            stdout=out, stderr=StringIO(),
+        )
+        endpoints = json.loads(out.getvalue())["stages"][0]["endpoints"]
+
+        self.assertNotIn("transfer_stream", endpoints)
+        self.assertGreater(endpoints["transfer_accordion"]["requests"], 3)
+        # Повторный опрос с If-None-Match — 304 без рендера
+        self.assertIn("304", endpoints["transfer_accordion"]["statuses"])
+
+    def test_load_test_stats_count_errors_per_endpoint(self):
+        stats = Stats()
+        stats.record("dashboard", 5.0, 200, True)  # разгон — не считается
+        stats.recording = True
+        for ms in (10.0, 20.0, 30.0):
+            stats.record("dashboard", ms, 200, True)
+        stats.record("dashboard", 500.0, 500, False)
+        stats.record("transfer_accordion", 1.0, "ConnectionError", False)
+
+        report = stats.report(duration=2.0)
+        dashboard = report["endpoints"]["dashboard"]
+        self.assertEqual(dashboard["requests"], 4)
+        self.assertEqual(dashboard["rps"], 2.0)
+        self.assertEqual(dashboard["error_rate"], 0.25)
+        self.assertEqual(dashboard["p50_ms"], 20.0)
+        self.assertEqual(dashboard["p99_ms"], 500.0)
+        self.assertEqual(dashboard["statuses"], {"200": 3, "500": 1})
+        self.assertEqual(report["endpoints"]["transfer_accordion"]["statuses"], {"ConnectionError": 1})
+        self.assertEqual(report["requests"], 5)
+        self.assertEqual(report["error_rate"], 0.4)
+        self.assertNotIn("sale_create", report["endpoints"])
+
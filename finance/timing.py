@@ -0,0 +1,160 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+
+# Разбивка времени запроса: SQL, HTTP к FastAPI, шаблоны, всего.
+#
+# Замеры копятся в объекте текущего запроса (ContextVar): он доезжает и в потоки
+# sync_to_async / asyncio.to_thread, так что асинхронный дашборд считается целиком.
+# Запрос вне выборки (SERVER_TIMING_SAMPLE_RATE) стоит одного ContextVar.get
+# на SQL-запрос / HTTP-вызов / шаблон.
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        # list.append атомарен: в дашборде SQL и HTTP пишут из разных потоков
+        self.sql = []
+        self.http = []
+        self.templates = []
+        self.template_depth = 0
+
+    def as_dict(self, total: float) -> dict:
+        return {
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(sum(self.sql) * 1000, 1),
+            "db_queries": len(self.sql),
+            "http_ms": round(sum(self.http) * 1000, 1),
+            "http_calls": len(self.http),
+            "tpl_ms": round(sum(self.templates) * 1000, 1),
+        }
+
+
+def record_http(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.http.append(seconds)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.sql.append(time.perf_counter() - started)
+
+
+def install_sql_wrapper(connection):
+    # connection_created приходит и при переподключении того же объекта — не дублируем
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+class TimedTemplate:
+    """Обертка шаблона бэкенда: меряет render, вложенные render_to_string не задваивает."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return self.template.render(context, request)
+        timing.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_depth -= 1
+            if not timing.template_depth:
+                timing.templates.append(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _sampled() -> bool:
+    rate = settings.SERVER_TIMING_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _finish(request, response, timing: RequestTiming, total: float):
+    data = timing.as_dict(total)
+    match = request.resolver_match
+    url_name = match.view_name if match is not None else None
+
+    response["Server-Timing"] = ", ".join(
+        [
+            f'db;dur={data["db_ms"]};desc="{data["db_queries"]} queries"',
+            f'http;dur={data["http_ms"]};desc="{data["http_calls"]} calls"',
+            f'tpl;dur={data["tpl_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ]
+    )
+    logger.info(
+        json.dumps(
+            {
+                "event": "request_timing",
+                "url_name": url_name,
+                "method": request.method,
+                "status": response.status_code,
+                **data,
+            }
+        )
+    )
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            if not _sampled():
+                return await get_response(request)
+            timing = RequestTiming()
+            token = _current.set(timing)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timing, time.perf_counter() - started)
+            return response
+
+    else:
+
+        def middleware(request):
+            if not _sampled():
+                return get_response(request)
+            timing = RequestTiming()
+            token = _current.set(timing)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timing, time.perf_counter() - started)
+            return response
+
+    return middleware
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from typing import TypedDict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import timing
+from .circuit import CircuitBreaker
+
+# Единый клиент к FastAPI-сервису переводов: одна requests.Session на процесс,
+# keep-alive и пул соединений вместо нового TCP/TLS на каждый вызов.
+
+
+class TransferServiceError(Exception):
+    pass
+
+
+class TransferConnectionError(TransferServiceError):
+    """Сервис недоступен: таймаут, отказ в соединении и т.п."""
+
+
+class CircuitOpenError(TransferConnectionError):
+    """Предохранитель открыт: сервис недавно падал, не ждем таймаут, а отказываем сразу."""
+
+
+class TransferAPIError(TransferServiceError):
+    """Сервис ответил, но не 2xx (или прислал мусор вместо чисел)."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class PartnerBalance(TypedDict):
+    partner_name: str
+    debt: Decimal
+    partner_profit: Decimal
+
+
+class Balance(TypedDict):
+    cash_debt: Decimal
+    daily_profit: Decimal
+    monthly_profit: Decimal
+    partners: list
+
+
+def parse_decimal(value) -> Decimal:
+    if value is None or value == "":
+        return Decimal("0")
+    try:
+        # str(): float из JSON превращаем в Decimal без хвоста двоичной погрешности
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise TransferAPIError(200, f"Некорректное число: {value!r}")
+
+
+def parse_balance(data: dict) -> Balance:
+    data["cash_debt"] = parse_decimal(data.get("cash_debt"))
+    data["daily_profit"] = parse_decimal(data.get("daily_profit"))
+    data["monthly_profit"] = parse_decimal(data.get("monthly_profit"))
+
+    partners = data.get("partners") or []
+    for partner in partners:
+        partner["debt"] = parse_decimal(partner.get("debt"))
+        partner["partner_profit"] = parse_decimal(partner.get("partner_profit"))
+    data["partners"] = partners
+    return data
+
+
+class TransferClient:
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int,
+        connect_timeout: float,
+        read_timeout: float,
+        breaker: CircuitBreaker = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        # Сокеты не переживают fork (prefork Celery, gunicorn --preload):
+        # в дочернем процессе открываем свой пул
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _request(self, method: str, path: str, read_timeout: float = None, **kwargs):
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError("Сервис переводов временно недоступен")
+
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, f"{self.base_url}{path}", timeout=timeout, **kwargs
+            )
+        except requests.RequestException as exc:
+            self._record(failed=True)
+            raise TransferConnectionError(str(exc)) from exc
+        finally:
+            timing.record_http(time.perf_counter() - started)
+
+        # 4xx — сервис жив, это ошибка запроса; предохранитель считает только 5xx и сеть
+        self._record(failed=response.status_code >= 500)
+
+        if not 200 <= response.status_code < 300:
+            raise TransferAPIError(response.status_code, response.text)
+        return response
+
+    def _record(self, failed: bool):
+        if self.breaker is None:
+            return
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _json(self, response) -> dict:
+        try:
+            return response.json()
+        except ValueError:
+            raise TransferAPIError(response.status_code, response.text)
+
+    def get_balance(self, agent_id: int) -> Balance:
+        response = self._request(
+            "GET",
+            f"/api/transfer/balance/{agent_id}",
+            read_timeout=settings.TRANSFER_BALANCE_TIMEOUT,
+        )
+        return parse_balance(self._json(response))
+
+    def reconcile(self, agent_id: int, partner_name: str, amount: Decimal) -> None:
+        # На проводе формат прежний: сумма числом
+        self._request(
+            "POST",
+            "/api/transfer/reconcile/",
+            json={
+                "agent_id": agent_id,
+                "partner_name": partner_name,
+                "amount_received": float(amount),
+            },
+        )
+
+    def clear_cash(self, agent_id: int) -> None:
+        self._request("POST", f"/api/transfer/clear_cash/{agent_id}")
+
+    def send_webhook(self, payload: dict) -> None:
+        self._request(
+            "POST",
+            "/api/transfer/webhook/",
+            read_timeout=settings.TRANSFER_WEBHOOK_TIMEOUT,
+            json=payload,
+        )
+
+    def send_webhook_batch(self, payloads: list) -> dict:
+        """Пачка событий одним POST. Возвращает {event_id: None | текст ошибки}.
+
+        FastAPI подтверждает каждое событие отдельно:
+        {"results": [{"event_id": 1, "ok": true}, {"event_id": 2, "ok": false, "error": "..."}]}
+        События, которых нет в ответе, считаем недоставленными.
+        """
+        response = self._request(
+            "POST",
+            "/api/transfer/webhook/bulk/",
+            read_timeout=settings.TRANSFER_WEBHOOK_TIMEOUT,
+            json=payloads,
+        )
+        results = self._json(response).get("results") or []
+        return {
+            item["event_id"]: None if item.get("ok") else (item.get("error") or "rejected")
+            for item in results
+            if "event_id" in item
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TransferClient:
+    """Клиент на процесс (настройки читаются один раз)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TransferClient(
+                    base_url=settings.FASTAPI_BASE_URL,
+                    pool_size=settings.TRANSFER_POOL_SIZE,
+                    connect_timeout=settings.TRANSFER_CONNECT_TIMEOUT,
+                    read_timeout=settings.TRANSFER_READ_TIMEOUT,
+                    breaker=CircuitBreaker(
+                        "transfer",
+                        failure_threshold=settings.TRANSFER_CIRCUIT_FAILURE_THRESHOLD,
+                        window=settings.TRANSFER_CIRCUIT_WINDOW,
+                        reset_timeout=settings.TRANSFER_CIRCUIT_RESET_TIMEOUT,
+                    ),
+                )
+    return _client
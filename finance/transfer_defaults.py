@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PartnerRate
+
+# Форма продажи открывается чаще всего остального: ее «липкие» поля читаются из
+# кэша, а в БД лежит маленькая таблица PartnerRate (строка на агента и обменника).
+CACHE_KEY = "transfer_defaults:{user_id}"
+
+
+def _serialize(rate: PartnerRate) -> dict:
+    return {
+        "partner_name": rate.partner_name,
+        "client_rate": rate.client_rate,
+        "partner_rate": rate.partner_rate,
+    }
+
+
+def get_transfer_defaults(user_id) -> list:
+    """Недавние курсы агента, свежие первыми: [0] — значения по умолчанию для формы."""
+    key = CACHE_KEY.format(user_id=user_id)
+    partners = cache.get(key)
+    if partners is None:
+        partners = [
+            _serialize(rate)
+            for rate in PartnerRate.objects.filter(user_id=user_id)[
+                : settings.TRANSFER_DEFAULTS_PARTNERS
+            ]
+        ]
+        cache.set(key, partners, timeout=None)
+    return partners
+
+
+def _forget(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
+
+
+def remember_transfer(sale):
+    """Запоминает партнера и курсы только что сохраненного перевода."""
+    PartnerRate.objects.update_or_create(
+        user_id=sale.salesman_id,
+        partner_name=sale.partner_name or "",
+        defaults={
+            "client_rate": sale.client_rate,
+            "partner_rate": sale.partner_rate,
+            "used_at": timezone.now(),
+        },
+    )
+    # Сразу и после коммита — как с версией дашборда (см. dashboard_cache.bump_data_version)
+    _forget(sale.salesman_id)
+    transaction.on_commit(lambda: _forget(sale.salesman_id))
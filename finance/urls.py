@@ -2,7 +2,7 @@ from django.urls import path
 
 from .views import (
     LandingPageView,
-    HomePageView,
+    dashboard_async_view,
     SaleDetailView,
     SaleCreateView,
     SaleUpdateView,
@@ -16,7 +16,11 @@ from .views import (
     PresentationDeleteView,
     reconcile_partner,
     clear_cash_view,
-    transfer_accordion_view
+    transfer_accordion_view,
+    transfer_stream_view,
+    transfer_status_view,
+    metrics_view,
+    payroll_csv_view,
 )
 
 urlpatterns = [
@@ -38,6 +42,10 @@ urlpatterns = [
     path('reconcile/', reconcile_partner, name='reconcile_partner'),
     path('clear-cash/', clear_cash_view, name='clear_cash'),
     path('transfer-accordion/', transfer_accordion_view, name='transfer_accordion'),
+    path('transfer-stream/', transfer_stream_view, name='transfer_stream'),
+    path('transfer-status/', transfer_status_view, name='transfer_status'),
+    path('metrics', metrics_view, name='metrics'),
+    path('payroll/<int:pk>/csv/', payroll_csv_view, name='payroll_csv'),
     
     # Презентации (Presentations)
     path("presentation/<int:pk>/update/", PresentationUpdateView.as_view(), name="presentation_update"),
@@ -46,6 +54,8 @@ urlpatterns = [
     path("presentation/create/", PresentationCreateView.as_view(), name="presentation_create"),
     
     # Главные страницы
-    path("dashboard/", HomePageView.as_view(), name="dashboard"),
+    # Дашборд под ASGI (uvicorn): БД и балансы параллельно, с дедлайном.
+    # Догрузку строк и ?page= он сам отдает синхронному HomePageView
+    path("dashboard/", dashboard_async_view, name="dashboard"),
     path("", LandingPageView.as_view(), name="home"),
 ]
\ No newline at end of file
@@ -1,12 +1,15 @@
-import requests
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from django.conf import settings
-from django.shortcuts import redirect, render
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.shortcuts import get_object_or_404, redirect, render
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.forms import BaseModelForm
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import (
     TemplateView,
     ListView,
@@ -16,14 +19,32 @@ from django.views.generic import (
     DeleteView,
 )
 from django.views.decorators.http import require_POST
-from django.db.models import Sum
-from django.utils import timezone
 from django.urls import reverse, reverse_lazy
+from django.utils.crypto import constant_time_compare
 from django.db import transaction
+from django.db.models import Prefetch
 
-from .models import Sale, Comment, Presentation, PresentationComment, OutboxEvent
+from .models import Sale, Comment, Presentation, PresentationComment, OutboxEvent, PayrollRun
 from .forms import CommentForm, PresentationCommentForm
+from .mixins import OwnerScopedMixin
 from .tasks import send_single_outbox_event
+from .pagination import InvalidCursor, paginate_keyset
+from .dashboard import (
+    PAGE_SIZE,
+    build_dashboard_fragments,
+    dashboard_queryset,
+    get_dashboard_totals,
+    get_transfer_data,
+    render_dashboard_list,
+    resolve_tab,
+)
+from . import dashboard_cache
+from .balance_cache import evict_balance
+from .streams import accordion_events
+from .transfer_client import TransferAPIError, TransferServiceError, get_client
+from .transfer_defaults import get_transfer_defaults, remember_transfer
+from .conditional import accordion_etag, make_etag, not_modified, set_validator
+from . import metrics
 
 
 class LandingPageView(TemplateView):
@@ -40,106 +61,151 @@ class LandingPageView(TemplateView):
 class HomePageView(LoginRequiredMixin, ListView):
     template_name = "finance/home.html"
     context_object_name = "items"
-    paginate_by = 50
+    paginate_by = PAGE_SIZE
 
-    def get_queryset(self):
+    def get(self, request, *args, **kwargs):
         # 1. Ловим текущий таб из URL (по дефолту — sales)
-        self.active_tab = self.request.GET.get("tab", "sales")
+        self.active_tab = resolve_tab(request.GET.get("tab"))
+
+        if self.is_load_more():
+            # Те же строки для той же версии данных — браузеру хватит 304
+            etag = make_etag(
+                "more",
+                dashboard_cache.fragment_key(
+                    request.user.id, self.active_tab, self._get_page_key()
+                ),
+            )
+            response = not_modified(request, etag)
+            if response is None:
+                response = set_validator(super().get(request, *args, **kwargs), etag)
+            return response
+
+        # 2. Шапка с суммами и список уже отрендерены для этой версии данных?
+        self.fragment_key = dashboard_cache.fragment_key(
+            request.user.id, self.active_tab, self._get_page_key()
+        )
+        fragments = dashboard_cache.get_fragments(self.fragment_key)
+        if fragments is None:
+            return super().get(request, *args, **kwargs)
+
+        # Кэш-хит: ни запросов к продажам, ни рендера списка — только балансы и обертка
+        self.object_list = []
+        context = {
+            **fragments,
+            "active_tab": self.active_tab,
+            "currency_symbol": "฿",
+            "transfer_data": get_transfer_data(request.user.id),
+        }
+        return self.render_to_response(context)
+
+    def _get_page_key(self):
+        if "page" in self.request.GET:
+            return f"page={self.request.GET['page']}"
+        return self.request.GET.get("cursor", "")
 
-        if self.active_tab not in ("sales", "presentations"):
-            self.active_tab = "sales"
+    def get_queryset(self):
+        return dashboard_queryset(self.request.user, self.active_tab)
 
-        if self.active_tab == "presentations":
-            # Возвращаем презентации текущего пользователя
-            return Presentation.objects.filter(
-                presenter=self.request.user
-            ).prefetch_related("presentation_comments")
+    def paginate_queryset(self, queryset, page_size):
+        # ?page=N — старые ссылки с OFFSET + COUNT(*); по умолчанию курсор по (created_at, id)
+        if "page" in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
 
-        # Возвращаем продажи + лениво подгружаем комменты, чтобы не плодить N+1 запросы
-        return Sale.objects.filter(salesman=self.request.user).prefetch_related(
-            "comments"
+        try:
+            page = paginate_keyset(queryset, self.request.GET.get("cursor"), page_size)
+        except InvalidCursor:
+            raise Http404("Некорректный курсор пагинации")
+
+        self.cursor_page = page
+        return (None, page, page.object_list, False)
+
+    def is_load_more(self):
+        # HTMX-кнопка «Загрузить ещё»: нужны только следующие строки, без шапки и балансов
+        return bool(
+            self.request.headers.get("HX-Request") and self.request.GET.get("cursor")
         )
 
+    def get_template_names(self):
+        if self.is_load_more():
+            return ["finance/includes/dashboard_more.html"]
+        return super().get_template_names()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         context["active_tab"] = self.active_tab
+        context["cursor_page"] = getattr(self, "cursor_page", None)
 
-        total = self._get_current_month_total()
-        percent = self._get_bonus_percent(total, self.active_tab)
+        if self.is_load_more():
+            return context
 
-        context["total_amount"] = total
-        context["bonus_percent"] = percent
-        context["bonus_amount"] = (total * percent / Decimal("100")).quantize(
-            Decimal("0.01")
-        )
+        # Суммы за месяц и бонус — см. finance/dashboard.py
+        totals = get_dashboard_totals(self.request.user, self.active_tab)
+        context.update(totals)
         context["currency_symbol"] = "฿"
 
-        agent_id = self.request.user.id
-        fastapi_url = f"{settings.FASTAPI_BASE_URL}/api/transfer/balance/{agent_id}"
+        # Список + пагинация рендерятся один раз на версию данных и уходят в кэш
+        context["dashboard_list_html"] = render_dashboard_list(self.request, context)
+        dashboard_cache.set_fragments(
+            self.fragment_key,
+            {**totals, "dashboard_list_html": context["dashboard_list_html"]},
+        )
 
-        try:
-            response = requests.get(fastapi_url, timeout=2)
-            if response.status_code == 200:
-                transfer_data = response.json()
-                
-                # 🛠 КОНВЕРТАЦИЯ СТРОК В ЧИСЛА ДЛЯ ШАБЛОНИЗАТОРА
-                transfer_data["cash_debt"] = float(transfer_data.get("cash_debt", 0))
-                transfer_data["daily_profit"] = float(transfer_data.get("daily_profit", 0))
-                transfer_data["monthly_profit"] = float(transfer_data.get("monthly_profit", 0))
-                
-                # Прогоняем партнеров на случай математики в HTML
-                for partner in transfer_data.get("partners", []):
-                    partner["debt"] = float(partner.get("debt", 0))
-                    partner["partner_profit"] = float(partner.get("partner_profit", 0))
-                    
-                context["transfer_data"] = transfer_data
-            else:
-                context["transfer_data"] = None
-        except requests.RequestException:
-            context["transfer_data"] = None
+        context["transfer_data"] = get_transfer_data(self.request.user.id)
 
         return context
 
-    def _get_current_month_total(self):
-        today = timezone.now().date()
-        start_of_month = today.replace(day=1)
-        # 2. Считаем общую сумму в зависимости от выбранной вкладки
-        if self.active_tab == "presentations":
-            return Presentation.objects.filter(
-                presenter=self.request.user,
-                created_at__date__range=[start_of_month, today],
-            ).aggregate(total=Sum("group_sales_total"))["total"] or Decimal("0.00")
-
-        return Sale.objects.filter(
-            salesman=self.request.user, created_at__date__range=[start_of_month, today]
-        ).aggregate(total=Sum("sale_amount"))["total"] or Decimal("0.00")
-
-    @staticmethod
-    def _get_bonus_percent(total: Decimal, tab: str) -> Decimal:
-        if tab == "presentations":
-            if total < Decimal("1000000"):
-                return Decimal("2.50")
-            elif total < Decimal("1350000"):
-                return Decimal("2.75")
-            elif total < Decimal("1500000"):
-                return Decimal("3.15")
-            elif total < Decimal("2000000"):
-                return Decimal("3.35")
-            else:
-                return Decimal("3.50")
-
-        # Продажи
-        if total < Decimal("250000"):
-            return Decimal("1.85")
-        elif total < Decimal("600000"):
-            return Decimal("2.00")
-        elif total < Decimal("800000"):
-            return Decimal("2.35")
-        elif total <= Decimal("1000000"):
-            return Decimal("2.75")
-        else:
-            return Decimal("3.00")
+
+@login_required
+async def dashboard_async_view(request):
+    """Дашборд под ASGI: список/суммы из БД и балансы FastAPI идут параллельно.
+
+    Балансы ждем не дольше DASHBOARD_BALANCE_DEADLINE — иначе отдаем страницу с
+    заглушкой, а аккордеон придет первым событием SSE-канала (transfer_stream).
+    """
+    user = await request.auser()
+    request.user = user
+
+    # Догрузка строк и старые ?page= ссылки — это синхронный ListView как есть
+    if request.GET.get("page") or (
+        request.headers.get("HX-Request") and request.GET.get("cursor")
+    ):
+        return await sync_to_async(HomePageView.as_view())(request)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.DASHBOARD_BALANCE_DEADLINE
+    active_tab = resolve_tab(request.GET.get("tab"))
+
+    # HTTP к FastAPI — в отдельном потоке, чтобы не ждать его за спиной ORM
+    balance_task = asyncio.ensure_future(asyncio.to_thread(get_transfer_data, user.id))
+    try:
+        # Суммы и список — одной задачей, параллельно только с HTTP. У Django
+        # соединение с БД на поток, а thread_sensitive-задачи идут в одном потоке
+        # по очереди: две задачи ничего бы не дали. Разнести по разным потокам —
+        # это два соединения на запрос (вдвое больше коннектов к Postgres) ради
+        # одного индексного SELECT из MonthlyRollup; к тому же оба результата
+        # ложатся в один кэш фрагментов
+        fragments = await sync_to_async(build_dashboard_fragments)(
+            request, user, active_tab, request.GET.get("cursor", "")
+        )
+    except BaseException:
+        balance_task.cancel()
+        raise
+
+    done, _ = await asyncio.wait(
+        {balance_task}, timeout=max(deadline - loop.time(), 0)
+    )
+    # Не успели — поток дождется своего timeout=2 сам, результат просто выбросим
+    transfer_data = balance_task.result() if done else None
+
+    context = {
+        **fragments,
+        "active_tab": active_tab,
+        "currency_symbol": "฿",
+        "transfer_data": transfer_data,
+        "transfer_pending": not done,
+    }
+    return await sync_to_async(render)(request, "finance/home.html", context)
 
 
 # ==========================================
@@ -161,29 +227,43 @@ class SaleCreateView(LoginRequiredMixin, CreateView):
     ]
 
     def get_success_url(self):
-        # Метка created=1 скажет HTMX, что пора сделать отложенный опрос
-        return f"{reverse('dashboard')}?tab=sales&created=1"
+        # Новый баланс аккордеон получит сам: Outbox сбросит кэш, и SSE-поток
+        # дашборда пришлет свежий фрагмент — метки для отложенного опроса не нужны
+        return f"{reverse('dashboard')}?tab=sales"
 
     # 2. ТА САМАЯ МАГИЯ «ЛИПКОЙ» ФОРМЫ
+    # Последний перевод берем из PartnerRate через кэш — таблицу продаж не трогаем
     def get_initial(self):
         initial = super().get_initial()
 
-        last_transfer = (
-            Sale.objects.filter(
-                salesman=self.request.user, payment_type=Sale.PaymentChoices.TRANSFER
-            )
-            .order_by("-created_at")
-            .first()
-        )
-
-        if last_transfer:
-            initial["partner_name"] = last_transfer.partner_name
-            initial["client_rate"] = last_transfer.client_rate
-            initial["partner_rate"] = last_transfer.partner_rate
+        recent = self.get_recent_partners()
+        if recent:
+            last_transfer = recent[0]
+            initial["partner_name"] = last_transfer["partner_name"]
+            initial["client_rate"] = last_transfer["client_rate"]
+            initial["partner_rate"] = last_transfer["partner_rate"]
             initial["payment_type"] = Sale.PaymentChoices.TRANSFER
 
         return initial
 
+    def get_recent_partners(self):
+        if not hasattr(self, "_recent_partners"):
+            self._recent_partners = get_transfer_defaults(self.request.user.id)
+        return self._recent_partners
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields["partner_name"].widget.attrs["list"] = "recent-partners"
+        return form
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Подсказки: выбрал обменника — курсы подставились из его последней продажи
+        context["recent_partners"] = [
+            partner for partner in self.get_recent_partners() if partner["partner_name"]
+        ]
+        return context
+
     def form_valid(self, form: BaseModelForm) -> HttpResponse:
         form.instance.salesman = self.request.user
 
@@ -207,6 +287,7 @@ class SaleCreateView(LoginRequiredMixin, CreateView):
                 }
 
                 event = OutboxEvent.objects.create(payload=payload)
+                remember_transfer(sale)
 
                 transaction.on_commit(
                     lambda: send_single_outbox_event.delay(event.id)
@@ -215,13 +296,21 @@ class SaleCreateView(LoginRequiredMixin, CreateView):
         return response
 
 
-class SaleDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class SaleDetailView(OwnerScopedMixin, DetailView):
     model = Sale
     template_name = "finance/sale_detail.html"
+    owner_field = "salesman"
 
-    def test_func(self):
-        obj = self.get_object()
-        return obj.salesman == self.request.user
+    def get_queryset(self):
+        # Продавец — JOIN'ом, комментарии с авторами — одним запросом на всю ветку
+        return (
+            super()
+            .get_queryset()
+            .select_related("salesman")
+            .prefetch_related(
+                Prefetch("comments", queryset=Comment.objects.select_related("author"))
+            )
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -253,14 +342,11 @@ class PresentationCommentCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class SaleUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class SaleUpdateView(OwnerScopedMixin, UpdateView):
     model = Sale
     template_name = "finance/sale_update.html"
     fields = ["sale_amount", "payment_type"]
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.salesman == self.request.user
+    owner_field = "salesman"
 
     def get_success_url(self):
         next_page = self.request.GET.get("next")
@@ -271,13 +357,10 @@ class SaleUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return reverse("sale_detail", kwargs={"pk": self.object.pk})
 
 
-class SaleDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class SaleDeleteView(OwnerScopedMixin, DeleteView):
     model = Sale
     template_name = "finance/sale_delete.html"
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.salesman == self.request.user
+    owner_field = "salesman"
 
     # Актуализировано: возвращаем сразу на дашборд
     def get_success_url(self):
@@ -304,14 +387,24 @@ class PresentationCreateView(LoginRequiredMixin, CreateView):
         return f"{reverse('dashboard')}?tab=presentations"
 
 
-class PresentationDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class PresentationDetailView(OwnerScopedMixin, DetailView):
     model = Presentation
     template_name = "finance/presentation_detail.html"
+    # Ищем только среди презентаций, которые создал именно этот юзер
+    owner_field = "presenter"
 
-    def test_func(self):
-        # Проверяем, что эту презентацию создал именно этот юзер
-        obj = self.get_object()
-        return obj.presenter == self.request.user
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .select_related("presenter")
+            .prefetch_related(
+                Prefetch(
+                    "presentation_comments",
+                    queryset=PresentationComment.objects.select_related("author"),
+                )
+            )
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -319,14 +412,11 @@ class PresentationDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView
         return context
 
 
-class PresentationUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class PresentationUpdateView(OwnerScopedMixin, UpdateView):
     model = Presentation
     template_name = "finance/presentation_update.html"
     fields = ["group_sales_total", "group_identifier"]
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.presenter == self.request.user
+    owner_field = "presenter"
 
     # Актуализировано: исправлена f-строка, параметры ведут на дашборд
     def get_success_url(self):
@@ -337,13 +427,10 @@ class PresentationUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView
         return reverse("presentation_detail", kwargs={"pk": self.object.pk})
 
 
-class PresentationDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class PresentationDeleteView(OwnerScopedMixin, DeleteView):
     model = Presentation
     template_name = "finance/presentation_delete.html"
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.presenter == self.request.user
+    owner_field = "presenter"
 
     # Актуализировано: исправлена f-строка, удаление возвращает на вкладку презентаций дашборда
     def get_success_url(self):
@@ -361,26 +448,18 @@ def reconcile_partner(request):
         return redirect('/dashboard/?tab=sales')
 
     try:
-        amount_float = float(amount)
-    except ValueError:
+        amount_decimal = Decimal(amount)
+    except InvalidOperation:
         messages.error(request, "Сумма должна быть числом.")
         return redirect('/dashboard/?tab=sales')
 
-    payload = {
-        "agent_id": request.user.id,
-        "partner_name": partner_name,
-        "amount_received": amount_float
-    }
-
     try:
-        fastapi_url = f"{settings.FASTAPI_BASE_URL}/api/transfer/reconcile/"
-        response = requests.post(fastapi_url, json=payload, timeout=5)
-        
-        if response.status_code == 200:
-            messages.success(request, f"Сверка по {partner_name} успешно проведена.")
-        else:
-            messages.error(request, f"Ошибка API: {response.text}")
-    except requests.RequestException as e:
+        get_client().reconcile(request.user.id, partner_name, amount_decimal)
+        evict_balance(request.user.id)
+        messages.success(request, f"Сверка по {partner_name} успешно проведена.")
+    except TransferAPIError as e:
+        messages.error(request, f"Ошибка API: {e.text}")
+    except TransferServiceError as e:
         messages.error(request, f"Ошибка связи с сервером FastAPI: {e}")
 
     return redirect('/dashboard/?tab=sales')
@@ -392,14 +471,12 @@ def reconcile_partner(request):
 def clear_cash_view(request):
     agent_id = request.user.id
     try:
-        fastapi_url = f"{settings.FASTAPI_BASE_URL}/api/transfer/clear_cash/{agent_id}"
-        response = requests.post(fastapi_url, timeout=5)
-        
-        if response.status_code == 200:
-            messages.success(request, "Касса успешно инкассирована. Долг обнулен.")
-        else:
-            messages.error(request, f"Ошибка обнуления: {response.text}")
-    except requests.RequestException as e:
+        get_client().clear_cash(agent_id)
+        evict_balance(agent_id)
+        messages.success(request, "Касса успешно инкассирована. Долг обнулен.")
+    except TransferAPIError as e:
+        messages.error(request, f"Ошибка обнуления: {e.text}")
+    except TransferServiceError as e:
         messages.error(request, f"Ошибка связи с сервером: {e}")
 
     return redirect('/dashboard/?tab=sales')
@@ -407,16 +484,14 @@ def clear_cash_view(request):
 # Новая вьюха специально для HTMX-запроса
 @login_required
 def transfer_accordion_view(request):
-    agent_id = request.user.id
-    fastapi_url = f"{settings.FASTAPI_BASE_URL}/api/transfer/balance/{agent_id}"
-    
-    try:
-        response = requests.get(fastapi_url, timeout=2)
-        transfer_data = response.json() if response.status_code == 200 else None
-        if 'cash_debt' in transfer_data:
-                transfer_data['cash_debt'] = float(transfer_data['cash_debt'])
-    except requests.RequestException:
-        transfer_data = None
+    # Баланс из общего кэша: опрос каждую секунду не долбит FastAPI напрямую
+    transfer_data = get_transfer_data(request.user.id)
+
+    # Баланс тот же, что у клиента, — 304 без рендера шаблона
+    etag = accordion_etag(request, transfer_data)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
 
     response = render(request, "finance/includes/transfer_accordion.html", {
         "transfer_data": transfer_data
@@ -425,4 +500,58 @@ def transfer_accordion_view(request):
     if transfer_data is not None:
         response.status_code = 286
 
-    return response
\ No newline at end of file
+    return set_validator(response, etag)
+
+
+@login_required
+async def transfer_stream_view(request):
+    """SSE вместо ежесекундного опроса аккордеона. Держится только под ASGI (ultima_asgi)."""
+    user = await request.auser()
+    request.user = user
+
+    return StreamingHttpResponse(
+        accordion_events(request, user.id),
+        content_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить события в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _monitoring_denied(request):
+    """Доступ к служебным эндпоинтам — только по METRICS_TOKEN (Bearer); без токена — 404."""
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return None
+
+
+def metrics_view(request):
+    """Метрики Outbox для Prometheus."""
+    denied = _monitoring_denied(request)
+    if denied is not None:
+        return denied
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def transfer_status_view(request):
+    """Состояние предохранителя FastAPI для мониторинга: 503, пока он открыт."""
+    denied = _monitoring_denied(request)
+    if denied is not None:
+        return denied
+    status = get_client().breaker.status()
+    return JsonResponse(status, status=503 if status["state"] == "open" else 200)
+
+
+@staff_member_required
+def payroll_csv_view(request, pk):
+    """CSV зарплат — только персоналу. /media/ nginx не раздает: там зарплаты всех сотрудников."""
+    run = get_object_or_404(PayrollRun, pk=pk)
+    if not run.csv_file:
+        raise Http404("CSV для этого расчета нет")
+    try:
+        fh = run.csv_file.open("rb")
+    except FileNotFoundError:
+        raise Http404("Файл CSV не найден в хранилище")
+    return FileResponse(fh, as_attachment=True, filename=f"payroll-{run.month:%Y-%m}.csv")